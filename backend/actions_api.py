@@ -4,20 +4,13 @@ actions_api.py - 用户行为相关API（打卡、收藏）
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Optional, List
-import psycopg2
-from psycopg2.extras import RealDictCursor
 from datetime import datetime
 
-router = APIRouter(prefix="/api/actions", tags=["actions"])
+# 异步数据访问层（asyncpg），避免在 async 接口中阻塞事件循环
+import async_db
+from db import PoolTimeoutError
 
-# 数据库配置
-DB_CONFIG = {
-    "host": "localhost",
-    "port": 5432,
-    "dbname": "shudao",
-    "user": "postgres",
-    "password": "123456"
-}
+router = APIRouter(prefix="/api/actions", tags=["actions"])
 
 # ==================== 数据模型 ====================
 
@@ -47,55 +40,34 @@ class FavoriteResponse(BaseModel):
     scenic_name: Optional[str] = None
     create_time: str
 
-# ==================== 辅助函数 ====================
-
-def get_user_id_by_username(username: str) -> Optional[int]:
-    """根据用户名获取用户ID"""
-    try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("SELECT id FROM users.users WHERE username = %s", (username,))
-        result = cursor.fetchone()
-        cursor.close()
-        conn.close()
-        return result['id'] if result else None
-    except Exception as e:
-        print(f"获取用户ID失败: {e}")
-        return None
-
 # ==================== 打卡相关API ====================
 
 @router.post("/checkins", response_model=CheckinResponse)
 async def create_checkin(checkin: CheckinCreate):
     """创建打卡记录"""
     try:
-        # 获取user_id
-        user_id = get_user_id_by_username(checkin.username)
-        if not user_id:
-            raise HTTPException(status_code=404, detail="用户不存在")
-
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-
-        # 插入打卡记录
-        cursor.execute(
-            """
-            INSERT INTO actions.checkins (user_id, scenic_id, note, image_url, checkin_time)
-            VALUES (%s, %s, %s, %s, NOW())
-            RETURNING id, user_id, scenic_id, note, image_url, checkin_time
-            """,
-            (user_id, checkin.scenic_id, checkin.note, checkin.image_url)
-        )
-        result = cursor.fetchone()
-
-        # 获取景点名称
-        cursor.execute("SELECT name FROM scenic.scenic WHERE id = %s", (checkin.scenic_id,))
-        scenic = cursor.fetchone()
-        scenic_name = scenic['name'] if scenic else None
-
-        conn.commit()
-        cursor.close()
-        conn.close()
+        async with async_db.transaction() as conn:
+            # 获取user_id
+            user_id = await async_db.get_user_id_by_username(checkin.username, conn=conn)
+            if not user_id:
+                raise HTTPException(status_code=404, detail="用户不存在")
+
+            # 插入打卡记录
+            result = await async_db.fetch_one(
+                """
+                INSERT INTO actions.checkins (user_id, scenic_id, note, image_url, checkin_time)
+                VALUES ($1, $2, $3, $4, NOW())
+                RETURNING id, user_id, scenic_id, note, image_url, checkin_time
+                """,
+                user_id, checkin.scenic_id, checkin.note, checkin.image_url,
+                conn=conn
+            )
+
+            # 获取景点名称
+            scenic = await async_db.fetch_one(
+                "SELECT name FROM scenic.scenic WHERE id = $1", checkin.scenic_id, conn=conn
+            )
+            scenic_name = scenic['name'] if scenic else None
 
         return {
             "id": result['id'],
@@ -106,6 +78,8 @@ async def create_checkin(checkin: CheckinCreate):
             "image_url": result['image_url'],
             "checkin_time": result['checkin_time'].isoformat()
         }
+    except PoolTimeoutError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"创建打卡失败: {str(e)}")
 
@@ -113,29 +87,25 @@ async def create_checkin(checkin: CheckinCreate):
 async def get_checkins(username: str):
     """获取用户的打卡记录"""
     try:
-        # 获取user_id
-        user_id = get_user_id_by_username(username)
-        if not user_id:
-            return []
-
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-
-        cursor.execute(
-            """
-            SELECT
-                c.id, c.user_id, c.scenic_id, c.note, c.image_url, c.checkin_time,
-                s.name as scenic_name
-            FROM actions.checkins c
-            LEFT JOIN scenic.scenic s ON c.scenic_id = s.id
-            WHERE c.user_id = %s
-            ORDER BY c.checkin_time DESC
-            """,
-            (user_id,)
-        )
-        results = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        async with async_db.acquire() as conn:
+            # 获取user_id
+            user_id = await async_db.get_user_id_by_username(username, conn=conn)
+            if not user_id:
+                return []
+
+            results = await async_db.fetch_all(
+                """
+                SELECT
+                    c.id, c.user_id, c.scenic_id, c.note, c.image_url, c.checkin_time,
+                    s.name as scenic_name
+                FROM actions.checkins c
+                LEFT JOIN scenic.scenic s ON c.scenic_id = s.id
+                WHERE c.user_id = $1
+                ORDER BY c.checkin_time DESC
+                """,
+                user_id,
+                conn=conn
+            )
 
         return [
             {
@@ -149,6 +119,8 @@ async def get_checkins(username: str):
             }
             for r in results
         ]
+    except PoolTimeoutError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取打卡记录失败: {str(e)}")
 
@@ -158,44 +130,37 @@ async def get_checkins(username: str):
 async def create_favorite(favorite: FavoriteCreate):
     """添加收藏"""
     try:
-        # 获取user_id
-        user_id = get_user_id_by_username(favorite.username)
-        if not user_id:
-            raise HTTPException(status_code=404, detail="用户不存在")
-
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-
-        # 检查是否已收藏
-        cursor.execute(
-            "SELECT id FROM actions.favorites WHERE user_id = %s AND scenic_id = %s",
-            (user_id, favorite.scenic_id)
-        )
-        existing = cursor.fetchone()
-        if existing:
-            cursor.close()
-            conn.close()
-            raise HTTPException(status_code=400, detail="已经收藏过该景点")
-
-        # 插入收藏记录
-        cursor.execute(
-            """
-            INSERT INTO actions.favorites (user_id, scenic_id, create_time)
-            VALUES (%s, %s, NOW())
-            RETURNING id, user_id, scenic_id, create_time
-            """,
-            (user_id, favorite.scenic_id)
-        )
-        result = cursor.fetchone()
-
-        # 获取景点名称
-        cursor.execute("SELECT name FROM scenic.scenic WHERE id = %s", (favorite.scenic_id,))
-        scenic = cursor.fetchone()
-        scenic_name = scenic['name'] if scenic else None
-
-        conn.commit()
-        cursor.close()
-        conn.close()
+        async with async_db.transaction() as conn:
+            # 获取user_id
+            user_id = await async_db.get_user_id_by_username(favorite.username, conn=conn)
+            if not user_id:
+                raise HTTPException(status_code=404, detail="用户不存在")
+
+            # 检查是否已收藏
+            existing = await async_db.fetch_one(
+                "SELECT id FROM actions.favorites WHERE user_id = $1 AND scenic_id = $2",
+                user_id, favorite.scenic_id,
+                conn=conn
+            )
+            if existing:
+                raise HTTPException(status_code=400, detail="已经收藏过该景点")
+
+            # 插入收藏记录
+            result = await async_db.fetch_one(
+                """
+                INSERT INTO actions.favorites (user_id, scenic_id, create_time)
+                VALUES ($1, $2, NOW())
+                RETURNING id, user_id, scenic_id, create_time
+                """,
+                user_id, favorite.scenic_id,
+                conn=conn
+            )
+
+            # 获取景点名称
+            scenic = await async_db.fetch_one(
+                "SELECT name FROM scenic.scenic WHERE id = $1", favorite.scenic_id, conn=conn
+            )
+            scenic_name = scenic['name'] if scenic else None
 
         return {
             "id": result['id'],
@@ -204,7 +169,7 @@ async def create_favorite(favorite: FavoriteCreate):
             "scenic_name": scenic_name,
             "create_time": result['create_time'].isoformat()
         }
-    except HTTPException:
+    except (HTTPException, PoolTimeoutError):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"添加收藏失败: {str(e)}")
@@ -213,29 +178,23 @@ async def create_favorite(favorite: FavoriteCreate):
 async def delete_favorite(scenic_id: int, username: str):
     """取消收藏"""
     try:
-        # 获取user_id
-        user_id = get_user_id_by_username(username)
-        if not user_id:
-            raise HTTPException(status_code=404, detail="用户不存在")
-
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-
-        cursor.execute(
-            "DELETE FROM actions.favorites WHERE user_id = %s AND scenic_id = %s",
-            (user_id, scenic_id)
-        )
-        deleted_count = cursor.rowcount
-
-        conn.commit()
-        cursor.close()
-        conn.close()
+        async with async_db.transaction() as conn:
+            # 获取user_id
+            user_id = await async_db.get_user_id_by_username(username, conn=conn)
+            if not user_id:
+                raise HTTPException(status_code=404, detail="用户不存在")
+
+            deleted_count = await async_db.execute(
+                "DELETE FROM actions.favorites WHERE user_id = $1 AND scenic_id = $2",
+                user_id, scenic_id,
+                conn=conn
+            )
 
         if deleted_count == 0:
             raise HTTPException(status_code=404, detail="未找到该收藏记录")
 
         return {"message": "取消收藏成功"}
-    except HTTPException:
+    except (HTTPException, PoolTimeoutError):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"取消收藏失败: {str(e)}")
@@ -244,29 +203,25 @@ async def delete_favorite(scenic_id: int, username: str):
 async def get_favorites(username: str):
     """获取用户的收藏列表"""
     try:
-        # 获取user_id
-        user_id = get_user_id_by_username(username)
-        if not user_id:
-            return []
-
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-
-        cursor.execute(
-            """
-            SELECT
-                f.id, f.user_id, f.scenic_id, f.create_time,
-                s.name as scenic_name
-            FROM actions.favorites f
-            LEFT JOIN scenic.scenic s ON f.scenic_id = s.id
-            WHERE f.user_id = %s
-            ORDER BY f.create_time DESC
-            """,
-            (user_id,)
-        )
-        results = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        async with async_db.acquire() as conn:
+            # 获取user_id
+            user_id = await async_db.get_user_id_by_username(username, conn=conn)
+            if not user_id:
+                return []
+
+            results = await async_db.fetch_all(
+                """
+                SELECT
+                    f.id, f.user_id, f.scenic_id, f.create_time,
+                    s.name as scenic_name
+                FROM actions.favorites f
+                LEFT JOIN scenic.scenic s ON f.scenic_id = s.id
+                WHERE f.user_id = $1
+                ORDER BY f.create_time DESC
+                """,
+                user_id,
+                conn=conn
+            )
 
         return [
             {
@@ -278,6 +233,8 @@ async def get_favorites(username: str):
             }
             for r in results
         ]
+    except PoolTimeoutError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取收藏列表失败: {str(e)}")
 
@@ -285,21 +242,19 @@ async def get_favorites(username: str):
 async def check_favorite(scenic_id: int, username: str):
     """检查是否已收藏某个景点"""
     try:
-        user_id = get_user_id_by_username(username)
-        if not user_id:
-            return {"is_favorited": False}
-
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        async with async_db.acquire() as conn:
+            user_id = await async_db.get_user_id_by_username(username, conn=conn)
+            if not user_id:
+                return {"is_favorited": False}
 
-        cursor.execute(
-            "SELECT id FROM actions.favorites WHERE user_id = %s AND scenic_id = %s",
-            (user_id, scenic_id)
-        )
-        result = cursor.fetchone()
-        cursor.close()
-        conn.close()
+            result = await async_db.fetch_one(
+                "SELECT id FROM actions.favorites WHERE user_id = $1 AND scenic_id = $2",
+                user_id, scenic_id,
+                conn=conn
+            )
 
         return {"is_favorited": result is not None}
+    except PoolTimeoutError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"检查收藏状态失败: {str(e)}")
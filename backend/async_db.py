@@ -0,0 +1,135 @@
+"""
+async_db.py - 异步数据库访问层（asyncpg 连接池）
+供 async def 接口使用（actions_api 的全部接口、登录、路线摘要等不做大量计算的只读接口），
+避免阻塞 uvicorn 事件循环；需要解析点位等 CPU 计算的同步接口仍使用 db.py 的连接池
+注意：asyncpg 的 SQL 参数占位符为 $1, $2 ...，不是 psycopg2 的 %s
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+import asyncpg
+
+from db import DB_CONFIG, POOL_MIN_SIZE, POOL_MAX_SIZE, POOL_TIMEOUT, PoolTimeoutError
+
+_pool: Optional[asyncpg.Pool] = None
+_stats = {
+    "acquired": 0,
+    "timeouts": 0,
+    "wait_total": 0.0,
+    "wait_max": 0.0,
+}
+
+
+async def init_async_pool() -> asyncpg.Pool:
+    """创建异步连接池（应用启动时调用）"""
+    global _pool
+    if _pool is None:
+        _pool = await asyncpg.create_pool(
+            host=DB_CONFIG["host"],
+            port=DB_CONFIG["port"],
+            database=DB_CONFIG["dbname"],
+            user=DB_CONFIG["user"],
+            password=DB_CONFIG["password"],
+            min_size=POOL_MIN_SIZE,
+            max_size=POOL_MAX_SIZE,
+        )
+        print(f"异步数据库连接池已创建: min={POOL_MIN_SIZE}, max={POOL_MAX_SIZE}")
+    return _pool
+
+
+async def close_async_pool():
+    """关闭异步连接池（应用关闭时调用）"""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+        print("异步数据库连接池已关闭")
+
+
+@asynccontextmanager
+async def acquire():
+    """从异步连接池获取连接，超时抛出 PoolTimeoutError（与同步连接池一致）"""
+    pool = _pool or await init_async_pool()
+    start = time.perf_counter()
+    try:
+        conn = await pool.acquire(timeout=POOL_TIMEOUT)
+    except asyncio.TimeoutError:
+        _stats["timeouts"] += 1
+        raise PoolTimeoutError(f"获取数据库连接超时（{POOL_TIMEOUT}s）") from None
+
+    waited = time.perf_counter() - start
+    _stats["acquired"] += 1
+    _stats["wait_total"] += waited
+    _stats["wait_max"] = max(_stats["wait_max"], waited)
+    try:
+        yield conn
+    finally:
+        await pool.release(conn)
+
+
+@asynccontextmanager
+async def transaction():
+    """获取连接并开启事务，正常退出时提交，出现异常时回滚"""
+    async with acquire() as conn:
+        async with conn.transaction():
+            yield conn
+
+
+async def fetch_all(query: str, *args, conn=None) -> List[Dict[str, Any]]:
+    """执行查询并返回全部行（字典列表）"""
+    if conn is not None:
+        return [dict(r) for r in await conn.fetch(query, *args)]
+    async with acquire() as conn:
+        return [dict(r) for r in await conn.fetch(query, *args)]
+
+
+async def fetch_one(query: str, *args, conn=None) -> Optional[Dict[str, Any]]:
+    """执行查询并返回第一行，没有结果时返回 None"""
+    if conn is not None:
+        row = await conn.fetchrow(query, *args)
+    else:
+        async with acquire() as conn:
+            row = await conn.fetchrow(query, *args)
+    return dict(row) if row is not None else None
+
+
+async def execute(query: str, *args, conn=None) -> int:
+    """执行写操作并返回受影响的行数"""
+    if conn is not None:
+        status = await conn.execute(query, *args)
+    else:
+        async with acquire() as conn:
+            status = await conn.execute(query, *args)
+    # asyncpg 返回命令状态字符串，如 "DELETE 1"、"INSERT 0 1"
+    try:
+        return int(status.split()[-1])
+    except (ValueError, IndexError):
+        return 0
+
+
+async def get_user_id_by_username(username: str, conn=None) -> Optional[int]:
+    """根据用户名获取用户ID"""
+    row = await fetch_one("SELECT id FROM users.users WHERE username = $1", username, conn=conn)
+    return row['id'] if row else None
+
+
+def get_async_pool_stats() -> dict:
+    """异步连接池使用情况"""
+    if _pool is None:
+        return {"initialized": False}
+    acquired = _stats["acquired"]
+    return {
+        "initialized": True,
+        "min_size": _pool.get_min_size(),
+        "max_size": _pool.get_max_size(),
+        "timeout": POOL_TIMEOUT,
+        "size": _pool.get_size(),
+        "idle": _pool.get_idle_size(),
+        "in_use": _pool.get_size() - _pool.get_idle_size(),
+        "acquired": acquired,
+        "timeouts": _stats["timeouts"],
+        "wait_avg_ms": round(_stats["wait_total"] / acquired * 1000, 3) if acquired else 0,
+        "wait_max_ms": round(_stats["wait_max"] * 1000, 3),
+    }
@@ -0,0 +1,165 @@
+"""
+autocomplete.py - 搜索框输入提示（前缀补全）
+由内存快照构建排序后的前缀数组，支持汉字、全拼和拼音首字母前缀，
+输入过程中的请求只做二分查找，不访问数据库；任一数据集刷新后重建
+"""
+import bisect
+import re
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from datasets import snapshots
+
+try:
+    from pypinyin import Style, lazy_pinyin
+except ImportError:  # 未安装 pypinyin 时只支持汉字前缀
+    lazy_pinyin = None
+
+# 提示类别 -> 来源 (数据集, 字段)
+SUGGEST_SOURCES = {
+    "poem": [("poems", "name")],
+    "author": [("poems", "author")],
+    "heritage": [("heritage", "name")],
+    "scenic": [("scenic", "name")],
+    "city": [("poems", "city"), ("history", "city")],
+    "county": [("poems", "county"), ("history", "county")],
+}
+
+# 类别对应的记录 id 来自哪个数据集（地名类提示不返回 id）
+ID_SOURCES = {"poem": "poems", "heritage": "heritage", "scenic": "scenic"}
+
+# 匹配方式，数值越小排序越靠前
+MATCH_TEXT = 0
+MATCH_PINYIN = 1
+MATCH_INITIALS = 2
+_MATCH_NAMES = {MATCH_TEXT: "text", MATCH_PINYIN: "pinyin", MATCH_INITIALS: "initials"}
+
+# 每个提示最多返回的记录 id 数量
+MAX_SUGGEST_IDS = 5
+
+_NON_ALNUM = re.compile(r"[\W_]+")
+
+
+def normalize_key(value: str) -> str:
+    """NFKC 规范化、转小写并去掉空白"""
+    return "".join(unicodedata.normalize("NFKC", value).lower().split())
+
+
+def pinyin_keys(value: str) -> Tuple[str, str]:
+    """(全拼, 拼音首字母)；未安装 pypinyin 时返回空字符串"""
+    if lazy_pinyin is None:
+        return "", ""
+    full = _NON_ALNUM.sub("", "".join(lazy_pinyin(value)).lower())
+    initials = _NON_ALNUM.sub("", "".join(lazy_pinyin(value, style=Style.FIRST_LETTER)).lower())
+    return full, initials
+
+
+class Suggestion:
+    __slots__ = ("text", "category", "count", "ids")
+
+    def __init__(self, text: str, category: str):
+        self.text = text
+        self.category = category
+        self.count = 0
+        self.ids: List[int] = []
+
+
+class AutocompleteIndex:
+    """排序后的 (前缀键, 匹配方式, 提示下标) 数组"""
+
+    def __init__(self, rows_by_dataset: Dict[str, List[dict]]):
+        entries: Dict[Tuple[str, str], Suggestion] = {}
+        for category, sources in SUGGEST_SOURCES.items():
+            for name, field in sources:
+                id_source = ID_SOURCES.get(category) == name
+                for row in rows_by_dataset[name]:
+                    value = row.get(field)
+                    if value is None or value == "":
+                        continue
+                    text = str(value).strip()
+                    suggestion = entries.get((category, text))
+                    if suggestion is None:
+                        suggestion = entries[(category, text)] = Suggestion(text, category)
+                    suggestion.count += 1
+                    if id_source and len(suggestion.ids) < MAX_SUGGEST_IDS:
+                        suggestion.ids.append(row['id'])
+
+        self.suggestions = list(entries.values())
+        keys = []
+        for i, suggestion in enumerate(self.suggestions):
+            text_key = normalize_key(suggestion.text)
+            keys.append((text_key, MATCH_TEXT, i))
+            full, initials = pinyin_keys(suggestion.text)
+            # 纯字母、数字的名称拼音与原文相同，不再重复加入
+            if full and full != text_key:
+                keys.append((full, MATCH_PINYIN, i))
+            if initials and initials != text_key and initials != full:
+                keys.append((initials, MATCH_INITIALS, i))
+        keys.sort()
+        self.keys = [k for k, _, _ in keys]
+        self.matches = [(m, i) for _, m, i in keys]
+
+    def complete(self, prefix: str, limit: int, categories: Optional[Sequence[str]] = None) -> List[dict]:
+        """
+        前缀补全，排序依次为：完全匹配、匹配方式（汉字 > 全拼 > 首字母）、出现次数、长度
+        """
+        prefix = normalize_key(prefix)
+        if not prefix:
+            return []
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + "\U0010ffff")
+
+        best: Dict[int, Tuple[int, int]] = {}
+        for pos in range(start, end):
+            match, i = self.matches[pos]
+            if categories and self.suggestions[i].category not in categories:
+                continue
+            rank = (0 if self.keys[pos] == prefix else 1, match)
+            if i not in best or rank < best[i]:
+                best[i] = rank
+
+        ordered = sorted(
+            best.items(),
+            key=lambda item: (item[1], -self.suggestions[item[0]].count,
+                              len(self.suggestions[item[0]].text), self.suggestions[item[0]].text)
+        )
+        result = []
+        for i, (_, match) in ordered[:limit]:
+            suggestion = self.suggestions[i]
+            item = {
+                "text": suggestion.text,
+                "category": suggestion.category,
+                "count": suggestion.count,
+                "match": _MATCH_NAMES[match],
+            }
+            if suggestion.category in ID_SOURCES:
+                item["ids"] = suggestion.ids
+            result.append(item)
+        return result
+
+
+class AutocompleteCache:
+    """按相关数据集快照的版本缓存前缀数组，任一数据集刷新后重建"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entry: Optional[Tuple[Tuple[str, ...], AutocompleteIndex]] = None
+
+    def get(self) -> AutocompleteIndex:
+        names = sorted({name for sources in SUGGEST_SOURCES.values() for name, _ in sources})
+        current = {name: snapshots.get(name) for name in names}
+        key = tuple(snapshot.etag for snapshot in current.values())
+        entry = self._entry
+        if entry is not None and entry[0] == key:
+            return entry[1]
+
+        with self._lock:
+            entry = self._entry
+            if entry is None or entry[0] != key:
+                entry = (key, AutocompleteIndex({name: s.rows for name, s in current.items()}))
+                self._entry = entry
+            return entry[1]
+
+
+autocomplete_index = AutocompleteCache()
@@ -0,0 +1,92 @@
+"""
+bench_route_geometry.py - 路线几何计算性能对比
+对比原来逐点计算 haversine 的 Python 循环与 geo.py 中的 NumPy 批量计算，
+分别测试单条长路线和大量短路线两种情况，并检查两者结果一致
+
+用法：python bench_route_geometry.py [--routes 2000] [--points 50] [--long 100000]
+"""
+import argparse
+import math
+import random
+import time
+
+from geo import batch_route_metrics, route_geometry
+
+
+def legacy_distance(point1: dict, point2: dict) -> float:
+    """原 routes_api.calculate_distance 的实现"""
+    R = 6371
+    lat1 = math.radians(point1['latitude'])
+    lat2 = math.radians(point2['latitude'])
+    delta_lat = math.radians(point2['latitude'] - point1['latitude'])
+    delta_lon = math.radians(point2['longitude'] - point1['longitude'])
+    a = math.sin(delta_lat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(delta_lon / 2) ** 2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return R * c
+
+
+def legacy_total_distance(points: list) -> float:
+    """原 routes_api.calculate_total_distance 的实现"""
+    if len(points) < 2:
+        return 0
+    total = 0
+    for i in range(len(points) - 1):
+        total += legacy_distance(points[i], points[i + 1])
+    return round(total, 1)
+
+
+def random_route(n: int) -> list:
+    """在四川范围内随机游走生成一条路线"""
+    lon, lat = random.uniform(102, 106), random.uniform(28, 32)
+    points = []
+    for _ in range(n):
+        lon += random.uniform(-0.02, 0.02)
+        lat += random.uniform(-0.02, 0.02)
+        points.append({"longitude": lon, "latitude": lat})
+    return points
+
+
+def timed(func, *args, repeat: int = 5) -> float:
+    """多次运行取最短耗时（毫秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="路线几何计算性能对比")
+    parser.add_argument("--routes", type=int, default=2000, help="短路线数量")
+    parser.add_argument("--points", type=int, default=50, help="每条短路线的点数")
+    parser.add_argument("--long", type=int, default=100000, help="长路线的点数")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    long_route = random_route(args.long)
+    legacy_ms = timed(legacy_total_distance, long_route)
+    numpy_ms = timed(lambda r: batch_route_metrics([r]), long_route)
+    full_ms = timed(route_geometry, long_route, 0.05)
+    diff = abs(legacy_total_distance(long_route) - batch_route_metrics([long_route])[0]['distance'])
+    print(f"单条路线 {args.long} 个点:")
+    print(f"  Python 循环      {legacy_ms:9.2f} ms")
+    print(f"  NumPy 批量       {numpy_ms:9.2f} ms  ({legacy_ms / numpy_ms:.1f}x)")
+    print(f"  完整几何 + 简化  {full_ms:9.2f} ms")
+    print(f"  总距离差值       {diff:.3f} km")
+
+    routes = [random_route(random.randint(2, args.points * 2)) for _ in range(args.routes)]
+    legacy_ms = timed(lambda rs: [legacy_total_distance(r) for r in rs], routes)
+    numpy_ms = timed(batch_route_metrics, routes)
+    legacy = [legacy_total_distance(r) for r in routes]
+    batched = [m['distance'] for m in batch_route_metrics(routes)]
+    max_diff = max(abs(a - b) for a, b in zip(legacy, batched))
+    print(f"{args.routes} 条路线（平均 {args.points} 个点）:")
+    print(f"  Python 循环      {legacy_ms:9.2f} ms")
+    print(f"  NumPy 批量       {numpy_ms:9.2f} ms  ({legacy_ms / numpy_ms:.1f}x)")
+    print(f"  最大距离差值     {max_diff:.3f} km（结果保留一位小数）")
+
+
+if __name__ == "__main__":
+    main()
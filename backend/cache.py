@@ -0,0 +1,244 @@
+"""
+cache.py - 进程内数据快照缓存
+诗词、非遗、历史、景点等基础数据很少变化，每个数据集在内存中保存一份带版本号的快照，
+并预先序列化为 JSON 字节串，命中缓存时既不访问数据库也不重新编码
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+# 浏览器缓存时间（秒），过期后浏览器带 If-None-Match 重新验证
+HTTP_MAX_AGE = int(os.getenv("HTTP_MAX_AGE", "300"))
+
+
+def dump_json(payload: Any) -> bytes:
+    """按 FastAPI JSONResponse 相同的参数序列化为 JSON 字节串"""
+    return json.dumps(
+        jsonable_encoder(payload),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+class Snapshot:
+    """
+    某个数据集在某一时刻的只读快照
+    data 为列表时响应中带 count 字段，与原列表接口的格式一致
+    """
+
+    def __init__(self, name: str, version: int, data: Union[List[Dict[str, Any]], Dict[str, Any]]):
+        self.name = name
+        self.version = version
+        self.data = data
+        self.created_at = time.time()
+        self._derived: Dict[str, Any] = {}
+        self._derived_lock = threading.Lock()
+        if isinstance(data, list):
+            payload = {"success": True, "count": len(data), "data": data}
+        else:
+            payload = {"success": True, "data": data}
+        self.body = dump_json(payload)
+        # 内容哈希作为 ETag，内容不变时重启服务或刷新快照后 ETag 也不变
+        self.etag = '"' + hashlib.sha1(self.body).hexdigest() + '"'
+
+    @property
+    def rows(self) -> List[Dict[str, Any]]:
+        return self.data
+
+    def age(self) -> float:
+        return time.time() - self.created_at
+
+    def derived(self, key: str, builder: Callable[["Snapshot"], Any]) -> Any:
+        """
+        获取基于本快照构建的派生结构（空间索引、逐行 JSON 等），首次访问时构建
+        派生结构随快照一起失效，数据变化后自动重建；定时刷新后内容不变时沿用旧快照的派生结构
+        """
+        value = self._derived.get(key)
+        if value is None:
+            with self._derived_lock:
+                value = self._derived.get(key)
+                if value is None:
+                    value = builder(self)
+                    self._derived[key] = value
+        return value
+
+    def row_bytes(self, fields: Optional[Tuple[str, ...]] = None) -> List[bytes]:
+        """
+        逐行预先序列化的 JSON，用于拼接过滤后的列表响应
+        fields 不为空时只保留这些字段（字段投影），每种投影只序列化一次
+        """
+        if fields is None:
+            return self.derived("row_bytes", lambda s: [dump_json(row) for row in s.rows])
+        return self.derived(
+            "row_bytes:" + ",".join(fields),
+            lambda s: [dump_json({f: row.get(f) for f in fields}) for row in s.rows]
+        )
+
+
+class SnapshotCache:
+    """
+    按数据集名称缓存快照
+    - ttl 秒后过期，过期后由一个线程重新加载，其余请求继续使用旧快照
+    - invalidate() 立即丢弃快照，下次访问时重新加载；
+      每次 invalidate 都会增加数据集的代数，加载期间代数变化时加载结果不写入缓存，
+      避免失效前开始的加载把旧数据重新放回缓存
+    """
+
+    def __init__(self, loader: Callable[[str], Any], ttl: float):
+        self.loader = loader
+        self.ttl = ttl
+        self._snapshots: Dict[str, Snapshot] = {}
+        self._versions: Dict[str, int] = {}
+        self._generations: Dict[str, int] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._hits: Dict[str, int] = {}
+        self._misses: Dict[str, int] = {}
+
+    def _name_lock(self, name: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(name, threading.Lock())
+
+    def _count(self, counter: Dict[str, int], name: str):
+        with self._lock:
+            counter[name] = counter.get(name, 0) + 1
+
+    def _rebuild(self, name: str) -> Snapshot:
+        with self._lock:
+            generation = self._generations.setdefault(name, 0)
+        data = self.loader(name)
+        with self._lock:
+            version = self._versions.get(name, 0) + 1
+            self._versions[name] = version
+        snapshot = Snapshot(name, version, data)
+        with self._lock:
+            previous = self._snapshots.get(name)
+            if previous is not None and previous.etag == snapshot.etag:
+                # 内容未变（ETag 相同）：沿用已构建的索引等派生结构，避免过期刷新后在请求线程上重建
+                snapshot._derived = dict(previous._derived)
+            # 加载期间被 invalidate：本次结果只用于当前请求，不写入缓存
+            if self._generations[name] == generation:
+                self._snapshots[name] = snapshot
+        return snapshot
+
+    def get(self, name: str) -> Snapshot:
+        """获取数据集快照，不存在或已过期时重新加载"""
+        snapshot = self._snapshots.get(name)
+        if snapshot is not None and snapshot.age() < self.ttl:
+            self._count(self._hits, name)
+            return snapshot
+
+        lock = self._name_lock(name)
+        if snapshot is not None:
+            # 已过期：只让一个线程去刷新，其余请求先返回旧快照
+            if not lock.acquire(blocking=False):
+                self._count(self._hits, name)
+                return snapshot
+        else:
+            lock.acquire()
+
+        try:
+            current = self._snapshots.get(name)
+            if current is not None and current is not snapshot and current.age() < self.ttl:
+                # 等待锁期间已被其他线程加载
+                self._count(self._hits, name)
+                return current
+            self._count(self._misses, name)
+            return self._rebuild(name)
+        finally:
+            lock.release()
+
+    def peek(self, name: str) -> Optional[Snapshot]:
+        """返回当前快照（可能为空或已过期），不触发加载"""
+        return self._snapshots.get(name)
+
+    def invalidate(self, name: Optional[str] = None):
+        """丢弃指定数据集（或全部数据集）的快照，正在进行的加载结果也会被丢弃"""
+        with self._lock:
+            names = list(self._generations) if name is None else [name]
+            for key in names:
+                self._generations[key] = self._generations.get(key, 0) + 1
+            if name is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(name, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            names = sorted(set(self._hits) | set(self._misses) | set(self._snapshots))
+            return {
+                "ttl": self.ttl,
+                "datasets": {
+                    name: {
+                        "hits": self._hits.get(name, 0),
+                        "misses": self._misses.get(name, 0),
+                        "version": self._snapshots[name].version if name in self._snapshots else None,
+                        "rows": len(self._snapshots[name].data) if name in self._snapshots else 0,
+                        "etag": self._snapshots[name].etag if name in self._snapshots else None,
+                        "bytes": len(self._snapshots[name].body) if name in self._snapshots else 0,
+                        "age": round(self._snapshots[name].age(), 1) if name in self._snapshots else None,
+                    }
+                    for name in names
+                }
+            }
+
+
+def list_body(items: List[bytes], extra: Optional[Dict[str, Any]] = None) -> bytes:
+    """
+    用逐行 JSON 拼接出与列表接口相同格式的响应体
+    extra 中的字段（如分页游标）追加在 data 之后
+    """
+    tail = b"".join(
+        b"," + dump_json(key) + b":" + dump_json(value)
+        for key, value in (extra or {}).items()
+    )
+    return (
+        b'{"success":true,"count":' + str(len(items)).encode() +
+        b',"data":[' + b",".join(items) + b"]" + tail + b"}"
+    )
+
+
+def derive_etag(etag: str, *parts: Any) -> str:
+    """由快照 ETag 和查询参数派生出过滤结果的 ETag"""
+    digest = hashlib.sha1(etag.encode())
+    for part in parts:
+        digest.update(b"\x00" + str(part).encode())
+    return '"' + digest.hexdigest() + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """判断请求头 If-None-Match 是否与 ETag 匹配（支持多个值、弱校验和 *）"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == etag:
+            return True
+    return False
+
+
+def cached_response(request: Request, body: bytes, etag: str, max_age: int = HTTP_MAX_AGE) -> Response:
+    """返回带 ETag / Cache-Control 的 JSON 响应，条件请求命中时返回 304"""
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={max_age}, must-revalidate",
+    }
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def snapshot_response(request: Request, snapshot: Snapshot, max_age: int = HTTP_MAX_AGE) -> Response:
+    """以快照内容返回响应"""
+    return cached_response(request, snapshot.body, snapshot.etag, max_age)
@@ -0,0 +1,193 @@
+"""
+clusters.py - 服务端点聚合（低缩放级别下的要素聚合）
+按缩放级别预先计算分层网格聚合：第 z 级的每个格子恰好由第 z+1 级的 4 个格子合并而来，
+所以只需对最细一级逐点统计，其余各级由下一级合并得到
+数据刷新时与上一版本比较，只更新变化的点所在的格子
+"""
+import math
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from spatial import BBox
+
+# 最细一级聚合对应的缩放级别，更高缩放级别直接使用该级
+MAX_CLUSTER_ZOOM = 16
+# 聚合半径（屏幕像素）
+CLUSTER_PIXELS = 60
+# 每个聚合返回的代表要素数量（id 最小的若干个）
+REPRESENTATIVE_IDS = 5
+
+CellKey = Tuple[int, int]
+
+
+def cluster_cell_size(zoom: int) -> float:
+    """缩放级别 zoom 下聚合格子的经纬度跨度（Web 墨卡托、256 像素瓦片）"""
+    return 360.0 / (256 * 2 ** zoom) * CLUSTER_PIXELS
+
+
+class Cluster:
+    """一个格子内的聚合结果"""
+    __slots__ = ("count", "sum_lon", "sum_lat", "ids")
+
+    def __init__(self, count: int = 0, sum_lon: float = 0.0, sum_lat: float = 0.0, ids: Optional[List[int]] = None):
+        self.count = count
+        self.sum_lon = sum_lon
+        self.sum_lat = sum_lat
+        # 最细一级保存全部 id（升序），其余各级只保存代表 id
+        self.ids = ids if ids is not None else []
+
+    def copy(self) -> "Cluster":
+        return Cluster(self.count, self.sum_lon, self.sum_lat, list(self.ids))
+
+    def to_dict(self) -> dict:
+        item = {
+            "longitude": self.sum_lon / self.count,
+            "latitude": self.sum_lat / self.count,
+            "count": self.count,
+            "ids": self.ids[:REPRESENTATIVE_IDS],
+        }
+        if self.count == 1:
+            item["id"] = self.ids[0]
+        return item
+
+
+class ClusterIndex:
+    """某个数据集所有缩放级别的聚合结果"""
+
+    def __init__(self, points: Dict[int, Tuple[float, float]]):
+        # id -> (经度, 纬度)
+        self.points = points
+        self.levels: List[Dict[CellKey, Cluster]] = [{} for _ in range(MAX_CLUSTER_ZOOM + 1)]
+
+        leaf = self.levels[MAX_CLUSTER_ZOOM]
+        for point_id in sorted(points):
+            lon, lat = points[point_id]
+            cluster = leaf.setdefault(self._leaf_key(lon, lat), Cluster())
+            cluster.count += 1
+            cluster.sum_lon += lon
+            cluster.sum_lat += lat
+            cluster.ids.append(point_id)
+
+        for zoom in range(MAX_CLUSTER_ZOOM - 1, -1, -1):
+            for key in {(x // 2, y // 2) for x, y in self.levels[zoom + 1]}:
+                self._merge_children(zoom, key)
+
+    @staticmethod
+    def _leaf_key(lon: float, lat: float) -> CellKey:
+        size = cluster_cell_size(MAX_CLUSTER_ZOOM)
+        return (math.floor(lon / size), math.floor(lat / size))
+
+    def _merge_children(self, zoom: int, key: CellKey):
+        """由第 zoom+1 级的 4 个子格子重新计算第 zoom 级的格子"""
+        children = self.levels[zoom + 1]
+        x, y = key
+        merged = Cluster()
+        for child_key in ((2 * x, 2 * y), (2 * x + 1, 2 * y), (2 * x, 2 * y + 1), (2 * x + 1, 2 * y + 1)):
+            child = children.get(child_key)
+            if child is not None:
+                merged.count += child.count
+                merged.sum_lon += child.sum_lon
+                merged.sum_lat += child.sum_lat
+                merged.ids.extend(child.ids[:REPRESENTATIVE_IDS])
+        if merged.count:
+            merged.ids = sorted(merged.ids)[:REPRESENTATIVE_IDS]
+            self.levels[zoom][key] = merged
+        else:
+            self.levels[zoom].pop(key, None)
+
+    def updated(self, points: Dict[int, Tuple[float, float]]) -> "ClusterIndex":
+        """
+        根据新数据返回更新后的聚合结果
+        数据没有变化时直接复用当前对象；变化较少时复制后只更新受影响的格子；
+        变化较多时整体重建
+        """
+        removed = [(i, p) for i, p in self.points.items() if points.get(i) != p]
+        added = [(i, p) for i, p in points.items() if self.points.get(i) != p]
+        if not removed and not added:
+            return self
+        if len(removed) + len(added) > len(points) // 4:
+            return ClusterIndex(points)
+
+        index = ClusterIndex.__new__(ClusterIndex)
+        index.points = points
+        index.levels = [dict(level) for level in self.levels]
+
+        leaf = index.levels[MAX_CLUSTER_ZOOM]
+        touched = set()
+        for point_id, (lon, lat) in removed:
+            key = self._leaf_key(lon, lat)
+            cluster = leaf[key].copy() if key not in touched else leaf[key]
+            cluster.count -= 1
+            cluster.sum_lon -= lon
+            cluster.sum_lat -= lat
+            cluster.ids.remove(point_id)
+            leaf[key] = cluster
+            touched.add(key)
+        for point_id, (lon, lat) in added:
+            key = self._leaf_key(lon, lat)
+            if key in touched:
+                cluster = leaf[key]
+            else:
+                cluster = leaf[key].copy() if key in leaf else Cluster()
+            cluster.count += 1
+            cluster.sum_lon += lon
+            cluster.sum_lat += lat
+            cluster.ids.append(point_id)
+            leaf[key] = cluster
+            touched.add(key)
+
+        for key in touched:
+            if leaf[key].count == 0:
+                del leaf[key]
+            else:
+                leaf[key].ids.sort()
+
+        for zoom in range(MAX_CLUSTER_ZOOM - 1, -1, -1):
+            touched = {(x // 2, y // 2) for x, y in touched}
+            for key in touched:
+                index._merge_children(zoom, key)
+        return index
+
+    def query(self, zoom: float, bbox: Optional[BBox] = None) -> List[Cluster]:
+        """返回缩放级别 zoom 下（可选 bbox 内）的聚合结果"""
+        level_zoom = min(max(int(math.floor(zoom)), 0), MAX_CLUSTER_ZOOM)
+        level = self.levels[level_zoom]
+        if bbox is None:
+            return list(level.values())
+
+        min_lon, min_lat, max_lon, max_lat = bbox
+        size = cluster_cell_size(level_zoom)
+        x0, y0 = math.floor(min_lon / size), math.floor(min_lat / size)
+        x1, y1 = math.floor(max_lon / size), math.floor(max_lat / size)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(level):
+            cells = [c for (x, y), c in level.items() if x0 <= x <= x1 and y0 <= y <= y1]
+        else:
+            cells = [
+                level[(x, y)]
+                for x in range(x0, x1 + 1)
+                for y in range(y0, y1 + 1)
+                if (x, y) in level
+            ]
+        return cells
+
+
+# 每个数据集最近一次构建的聚合结果，用于数据刷新时增量更新
+_latest: Dict[str, ClusterIndex] = {}
+_latest_lock = threading.Lock()
+
+
+def build_cluster_index(snapshot) -> ClusterIndex:
+    points = {
+        row['id']: (float(row['longitude']), float(row['latitude']))
+        for row in snapshot.rows
+    }
+    with _latest_lock:
+        previous = _latest.get(snapshot.name)
+        index = previous.updated(points) if previous is not None else ClusterIndex(points)
+        _latest[snapshot.name] = index
+    return index
+
+
+def get_cluster_index(snapshot) -> ClusterIndex:
+    """获取快照对应的聚合结果（随快照缓存）"""
+    return snapshot.derived("cluster_index", build_cluster_index)
@@ -0,0 +1,207 @@
+"""
+datasets.py - 诗词、非遗、历史、景点四类基础数据的查询与快照
+main.py 中的列表接口以及后续的空间索引、筛选等功能都从这里读取数据
+"""
+import bisect
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+
+from cache import SnapshotCache, snapshot_response, cached_response, list_body, derive_etag
+from db import get_db_connection, release_db_connection
+from spatial import parse_bbox, get_grid_index
+
+# 快照有效期（秒），基础数据很少变化，可通过环境变量调整
+SNAPSHOT_TTL = float(os.getenv("SNAPSHOT_TTL", "600"))
+
+# 过滤掉无效的经纬度值
+VALID_COORDS_SQL = """
+          longitude IS NOT NULL
+          AND latitude IS NOT NULL
+          AND longitude <> 'NaN'::float
+          AND latitude <> 'NaN'::float
+          AND longitude BETWEEN -180 AND 180
+          AND latitude BETWEEN -90 AND 90
+"""
+
+# 数据集名称 -> 表名及返回字段
+DATASETS = {
+    "poems": {
+        "label": "诗词",
+        "table": "poems.poems",
+        "columns": [
+            "id", "name", "author", "dynasty", "content", "keywords", "poemtype",
+            "city", "county", "province", "longitude", "latitude"
+        ],
+    },
+    "heritage": {
+        "label": "非遗",
+        "table": "heritage.heritage",
+        "columns": [
+            "id", "name", "rx_time", "content", "province", "type", "longitude", "latitude"
+        ],
+    },
+    "history": {
+        "label": "历史",
+        "table": "history.history",
+        "columns": [
+            "id", "name", "people", "description", "province", "property",
+            "city", "county", "period", "longitude", "latitude"
+        ],
+    },
+    "scenic": {
+        "label": "景点",
+        "table": "scenic.scenic",
+        "columns": [
+            "id", "name", "description", "place", "score", "sight_level", "price",
+            "longitude", "latitude", "recommend_reason", "comment"
+        ],
+    },
+}
+
+# 地图展示所需的字段（点击要素前不需要正文等大字段）
+MAP_FIELDS = {
+    "poems": ["id", "name", "author", "dynasty", "poemtype", "longitude", "latitude"],
+    "heritage": ["id", "name", "type", "rx_time", "longitude", "latitude"],
+    "history": ["id", "name", "property", "period", "longitude", "latitude"],
+    "scenic": ["id", "name", "sight_level", "score", "longitude", "latitude"],
+}
+
+# 批量查询一次最多的 id 数量
+MAX_BATCH_IDS = 1000
+
+
+def fetch_by_ids(cursor, name: str, ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """用一条 = ANY(%s) 查询按 id 批量获取记录（不过滤经纬度，与按 id 查询详情的接口一致）"""
+    if not ids:
+        return {}
+    spec = DATASETS[name]
+    cursor.execute(
+        f"SELECT {', '.join(spec['columns'])} FROM {spec['table']} WHERE id = ANY(%s);",
+        (list(ids),)
+    )
+    return {row['id']: dict(row) for row in cursor.fetchall()}
+
+
+def load_dataset(name: str) -> List[Dict[str, Any]]:
+    """从数据库读取整个数据集（仅保留经纬度有效的记录），按 id 排序"""
+    spec = DATASETS[name]
+    query = f"""
+        SELECT {', '.join(spec['columns'])}
+        FROM {spec['table']}
+        WHERE {VALID_COORDS_SQL}
+        ORDER BY id;
+    """
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query)
+        items = cursor.fetchall()
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+    # 转换为字典列表，并再次验证数值有效性
+    result = []
+    for item in items:
+        item_dict = dict(item)
+        try:
+            lon = float(item_dict['longitude'])
+            lat = float(item_dict['latitude'])
+            if -180 <= lon <= 180 and -90 <= lat <= 90:
+                result.append(item_dict)
+        except (ValueError, TypeError):
+            # 跳过无效数据
+            continue
+    return result
+
+
+# 快照名称 -> 加载函数
+SNAPSHOT_LOADERS = {
+    name: (lambda name=name: load_dataset(name)) for name in DATASETS
+}
+
+
+def load_snapshot(name: str):
+    """按快照名称加载数据"""
+    return SNAPSHOT_LOADERS[name]()
+
+
+# 全局快照缓存
+snapshots = SnapshotCache(load_snapshot, ttl=SNAPSHOT_TTL)
+
+
+def parse_fields(name: str, fields: Optional[str] = None, lite: bool = False) -> Optional[Tuple[str, ...]]:
+    """
+    解析字段投影参数
+    - fields=id,name,...：只返回指定字段（id 总是返回，用于再按 id 获取详情）
+    - lite=true：只返回地图展示所需的字段（MAP_FIELDS）
+    返回按表字段顺序排列的字段元组，不需要投影时返回 None
+    """
+    columns = DATASETS[name]['columns']
+    if fields:
+        requested = {f.strip() for f in fields.split(",") if f.strip()}
+        unknown = requested - set(columns)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"未知字段: {', '.join(sorted(unknown))}")
+        requested.add("id")
+    elif lite:
+        requested = set(MAP_FIELDS[name])
+    else:
+        return None
+    return tuple(c for c in columns if c in requested)
+
+
+def dataset_response(request: Request, name: str, bbox: Optional[str] = None,
+                     zoom: Optional[float] = None, fields: Optional[str] = None,
+                     lite: bool = False, after_id: Optional[int] = None,
+                     limit: Optional[int] = None, output_format: str = "json") -> Response:
+    """
+    列表接口的统一响应
+    - 不带参数时直接返回预先序列化的完整快照
+    - bbox：只返回视野范围内的要素（网格索引）
+    - zoom：低缩放级别下按屏幕像素网格抽稀
+    - fields / lite：字段投影，详情通过按 id 查询的接口获取
+    - after_id / limit：按 id 的游标分页，响应中的 next_cursor 为下一页的 after_id
+    - output_format=ndjson：以 NDJSON 流式返回，每行一条记录
+    """
+    snapshot = snapshots.get(name)
+    box = parse_bbox(bbox)
+    projection = parse_fields(name, fields, lite)
+    paginated = after_id is not None or limit is not None
+    if box is None and zoom is None and projection is None and not paginated and output_format == "json":
+        return snapshot_response(request, snapshot)
+
+    index = get_grid_index(snapshot)
+    positions = index.query(box) if box is not None else index.all()
+    if zoom is not None:
+        positions = index.thin(positions, zoom)
+
+    # 快照按 id 升序排列，行号与 id 顺序一致，可以直接二分定位游标
+    next_cursor = None
+    if after_id is not None:
+        start = bisect.bisect_right(get_id_list(snapshot), after_id)
+        positions = positions[bisect.bisect_left(positions, start):]
+    if limit is not None and len(positions) > limit:
+        positions = positions[:limit]
+        next_cursor = snapshot.rows[positions[-1]]['id']
+
+    row_bytes = snapshot.row_bytes(projection)
+    if output_format == "ndjson":
+        return StreamingResponse(
+            (row_bytes[i] + b"\n" for i in positions),
+            media_type="application/x-ndjson",
+            headers={"X-Next-Cursor": str(next_cursor)} if next_cursor is not None else None
+        )
+
+    etag = derive_etag(snapshot.etag, box, zoom, projection, after_id, limit)
+    extra = {"next_cursor": next_cursor} if paginated else None
+    return cached_response(request, list_body([row_bytes[i] for i in positions], extra), etag)
+
+
+def get_id_list(snapshot) -> List[int]:
+    """快照中各行的 id（升序）"""
+    return snapshot.derived("ids", lambda s: [row['id'] for row in s.rows])
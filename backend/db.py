@@ -0,0 +1,205 @@
+"""
+db.py - 数据库连接池
+main.py / routes_api.py / actions_api.py 共用同一个连接池，
+在应用启动时创建、关闭时释放
+"""
+import os
+import threading
+import time
+import uuid
+from typing import Optional
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
+
+# 数据库连接配置（本地连接）
+DB_CONFIG = {
+    "host": "localhost",
+    "port": 5432,
+    "dbname": "shudao",
+    "user": "postgres",
+    "password": "123456"  # 修改为你的实际密码
+}
+
+# 连接池配置（可通过环境变量覆盖）
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "20"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))  # 获取连接的最长等待时间（秒）
+POOL_RETRY_AFTER = int(os.getenv("DB_POOL_RETRY_AFTER", "1"))  # 连接耗尽时建议客户端重试的间隔（秒）
+
+
+class PoolTimeoutError(Exception):
+    """在超时时间内没有拿到空闲连接，接口返回 503 并带 Retry-After"""
+
+
+class ConnectionPool:
+    """
+    基于 psycopg2 ThreadedConnectionPool 的连接池
+    ThreadedConnectionPool 在连接耗尽时直接抛错，这里用信号量实现带超时的等待，
+    并记录使用情况供 /api/stats/db 查看
+    """
+
+    def __init__(self, minconn: int, maxconn: int, timeout: float, **conn_kwargs):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self._pool = ThreadedConnectionPool(minconn, maxconn, **conn_kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        # ThreadedConnectionPool 启动时打开 minconn 个连接，归还时最多保留 minconn 个空闲连接
+        self._idle = minconn
+        self._acquired = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def getconn(self, timeout: Optional[float] = None):
+        """从连接池获取连接，超时抛出 PoolTimeoutError"""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=timeout):
+            with self._lock:
+                self._timeouts += 1
+            raise PoolTimeoutError(f"获取数据库连接超时（{timeout}s）")
+
+        waited = time.perf_counter() - start
+        try:
+            conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_use += 1
+            self._idle = max(self._idle - 1, 0)
+            self._acquired += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return conn
+
+    def putconn(self, conn):
+        """归还连接；未提交的事务会被回滚，已断开的连接会被丢弃"""
+        try:
+            self._pool.putconn(conn, close=bool(conn.closed))
+        finally:
+            with self._lock:
+                self._in_use -= 1
+                # 超出 minconn 或已断开的连接在归还时被关闭，未关闭的即为空闲连接
+                if not conn.closed:
+                    self._idle += 1
+            self._slots.release()
+
+    def closeall(self):
+        self._pool.closeall()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "min_size": self.minconn,
+                "max_size": self.maxconn,
+                "timeout": self.timeout,
+                "in_use": self._in_use,
+                "idle": self._idle,
+                "acquired": self._acquired,
+                "timeouts": self._timeouts,
+                "wait_avg_ms": round(self._wait_total / self._acquired * 1000, 3) if self._acquired else 0,
+                "wait_max_ms": round(self._wait_max * 1000, 3),
+            }
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def init_pool() -> ConnectionPool:
+    """创建全局连接池（应用启动时调用，重复调用无副作用）"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(
+                POOL_MIN_SIZE,
+                POOL_MAX_SIZE,
+                POOL_TIMEOUT,
+                **DB_CONFIG,
+                cursor_factory=RealDictCursor
+            )
+            print(f"数据库连接池已创建: min={POOL_MIN_SIZE}, max={POOL_MAX_SIZE}, timeout={POOL_TIMEOUT}s")
+        return _pool
+
+
+def close_pool():
+    """关闭全局连接池（应用关闭时调用）"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            print("数据库连接池已关闭")
+
+
+def get_db_connection():
+    """从连接池获取数据库连接，用完后必须调用 release_db_connection 归还"""
+    return (_pool or init_pool()).getconn()
+
+
+def release_db_connection(conn):
+    """归还数据库连接"""
+    if _pool is not None:
+        _pool.putconn(conn)
+    else:
+        conn.close()
+
+
+def stream_rows(query: str, params=None, itersize: int = 1000):
+    """
+    使用服务端命名游标逐批读取查询结果，内存占用与结果集大小无关
+    生成器结束（或被关闭）时释放游标并归还连接
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor(name=f"stream_{uuid.uuid4().hex}")
+    cursor.itersize = itersize
+    try:
+        cursor.execute(query, params)
+        for row in cursor:
+            yield row
+    finally:
+        try:
+            cursor.close()
+        except psycopg2.Error:
+            pass
+        release_db_connection(conn)
+
+
+def get_pool_stats() -> dict:
+    """连接池使用情况"""
+    if _pool is None:
+        return {"initialized": False}
+    return {"initialized": True, **_pool.stats()}
+
+
+def get_user_id_by_username(username: str, cursor=None) -> Optional[int]:
+    """
+    根据用户名获取用户ID
+    传入 cursor 时复用当前请求的连接，避免同一请求占用两个连接
+    """
+    if cursor is not None:
+        cursor.execute("SELECT id FROM users.users WHERE username = %s", (username,))
+        result = cursor.fetchone()
+        return result['id'] if result else None
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM users.users WHERE username = %s", (username,))
+        result = cursor.fetchone()
+        cursor.close()
+        return result['id'] if result else None
+    except Exception as e:
+        print(f"获取用户ID失败: {e}")
+        return None
+    finally:
+        if conn is not None:
+            release_db_connection(conn)
@@ -0,0 +1,242 @@
+"""
+elevation.py - 本地 DEM 高程服务
+从 DEM_DIR 中的 SRTM .hgt 瓦片（如 N30E104.hgt，1°x1°，大端 int16，SRTM1/SRTM3 均可）
+以内存映射方式读取，对一批点做双线性插值；打开的瓦片按 LRU 缓存，数据页由操作系统缓存
+"""
+import math
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+
+from geo import cumulative_distance, segment_lengths
+
+router = APIRouter(prefix="/api/elevation", tags=["elevation"])
+
+# DEM 瓦片目录
+DEM_DIR = os.getenv("DEM_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "dem"))
+# 同时保持打开的瓦片数量
+DEM_CACHE_TILES = int(os.getenv("DEM_CACHE_TILES", "32"))
+# SRTM 中的无数据值
+HGT_VOID = -32768
+# 累计爬升/下降时忽略的高程波动（米），过滤 DEM 和 GPS 的噪声
+CLIMB_THRESHOLD_M = 3.0
+# 单次请求的点数上限
+MAX_ELEVATION_POINTS = 10000
+
+
+def tile_name(lat_index: int, lon_index: int) -> str:
+    """瓦片西南角的整数经纬度 -> 文件名，如 (30, 104) -> N30E104"""
+    ns = "N" if lat_index >= 0 else "S"
+    ew = "E" if lon_index >= 0 else "W"
+    return f"{ns}{abs(lat_index):02d}{ew}{abs(lon_index):03d}"
+
+
+class HgtTile:
+    """一个内存映射的 .hgt 瓦片，第 0 行为北边界"""
+
+    def __init__(self, path: str, lat_index: int, lon_index: int):
+        size = int(math.isqrt(os.path.getsize(path) // 2))
+        if size * size * 2 != os.path.getsize(path):
+            raise ValueError(f"无效的 HGT 文件: {path}")
+        self.size = size
+        self.lat_index = lat_index
+        self.lon_index = lon_index
+        self.data = np.memmap(path, dtype=">i2", mode="r", shape=(size, size))
+
+    def sample(self, lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+        """双线性插值，四个相邻格点中的无数据格点不参与加权；全部无数据时为 NaN"""
+        n = self.size - 1
+        rows = np.clip((self.lat_index + 1 - lats) * n, 0, n)
+        cols = np.clip((lons - self.lon_index) * n, 0, n)
+        r0 = np.minimum(rows.astype(np.int64), n - 1)
+        c0 = np.minimum(cols.astype(np.int64), n - 1)
+        fr, fc = rows - r0, cols - c0
+
+        values = np.stack([
+            self.data[r0, c0], self.data[r0, c0 + 1], self.data[r0 + 1, c0], self.data[r0 + 1, c0 + 1]
+        ]).astype(np.float64)
+        weights = np.stack([(1 - fr) * (1 - fc), (1 - fr) * fc, fr * (1 - fc), fr * fc])
+        weights[values == HGT_VOID] = 0.0
+        total = weights.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result = (weights * values).sum(axis=0) / total
+        result[total == 0] = np.nan
+        return result
+
+
+class TileCache:
+    """按 LRU 保持打开的瓦片；不存在的瓦片也记录下来，避免重复查找文件"""
+
+    def __init__(self, directory: str = DEM_DIR, max_tiles: int = DEM_CACHE_TILES):
+        self.directory = directory
+        self.max_tiles = max_tiles
+        self._lock = threading.Lock()
+        self._tiles: "OrderedDict[Tuple[int, int], Optional[HgtTile]]" = OrderedDict()
+
+    def _load(self, lat_index: int, lon_index: int) -> Optional[HgtTile]:
+        name = tile_name(lat_index, lon_index)
+        for filename in (f"{name}.hgt", f"{name.lower()}.hgt"):
+            path = os.path.join(self.directory, filename)
+            if os.path.isfile(path):
+                return HgtTile(path, lat_index, lon_index)
+        return None
+
+    def get(self, lat_index: int, lon_index: int) -> Optional[HgtTile]:
+        key = (lat_index, lon_index)
+        with self._lock:
+            if key in self._tiles:
+                self._tiles.move_to_end(key)
+                return self._tiles[key]
+            tile = self._load(lat_index, lon_index)
+            self._tiles[key] = tile
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+            return tile
+
+    def clear(self):
+        with self._lock:
+            self._tiles.clear()
+
+
+dem_tiles = TileCache()
+
+
+def sample_elevations(lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+    """一批点的高程（米），没有 DEM 覆盖的点为 NaN；按瓦片分组后每个瓦片一次插值"""
+    result = np.full(len(lons), np.nan)
+    if not len(lons):
+        return result
+    lat_index = np.floor(lats).astype(np.int64)
+    lon_index = np.floor(lons).astype(np.int64)
+    keys = lat_index * 1000 + lon_index
+    for key in np.unique(keys).tolist():
+        mask = keys == key
+        tile = dem_tiles.get(int(lat_index[mask][0]), int(lon_index[mask][0]))
+        if tile is not None:
+            result[mask] = tile.sample(lons[mask], lats[mask])
+    return result
+
+
+def climb(elevations: np.ndarray, threshold: float = CLIMB_THRESHOLD_M) -> Tuple[float, float]:
+    """
+    累计爬升和下降（米）：只有相对上一个参考高程的变化超过 threshold 时才计入，
+    无高程的点跳过
+    """
+    ascent = descent = 0.0
+    reference = None
+    for value in elevations[~np.isnan(elevations)].tolist():
+        if reference is None:
+            reference = value
+        elif value - reference >= threshold:
+            ascent += value - reference
+            reference = value
+        elif reference - value >= threshold:
+            descent += reference - value
+            reference = value
+    return ascent, descent
+
+
+def fill_route_elevations(points: Sequence[dict]) -> List[dict]:
+    """
+    用 DEM 高程填充路线点的 elevation（有 DEM 覆盖时以 DEM 为准，保证各路线的爬升可比；
+    没有覆盖时保留原有的值），返回新的点列表
+    """
+    if not points:
+        return list(points)
+    lons = np.fromiter((float(p['longitude']) for p in points), dtype=np.float64, count=len(points))
+    lats = np.fromiter((float(p['latitude']) for p in points), dtype=np.float64, count=len(points))
+    sampled = sample_elevations(lons, lats)
+    filled = []
+    for point, value in zip(points, sampled.tolist()):
+        point = dict(point)
+        if not math.isnan(value):
+            point['elevation'] = round(value, 1)
+        filled.append(point)
+    return filled
+
+
+def point_elevations(points: Sequence[dict]) -> np.ndarray:
+    """路线点中已有的 elevation，缺失为 NaN"""
+    return np.array(
+        [np.nan if p.get('elevation') is None else float(p['elevation']) for p in points], dtype=np.float64
+    )
+
+
+def elevation_summary(points: Sequence[dict]) -> dict:
+    """路线的累计爬升、累计下降、最低和最高海拔（米），没有高程数据时均为 None"""
+    elevations = point_elevations(points)
+    known = elevations[~np.isnan(elevations)]
+    if not len(known):
+        return {"ascent": None, "descent": None, "min_elevation": None, "max_elevation": None}
+    ascent, descent = climb(elevations)
+    return {
+        "ascent": round(ascent, 1),
+        "descent": round(descent, 1),
+        "min_elevation": round(float(known.min()), 1),
+        "max_elevation": round(float(known.max()), 1),
+    }
+
+
+def elevation_profile(points: Sequence[dict], samples: Optional[int] = None) -> dict:
+    """
+    高程剖面：各点距起点的累计距离（公里）和高程（米）
+    samples 小于点数时按距离等间隔取 samples 个点，高程在相邻有高程的点之间线性插值
+    """
+    lons = np.array([float(p['longitude']) for p in points], dtype=np.float64)
+    lats = np.array([float(p['latitude']) for p in points], dtype=np.float64)
+    distances = cumulative_distance(segment_lengths(lons, lats)) if len(points) else np.zeros(0)
+    elevations = point_elevations(points)
+
+    if samples is not None and 2 <= samples < len(points):
+        known = ~np.isnan(elevations)
+        sampled = np.linspace(0.0, distances[-1], samples)
+        if known.any():
+            values = np.interp(sampled, distances[known], elevations[known])
+            # 首个/最后一个有高程的点之外不外推
+            values[(sampled < distances[known][0]) | (sampled > distances[known][-1])] = np.nan
+        else:
+            values = np.full(samples, np.nan)
+        distances, elevations = sampled, values
+
+    return {
+        "distance": np.round(distances, 3).tolist(),
+        "elevation": [None if math.isnan(v) else round(v, 1) for v in elevations.tolist()],
+    }
+
+
+# ==================== API 接口 ====================
+
+class ElevationLocation(BaseModel):
+    latitude: float
+    longitude: float
+
+class ElevationRequest(BaseModel):
+    locations: List[ElevationLocation]
+
+
+@router.post("")
+def lookup_elevations(request: ElevationRequest):
+    """
+    批量查询高程（请求格式与 open-elevation 的 lookup 接口相同），
+    返回与 locations 顺序一致的高程（米），没有 DEM 覆盖的点为 null
+    """
+    if len(request.locations) > MAX_ELEVATION_POINTS:
+        raise HTTPException(status_code=400, detail=f"一次最多查询 {MAX_ELEVATION_POINTS} 个点")
+    try:
+        lons = np.array([loc.longitude for loc in request.locations], dtype=np.float64)
+        lats = np.array([loc.latitude for loc in request.locations], dtype=np.float64)
+        values = sample_elevations(lons, lats)
+        return {
+            "success": True,
+            "data": [None if math.isnan(v) else round(v, 1) for v in values.tolist()]
+        }
+    except Exception as e:
+        print(f"Error sampling elevations: {e}")
+        import traceback
+        traceback.print_exc()
+        return {"success": False, "error": str(e), "data": []}
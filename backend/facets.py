@@ -0,0 +1,144 @@
+"""
+facets.py - 筛选选项（分面）索引
+用一条查询统计四张表中知识图谱高级筛选所需的全部可选值，结果与基础数据一起按快照缓存；
+诗词关键词的倒排索引随诗词快照构建
+"""
+import bisect
+import re
+import unicodedata
+from typing import Any, Dict, List
+
+from datasets import DATASETS, SNAPSHOT_LOADERS, snapshots
+from db import get_db_connection, release_db_connection
+
+# 各数据集中需要统计可选值的字段：(数据集, 字段) -> 选项名称
+FACET_FIELDS = {
+    ("poems", "dynasty"): "dynasties",
+    ("poems", "author"): "authors",
+    ("poems", "poemtype"): "poemtypes",
+    ("heritage", "rx_time"): "rx_times",
+    ("heritage", "type"): "heritage_types",
+    ("history", "people"): "people",
+    ("history", "period"): "periods",
+    ("history", "property"): "properties",
+    ("scenic", "sight_level"): "sight_levels",
+}
+
+# 多个数据集汇总的字段：选项名称 -> 来源数据集
+SHARED_FACETS = {
+    "provinces": ("province", ["poems", "heritage", "history"]),
+    "cities": ("city", ["poems", "history"]),
+    "counties": ("county", ["poems", "history"]),
+}
+
+# 关键词分隔符：中英文逗号、顿号、分号和空白
+KEYWORD_SEPARATORS = re.compile(r"[,，、;；\s]+")
+
+
+def split_keywords(value: Any) -> List[str]:
+    """拆分并规范化（NFKC）关键词字段，去重并保持原有顺序"""
+    if not value:
+        return []
+    text = unicodedata.normalize("NFKC", str(value))
+    return list(dict.fromkeys(k for k in KEYWORD_SEPARATORS.split(text) if k))
+
+
+def _distinct_values(table: str, field: str, ordered: bool) -> str:
+    """子查询：字段的全部非空取值（数组），与原接口的 SELECT DISTINCT 条件相同"""
+    return (
+        f"ARRAY(SELECT DISTINCT {field} FROM {table} WHERE {field} IS NOT NULL AND {field} != ''"
+        f"{f' ORDER BY {field}' if ordered else ''})"
+    )
+
+
+def load_filter_options() -> Dict[str, Any]:
+    """
+    获取所有筛选字段的可选值（用于知识图谱的高级筛选功能）
+    统计整张表而不只是经纬度有效的记录，单字段选项按数据库排序规则排序，
+    所有字段在一条查询中完成；结果作为 filter_options 快照缓存
+    """
+    columns = [
+        f"{_distinct_values(DATASETS[name]['table'], field, True)} AS {option}"
+        for (name, field), option in FACET_FIELDS.items()
+    ]
+    columns += [
+        f"{_distinct_values(DATASETS[name]['table'], field, False)} AS {option}_{name}"
+        for option, (field, sources) in SHARED_FACETS.items() for name in sources
+    ]
+    columns += [
+        f"{_distinct_values(DATASETS['poems']['table'], 'keywords', False)} AS keywords",
+        f"(SELECT MIN(score) FROM {DATASETS['scenic']['table']} WHERE score IS NOT NULL) AS min_score",
+        f"(SELECT MAX(score) FROM {DATASETS['scenic']['table']} WHERE score IS NOT NULL) AS max_score",
+    ]
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT {', '.join(columns)};")
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+    keywords_set = set()
+    for value in row['keywords']:
+        keywords_set.update(split_keywords(value))
+
+    # 字段顺序与原接口一致
+    options: Dict[str, Any] = {}
+    for option in ("dynasties", "authors", "poemtypes"):
+        options[option] = row[option]
+    options['keywords'] = sorted(keywords_set)
+    for option in ("rx_times", "heritage_types", "people", "periods", "properties", "sight_levels"):
+        options[option] = row[option]
+    # 多个数据集汇总的字段在 Python 中合并排序（与原接口相同）
+    for option, (field, sources) in SHARED_FACETS.items():
+        options[option] = sorted({str(value) for name in sources for value in row[f"{option}_{name}"]})
+    options['score_range'] = {
+        'min': float(row['min_score']) if row['min_score'] else 0,
+        'max': float(row['max_score']) if row['max_score'] else 5
+    }
+    return options
+
+
+# 注册为快照，与基础数据共用缓存、TTL 和 /api/cache/invalidate
+SNAPSHOT_LOADERS["filter_options"] = load_filter_options
+
+
+class KeywordIndex:
+    """
+    关键词 -> 诗词 id 的倒排索引
+    keywords 按字典序排列用于前缀补全，ranked 按出现次数降序排列用于热门关键词
+    """
+
+    def __init__(self, rows: List[dict]):
+        postings: Dict[str, List[int]] = {}
+        for row in rows:
+            for keyword in split_keywords(row.get('keywords')):
+                postings.setdefault(keyword, []).append(row['id'])
+        # 快照按 id 升序，倒排列表天然有序
+        self.postings = postings
+        self.keywords = sorted(postings)
+        self.ranked = sorted(postings, key=lambda k: (-len(postings[k]), k))
+
+    def count(self, keyword: str) -> int:
+        return len(self.postings.get(keyword, ()))
+
+    def top(self, limit: int) -> List[str]:
+        """出现次数最多的关键词"""
+        return self.ranked[:limit]
+
+    def complete(self, prefix: str, limit: int) -> List[str]:
+        """以 prefix 开头的关键词，按出现次数降序"""
+        prefix = unicodedata.normalize("NFKC", prefix)
+        start = bisect.bisect_left(self.keywords, prefix)
+        end = bisect.bisect_left(self.keywords, prefix + "\U0010ffff")
+        return sorted(self.keywords[start:end], key=lambda k: (-len(self.postings[k]), k))[:limit]
+
+    def poem_ids(self, keyword: str) -> List[int]:
+        return self.postings.get(unicodedata.normalize("NFKC", keyword), [])
+
+
+def get_keyword_index() -> KeywordIndex:
+    """获取诗词快照对应的关键词索引（随快照缓存）"""
+    return snapshots.get("poems").derived("keyword_index", lambda s: KeywordIndex(s.rows))
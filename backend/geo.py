@@ -0,0 +1,252 @@
+"""
+geo.py - 基于 NumPy 的批量地理计算
+距离统一使用球面大圆距离（haversine），地球半径与原有的路线距离计算保持一致；
+路线相关的计算（分段长度、累计距离、外包框、折线简化）都对整条路线或多条路线一次完成
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+# 每度纬度对应的距离（公里）
+KM_PER_DEGREE = float(np.radians(EARTH_RADIUS_KM))
+
+# 点到折线距离分块计算时，每块中间数组的元素数上限
+SEGMENT_CHUNK_ELEMENTS = 1 << 20
+
+BBox = Tuple[float, float, float, float]
+
+
+def _haversine(lat1: np.ndarray, lat2: np.ndarray, dlat: np.ndarray, dlon: np.ndarray) -> np.ndarray:
+    """haversine 公式，参数均为弧度"""
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    a = np.minimum(a, 1.0)
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def haversine_km(lon: float, lat: float, lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+    """一个点到一组点的距离（公里），经纬度单位为度"""
+    lat_r, lats_r = np.radians(lat), np.radians(lats)
+    return _haversine(lat_r, lats_r, lats_r - lat_r, np.radians(lons) - np.radians(lon))
+
+
+def distance_matrix(lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+    """一组点两两之间的距离矩阵（公里），形状为 (n, n)"""
+    lats_r, lons_r = np.radians(lats), np.radians(lons)
+    return _haversine(
+        lats_r[:, None], lats_r[None, :], lats_r[:, None] - lats_r[None, :], lons_r[:, None] - lons_r[None, :]
+    )
+
+
+def degree_radius(lat: float, radius_km: float) -> float:
+    """
+    半径 radius_km 公里的圆在经纬度平面上的外接半径（度），
+    用于数据库中按经纬度计算的几何距离的粗筛，只会偏大不会漏掉
+    """
+    max_lat = min(abs(lat) + radius_km / KM_PER_DEGREE, 89.0)
+    return radius_km / (KM_PER_DEGREE * float(np.cos(np.radians(max_lat))))
+
+
+def points_to_arrays(points: Sequence[dict]) -> Tuple[np.ndarray, np.ndarray]:
+    """路线点列表 [{longitude, latitude, ...}] -> (经度数组, 纬度数组)"""
+    lons = np.fromiter((float(p['longitude']) for p in points), dtype=np.float64, count=len(points))
+    lats = np.fromiter((float(p['latitude']) for p in points), dtype=np.float64, count=len(points))
+    return lons, lats
+
+
+def segment_lengths(lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+    """相邻两点之间的距离（公里），长度为点数 - 1"""
+    if len(lons) < 2:
+        return np.zeros(0)
+    lats_r = np.radians(lats)
+    return _haversine(lats_r[:-1], lats_r[1:], np.diff(lats_r), np.diff(np.radians(lons)))
+
+
+def cumulative_distance(segments: np.ndarray) -> np.ndarray:
+    """每个点距起点的累计距离（公里），长度为点数"""
+    return np.concatenate(([0.0], np.cumsum(segments)))
+
+
+def bounding_box(lons: np.ndarray, lats: np.ndarray) -> Optional[BBox]:
+    """(minLon, minLat, maxLon, maxLat)，没有点时为 None"""
+    if not len(lons):
+        return None
+    return (float(lons.min()), float(lats.min()), float(lons.max()), float(lats.max()))
+
+
+def simplify(lons: np.ndarray, lats: np.ndarray, tolerance_km: float,
+             anchors: Optional[Sequence[int]] = None) -> np.ndarray:
+    """
+    Douglas-Peucker 折线简化，返回保留的点的下标（升序，总是包含首尾点和 anchors 中的点）
+    在以路线中心纬度为基准的等距投影平面上计算点到线段的距离
+    """
+    n = len(lons)
+    if n <= 2 or tolerance_km <= 0:
+        return np.arange(n)
+    scale = np.radians(EARTH_RADIUS_KM)
+    x = lons * scale * np.cos(np.radians(lats.mean()))
+    y = lats * scale
+
+    fixed = np.union1d([0, n - 1], np.asarray(anchors if anchors is not None else [], dtype=np.int64))
+    keep = np.zeros(n, dtype=bool)
+    keep[fixed] = True
+
+    # 同一轮中所有待处理的区间一起向量化计算，轮数约为递归深度
+    starts, ends = fixed[:-1], fixed[1:]
+    while len(starts):
+        inner = ends - starts - 1
+        starts, ends, inner = starts[inner > 0], ends[inner > 0], inner[inner > 0]
+        if not len(starts):
+            break
+        offsets = np.concatenate(([0], np.cumsum(inner)[:-1]))
+        segment = np.repeat(np.arange(len(starts)), inner)
+        index = starts[segment] + 1 + np.arange(int(inner.sum())) - offsets[segment]
+
+        ax, ay = x[starts][segment], y[starts][segment]
+        dx, dy = x[ends][segment] - ax, y[ends][segment] - ay
+        rx, ry = x[index] - ax, y[index] - ay
+        length2 = dx * dx + dy * dy
+        t = np.clip(np.divide(rx * dx + ry * dy, length2, out=np.zeros_like(rx), where=length2 > 0), 0.0, 1.0)
+        dist = np.hypot(rx - t * dx, ry - t * dy)
+
+        # 每个区间内距离最大的点（相同时取第一个）
+        max_dist = np.maximum.reduceat(dist, offsets)
+        candidates = np.flatnonzero(dist == max_dist[segment])
+        _, first = np.unique(segment[candidates], return_index=True)
+        split = max_dist > tolerance_km
+        mids = index[candidates[first]][split]
+        keep[mids] = True
+        starts, ends = np.concatenate((starts[split], mids)), np.concatenate((mids, ends[split]))
+    return np.flatnonzero(keep)
+
+
+def encode_polyline(lons: np.ndarray, lats: np.ndarray, precision: int = 5) -> str:
+    """
+    编码为 Google Encoded Polyline 字符串（纬度在前），precision=5 时精度约 1 米
+    """
+    if not len(lons):
+        return ""
+    factor = 10 ** precision
+    coords = np.column_stack((np.round(lats * factor), np.round(lons * factor))).astype(np.int64)
+    deltas = np.diff(coords, axis=0, prepend=[[0, 0]]).ravel()
+    chunks = []
+    for value in ((deltas << 1) ^ (deltas >> 63)).tolist():
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+    return "".join(chunks)
+
+
+def decode_polyline(encoded: str, precision: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+    """解码 Google Encoded Polyline 字符串 -> (经度数组, 纬度数组)"""
+    values = []
+    value = shift = 0
+    for char in encoded:
+        byte = ord(char) - 63
+        value |= (byte & 0x1f) << shift
+        shift += 5
+        if byte < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+    coords = np.cumsum(np.array(values, dtype=np.int64).reshape(-1, 2), axis=0) / 10 ** precision
+    return coords[:, 1].copy(), coords[:, 0].copy()
+
+
+def route_geometry(points: Sequence[dict], tolerance_km: Optional[float] = None) -> Dict[str, object]:
+    """
+    单条路线的几何信息：总距离、分段长度、累计距离、外包框，
+    tolerance_km 不为空时附带简化后的折线 [[经度, 纬度], ...]
+    """
+    lons, lats = points_to_arrays(points)
+    segments = segment_lengths(lons, lats)
+    geometry = {
+        "distance": round(float(segments.sum()), 1) if len(segments) else 0,
+        "points_count": len(points),
+        "bbox": bounding_box(lons, lats),
+        "segment_lengths": np.round(segments, 3).tolist(),
+        "cumulative_distance": np.round(cumulative_distance(segments), 3).tolist(),
+    }
+    if tolerance_km is not None:
+        kept = simplify(lons, lats, tolerance_km)
+        geometry["simplified"] = np.column_stack((lons[kept], lats[kept])).tolist()
+    return geometry
+
+
+def batch_route_metrics(routes: Sequence[Sequence[dict]]) -> List[Dict[str, object]]:
+    """
+    多条路线的总距离（公里，保留一位小数）、点数和外包框
+    所有路线的点拼接后一次向量化计算，再去掉跨越两条路线的分段
+    """
+    counts = np.fromiter((len(points) for points in routes), dtype=np.int64, count=len(routes))
+    total_points = int(counts.sum())
+    if not total_points:
+        return [{"distance": 0, "points_count": 0, "bbox": None} for _ in routes]
+
+    lons, lats = points_to_arrays([p for points in routes for p in points])
+    segments = segment_lengths(lons, lats)
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    # 每条路线最后一个点到下一条路线第一个点的分段不计入
+    segments[ends[(counts > 0) & (ends < total_points)] - 1] = 0.0
+    cumulative = cumulative_distance(segments)
+
+    nonempty = counts > 0
+    first = starts[nonempty]
+    bboxes = np.column_stack((
+        np.minimum.reduceat(lons, first), np.minimum.reduceat(lats, first),
+        np.maximum.reduceat(lons, first), np.maximum.reduceat(lats, first),
+    )).tolist()
+
+    metrics = []
+    box_iter = iter(bboxes)
+    for start, end, count in zip(starts.tolist(), ends.tolist(), counts.tolist()):
+        metrics.append({
+            "distance": round(float(cumulative[end - 1] - cumulative[start]), 1) if count >= 2 else 0,
+            "points_count": count,
+            "bbox": tuple(next(box_iter)) if count else None,
+        })
+    return metrics
+
+
+def _project(lons: np.ndarray, lats: np.ndarray, lat0: float) -> Tuple[np.ndarray, np.ndarray]:
+    """以纬度 lat0 为基准的等距投影（公里）"""
+    return lons * KM_PER_DEGREE * np.cos(np.radians(lat0)), lats * KM_PER_DEGREE
+
+
+def _points_to_segments(px: np.ndarray, py: np.ndarray, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """
+    每个点到折线 (x, y) 的最短距离（投影平面上）
+    点按块处理，每块的 点数 x 线段数 不超过 SEGMENT_CHUNK_ELEMENTS，长轨迹也不会占用大量内存
+    """
+    if len(x) == 1:
+        return np.hypot(px - x[0], py - y[0])
+    ax, ay = x[:-1], y[:-1]
+    dx, dy = x[1:] - ax, y[1:] - ay
+    length2 = dx * dx + dy * dy
+    result = np.empty(len(px))
+    step = max(1, SEGMENT_CHUNK_ELEMENTS // len(ax))
+    for start in range(0, len(px), step):
+        rx, ry = px[start:start + step, None] - ax, py[start:start + step, None] - ay
+        t = np.clip(np.divide(rx * dx + ry * dy, length2, out=np.zeros_like(rx), where=length2 > 0), 0.0, 1.0)
+        result[start:start + step] = np.hypot(rx - t * dx, ry - t * dy).min(axis=1)
+    return result
+
+
+def point_to_polyline_km(lon: float, lat: float, lons: np.ndarray, lats: np.ndarray) -> float:
+    """点到折线的最短距离（公里），在以该点纬度为基准的等距投影平面上计算"""
+    x, y = _project(lons, lats, lat)
+    px, py = _project(np.array([lon]), np.array([lat]), lat)
+    return float(_points_to_segments(px, py, x, y)[0])
+
+
+def polyline_distance_km(lons1: np.ndarray, lats1: np.ndarray,
+                         lons2: np.ndarray, lats2: np.ndarray) -> float:
+    """
+    两条不相交折线之间的最短距离（公里），即各自顶点到另一条折线距离的最小值；
+    是否相交由调用方判断（相交时距离为 0）
+    """
+    lat0 = float(np.concatenate((lats1, lats2)).mean())
+    x1, y1 = _project(lons1, lats1, lat0)
+    x2, y2 = _project(lons2, lats2, lat0)
+    return float(min(_points_to_segments(x1, y1, x2, y2).min(), _points_to_segments(x2, y2, x1, y1).min()))
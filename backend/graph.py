@@ -0,0 +1,405 @@
+"""
+graph.py - 服务端知识图谱构建
+与前端 src/utils/graphBuilder.ts 的 buildGraphData 生成相同的节点、边和 combo：
+- network 模式：作者、朝代、省份等属性节点在所有中心节点之间共享
+- independent 模式：每个中心节点拥有自己的属性节点，并各自组成一个 combo
+结果以紧凑的列式结构返回（节点用整数下标表示，边为扁平的下标数组），
+按 (模式, 筛选条件, 各数据集快照版本) 缓存预先序列化的响应体
+另外以 CSR 数组保存记录与共享属性的邻接关系，用于从单个节点按需扩展 k 层邻居
+"""
+import bisect
+import hashlib
+import math
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from cache import dump_json
+from datasets import DATASETS, snapshots
+from search import bitmap_to_positions, filter_rows
+from spatial import BBox
+
+# 数据集 -> 图中心节点类型（与 graphBuilder.ts 一致）
+NODE_TYPES = {"poems": "poem", "heritage": "heritage", "history": "history", "scenic": "scenic"}
+TYPE_CODES = {node_type: i for i, node_type in enumerate(NODE_TYPES.values())}
+
+# 缓存的图数量
+GRAPH_CACHE_SIZE = 32
+
+
+def _valid(value: Any) -> bool:
+    """对应 graphBuilder.ts 的 isValidValue"""
+    if value is None or value == "":
+        return False
+    if isinstance(value, str) and value.lower() == "nan":
+        return False
+    if isinstance(value, float) and math.isnan(value):
+        return False
+    return True
+
+
+def _text(value: Any) -> str:
+    """按 JavaScript 模板字符串的方式格式化取值（整数形式的浮点数不带小数点）"""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def attribute_nodes(name: str, row: dict) -> List[Tuple[str, str]]:
+    """某条记录的属性节点 (id 前缀, 显示名称)，顺序与 graphBuilder.ts 相同"""
+    attrs = []
+    if name == "poems":
+        for field in ("author", "dynasty", "poemtype"):
+            if _valid(row.get(field)):
+                attrs.append((f"{field}-{_text(row[field])}", _text(row[field])))
+        if _valid(row.get("province")):
+            attrs.append((f"province-{_text(row['province'])}", f"省份{_text(row['province'])}"))
+        for field in ("city", "county"):
+            if _valid(row.get(field)):
+                attrs.append((f"{field}-{_text(row[field])}", _text(row[field])))
+        if _valid(row.get("keywords")):
+            attrs.append((f"keyword-{_text(row['keywords'])}", _text(row['keywords'])))
+    elif name == "heritage":
+        if row.get("rx_time"):
+            attrs.append((f"rx_time-{_text(row['rx_time'])}", _text(row['rx_time'])))
+        if row.get("type"):
+            attrs.append((f"heritage_type-{_text(row['type'])}", _text(row['type'])))
+        if row.get("province"):
+            attrs.append((f"province-{_text(row['province'])}", f"省份{_text(row['province'])}"))
+    elif name == "history":
+        for field in ("people", "property", "period"):
+            if row.get(field):
+                attrs.append((f"{field}-{_text(row[field])}", _text(row[field])))
+        if row.get("province"):
+            attrs.append((f"province-{_text(row['province'])}", f"省份{_text(row['province'])}"))
+        for field in ("city", "county"):
+            if row.get(field):
+                attrs.append((f"{field}-{_text(row[field])}", _text(row[field])))
+    elif name == "scenic":
+        for field in ("sight_level", "place"):
+            if row.get(field):
+                attrs.append((f"{field}-{_text(row[field])}", _text(row[field])))
+        if row.get("score"):
+            score = math.floor(float(row["score"]))
+            attrs.append((f"score-{score}", f"评分{score}"))
+        if row.get("price") is not None:
+            charged = float(row["price"]) > 0
+            attrs.append((f"price-{'收费' if charged else '免费'}", "收费景点" if charged else "免费景点"))
+    return attrs
+
+
+class GraphBuilder:
+    """按 graphBuilder.ts 的顺序逐个添加节点和边，节点 id 为整数下标"""
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.keys: List[str] = []
+        self.labels: List[str] = []
+        self.types: List[int] = []
+        self.record_ids: List[Optional[int]] = []
+        self.node_combos: List[int] = []
+        self.combo_keys: List[str] = []
+        self.combo_labels: List[str] = []
+        self.combo_types: List[int] = []
+        self.edges: List[int] = []
+        self._index: Dict[str, int] = {}
+        self._edge_set = set()
+
+    def _add_node(self, key: str, label: str, type_code: int, record_id: Optional[int], combo: int) -> int:
+        node = self._index.get(key)
+        if node is not None:
+            return node
+        node = len(self.keys)
+        self._index[key] = node
+        self.keys.append(key)
+        self.labels.append(label)
+        self.types.append(type_code)
+        self.record_ids.append(record_id)
+        self.node_combos.append(combo)
+        return node
+
+    def _add_edge(self, source: int, target: int):
+        if (source, target) not in self._edge_set:
+            self._edge_set.add((source, target))
+            self.edges.append(source)
+            self.edges.append(target)
+
+    def add_record(self, name: str, row: dict):
+        node_type = NODE_TYPES[name]
+        type_code = TYPE_CODES[node_type]
+        center_key = f"{node_type}-{row['id']}"
+        combo = -1
+        if self.mode == "independent":
+            combo = len(self.combo_keys)
+            self.combo_keys.append(f"combo-{center_key}")
+            self.combo_labels.append(row.get("name"))
+            self.combo_types.append(type_code)
+
+        center = self._add_node(center_key, row.get("name"), type_code, row['id'], combo)
+        for key, label in attribute_nodes(name, row):
+            if self.mode == "independent":
+                key = f"{key}-{center_key}"
+            self._add_edge(center, self._add_node(key, label, type_code, None, combo))
+
+    def to_dict(self) -> dict:
+        graph = {
+            "mode": self.mode,
+            "node_types": list(NODE_TYPES.values()),
+            "node_count": len(self.keys),
+            "edge_count": len(self.edges) // 2,
+            "nodes": {
+                "keys": self.keys,
+                "labels": self.labels,
+                "types": self.types,
+                "record_ids": self.record_ids,
+            },
+            "edges": self.edges,
+        }
+        if self.mode == "independent":
+            graph["nodes"]["combos"] = self.node_combos
+            graph["combos"] = {
+                "keys": self.combo_keys,
+                "labels": self.combo_labels,
+                "types": self.combo_types,
+            }
+        return graph
+
+
+def build_graph(mode: str, filters: Dict[str, List[str]], bbox: Optional[BBox] = None,
+                types: Optional[Sequence[str]] = None, min_score: Optional[float] = None,
+                max_score: Optional[float] = None, limit: Optional[int] = None) -> Tuple[dict, Tuple[str, ...]]:
+    """
+    按筛选条件（与 /api/search 相同）构建图，limit 限制中心节点数量（按数据集顺序、id 升序截取）
+    返回 (图, 各数据集快照 ETag)
+    """
+    builder = GraphBuilder(mode)
+    remaining = limit
+    matched = filter_rows(filters, bbox, types, min_score, max_score)
+    for name, (snapshot, result) in matched.items():
+        positions = bitmap_to_positions(result)
+        if remaining is not None:
+            positions = positions[:remaining]
+            remaining -= len(positions)
+        for i in positions:
+            builder.add_record(name, snapshot.rows[i])
+    return builder.to_dict(), tuple(snapshot.etag for snapshot, _ in matched.values())
+
+
+class GraphCache:
+    """按 (模式, 筛选条件, 各数据集快照版本) 缓存预先序列化的图"""
+
+    def __init__(self, size: int = GRAPH_CACHE_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, Tuple[bytes, str]]" = OrderedDict()
+
+    def get(self, mode: str, filters: Dict[str, List[str]], bbox: Optional[BBox] = None,
+            types: Optional[Sequence[str]] = None, min_score: Optional[float] = None,
+            max_score: Optional[float] = None, limit: Optional[int] = None) -> Tuple[bytes, str]:
+        """返回 (响应体, ETag)"""
+        etags = tuple(snapshots.get(name).etag for name in DATASETS)
+        key = (
+            etags, mode,
+            tuple(sorted((param, tuple(sorted(values))) for param, values in filters.items() if values)),
+            bbox, tuple(sorted(types)) if types else None, min_score, max_score, limit,
+        )
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+
+        graph, built_etags = build_graph(mode, filters, bbox, types, min_score, max_score, limit)
+        body = dump_json({"success": True, "data": graph})
+        entry = (body, '"' + hashlib.sha1(body).hexdigest() + '"')
+        # 构建期间数据集刷新时，按实际使用的快照版本缓存
+        key = (built_etags,) + key[1:]
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return entry
+
+
+graph_cache = GraphCache()
+
+
+# 邻居扩展时经过的共享属性（景点没有作者、朝代、行政区字段，通过 place 与其他景点相连）
+NEIGHBOR_KINDS = ("author", "dynasty", "city", "county", "province", "place")
+# 属性节点默认最多展开的记录数（“唐”“四川”等热门属性）
+DEFAULT_MAX_DEGREE = 50
+
+
+class AdjacencyIndex:
+    """
+    记录与共享属性组成的二部图，以 CSR 数组保存
+    记录节点按数据集顺序、id 升序编号；属性节点编号从 0 开始单独计数
+    """
+
+    def __init__(self, rows_by_dataset: Dict[str, List[dict]], kinds: Sequence[str] = NEIGHBOR_KINDS):
+        self.datasets = list(rows_by_dataset)
+        # 数据集 -> 记录节点编号范围 [start, end)
+        self.ranges: Dict[str, Tuple[int, int]] = {}
+        self.record_ids = array("q")
+        self.record_names: List[str] = []
+        self.record_datasets = array("B")
+        self.attr_keys: List[str] = []
+        self.attr_labels: List[str] = []
+
+        attr_index: Dict[str, int] = {}
+        record_attrs: List[List[int]] = []
+        for code, (name, rows) in enumerate(rows_by_dataset.items()):
+            start = len(self.record_ids)
+            for row in rows:
+                attrs = []
+                for key, label in attribute_nodes(name, row):
+                    if key.split("-", 1)[0] not in kinds:
+                        continue
+                    attr = attr_index.get(key)
+                    if attr is None:
+                        attr = attr_index[key] = len(self.attr_keys)
+                        self.attr_keys.append(key)
+                        self.attr_labels.append(label)
+                    attrs.append(attr)
+                record_attrs.append(attrs)
+                self.record_ids.append(row['id'])
+                self.record_names.append(row.get('name'))
+                self.record_datasets.append(code)
+            self.ranges[name] = (start, len(self.record_ids))
+
+        # 记录 -> 属性
+        self.record_ptr = array("I", [0])
+        self.record_attrs = array("I")
+        attr_records: List[List[int]] = [[] for _ in self.attr_keys]
+        for record, attrs in enumerate(record_attrs):
+            self.record_attrs.extend(attrs)
+            self.record_ptr.append(len(self.record_attrs))
+            for attr in attrs:
+                attr_records[attr].append(record)
+
+        # 属性 -> 记录（记录编号升序）
+        self.attr_ptr = array("I", [0])
+        self.attr_records = array("I")
+        for records in attr_records:
+            self.attr_records.extend(records)
+            self.attr_ptr.append(len(self.attr_records))
+
+    def record_node(self, name: str, record_id: int) -> Optional[int]:
+        """(数据集, id) -> 记录节点编号"""
+        if name not in self.ranges:
+            return None
+        start, end = self.ranges[name]
+        pos = bisect.bisect_left(self.record_ids, record_id, start, end)
+        return pos if pos < end and self.record_ids[pos] == record_id else None
+
+    def degree(self, attr: int) -> int:
+        return self.attr_ptr[attr + 1] - self.attr_ptr[attr]
+
+    def expand(self, start: int, hops: int, max_degree: int, max_records: int,
+               kinds: Optional[Sequence[str]] = None) -> dict:
+        """
+        从记录节点 start 出发，经共享属性扩展 hops 层
+        每个属性节点最多展开 max_degree 条记录，结果最多 max_records 条记录；
+        每层的代价与展开的度数成正比，与数据集大小无关
+        """
+        record_hops: Dict[int, int] = {start: 0}
+        attr_nodes: Dict[int, int] = {}
+        edges: List[Tuple[int, int]] = []
+        edge_set = set()
+        truncated = False
+        frontier = [start]
+
+        for hop in range(1, hops + 1):
+            next_frontier = []
+            for record in frontier:
+                for attr in self.record_attrs[self.record_ptr[record]:self.record_ptr[record + 1]]:
+                    if kinds and self.attr_keys[attr].split("-", 1)[0] not in kinds:
+                        continue
+                    if (record, attr) not in edge_set:
+                        edge_set.add((record, attr))
+                        edges.append((record, attr))
+                    if attr in attr_nodes:
+                        continue
+                    attr_nodes[attr] = hop
+                    begin = self.attr_ptr[attr]
+                    end = min(self.attr_ptr[attr + 1], begin + max_degree)
+                    for neighbor in self.attr_records[begin:end]:
+                        if neighbor not in record_hops:
+                            if len(record_hops) >= max_records:
+                                truncated = True
+                                break
+                            record_hops[neighbor] = hop
+                            next_frontier.append(neighbor)
+                        if (neighbor, attr) not in edge_set:
+                            edge_set.add((neighbor, attr))
+                            edges.append((neighbor, attr))
+            frontier = next_frontier
+            if not frontier:
+                break
+
+        # 以 graphBuilder.ts network 模式的节点 id 返回，便于前端直接合并到已有的图中
+        records = list(record_hops)
+        attrs = list(attr_nodes)
+        record_pos = {record: i for i, record in enumerate(records)}
+        attr_pos = {attr: len(records) + i for i, attr in enumerate(attrs)}
+        node_types = list(NODE_TYPES.values())
+        nodes = [
+            {
+                "key": f"{node_types[self.record_datasets[r]]}-{self.record_ids[r]}",
+                "label": self.record_names[r],
+                "type": node_types[self.record_datasets[r]],
+                "dataset": self.datasets[self.record_datasets[r]],
+                "id": self.record_ids[r],
+                "hop": record_hops[r],
+            }
+            for r in records
+        ]
+        nodes.extend(
+            {
+                "key": self.attr_keys[a],
+                "label": self.attr_labels[a],
+                "type": "attribute",
+                "kind": self.attr_keys[a].split("-", 1)[0],
+                "degree": self.degree(a),
+                "truncated": self.degree(a) > max_degree,
+                "hop": attr_nodes[a],
+            }
+            for a in attrs
+        )
+        flat_edges = []
+        for record, attr in edges:
+            flat_edges.append(record_pos[record])
+            flat_edges.append(attr_pos[attr])
+        return {
+            "node_count": len(nodes),
+            "edge_count": len(edges),
+            "truncated": truncated,
+            "nodes": nodes,
+            "edges": flat_edges,
+        }
+
+
+class AdjacencyCache:
+    """按四个数据集快照的版本缓存邻接索引"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entry: Optional[Tuple[Tuple[str, ...], AdjacencyIndex]] = None
+
+    def get(self) -> AdjacencyIndex:
+        current = {name: snapshots.get(name) for name in DATASETS}
+        key = tuple(snapshot.etag for snapshot in current.values())
+        entry = self._entry
+        if entry is not None and entry[0] == key:
+            return entry[1]
+
+        with self._lock:
+            entry = self._entry
+            if entry is None or entry[0] != key:
+                entry = (key, AdjacencyIndex({name: s.rows for name, s in current.items()}))
+                self._entry = entry
+            return entry[1]
+
+
+adjacency_index = AdjacencyCache()
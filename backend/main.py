@@ -1,23 +1,100 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from typing import List, Dict, Any
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
+from typing import List, Dict, Any, Optional
+import bisect
 import hashlib
+import threading
 from datetime import datetime
 
+# 导入数据库连接池
+from db import (
+    POOL_RETRY_AFTER, PoolTimeoutError, init_pool, close_pool, get_db_connection, release_db_connection,
+    get_pool_stats
+)
+# 导入异步数据库访问层
+import async_db
+from async_db import init_async_pool, close_async_pool, get_async_pool_stats
+# 导入基础数据快照缓存
+from datasets import DATASETS, MAX_BATCH_IDS, snapshots, SNAPSHOT_LOADERS, dataset_response, fetch_by_ids, get_id_list
+from cache import cached_response, derive_etag, dump_json, snapshot_response
+from spatial import parse_bbox
+# 导入点聚合
+from clusters import get_cluster_index
+# 导入周边查询
+from nearby import find_nearby
+# 导入筛选选项索引
+from facets import get_keyword_index
+# 导入分面筛选
+from search import search
+# 导入知识图谱构建
+from graph import DEFAULT_MAX_DEGREE, NEIGHBOR_KINDS, adjacency_index, graph_cache
+# 导入全文检索
+from textsearch import text_search, warm_text_indexes
+# 导入输入提示
+from autocomplete import SUGGEST_SOURCES, autocomplete_index
+
 # 导入路线 API 模块
 from routes_api import router as routes_router
+from route_store import init_route_schema
 # 导入用户行为 API 模块
 from actions_api import router as actions_router
+# 导入矢量瓦片模块
+from tiles import router as tiles_router
+# 导入高程服务模块
+from elevation import router as elevation_router
+
+def warm_indexes():
+    """预先构建全文索引和输入提示索引（在后台线程中调用）"""
+    warm_text_indexes()
+    try:
+        autocomplete_index.get()
+    except Exception as e:
+        print(f"预建输入提示索引失败: {e}")
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用启动时创建数据库连接池（同步 + 异步），关闭时释放"""
+    # 数据库暂不可用时不阻止服务启动，首次请求时会重新尝试创建连接池
+    try:
+        init_pool()
+    except Exception as e:
+        print(f"创建数据库连接池失败: {e}")
+    try:
+        init_route_schema()
+    except Exception as e:
+        print(f"检查路线表结构失败: {e}")
+    try:
+        await init_async_pool()
+    except Exception as e:
+        print(f"创建异步数据库连接池失败: {e}")
+    # 全文索引、输入提示索引构建需要数秒，在后台预先构建
+    threading.Thread(target=warm_indexes, daemon=True).start()
+    yield
+    await close_async_pool()
+    close_pool()
+
+app = FastAPI(lifespan=lifespan)
+
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    """连接池耗尽是暂时性的过载，返回 503 并提示客户端稍后重试"""
+    return JSONResponse(
+        status_code=503,
+        content={"success": False, "error": str(exc)},
+        headers={"Retry-After": str(POOL_RETRY_AFTER)}
+    )
 
 # 注册路线 API 路由
 app.include_router(routes_router)
 # 注册用户行为 API 路由
 app.include_router(actions_router)
+# 注册矢量瓦片路由
+app.include_router(tiles_router)
+# 注册高程服务路由
+app.include_router(elevation_router)
 
 # 配置 CORS，允许前端访问
 app.add_middleware(
@@ -37,19 +114,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 数据库连接配置（本地连接）
-DB_CONFIG = {
-    "host": "localhost",
-    "port": 5432,
-    "dbname": "shudao",
-    "user": "postgres",
-    "password": "123456"  # 修改为你的实际密码
-}
-
-def get_db_connection():
-    """获取数据库连接"""
-    return psycopg2.connect(**DB_CONFIG, cursor_factory=RealDictCursor)
-
 # ==================== 用户认证相关 ====================
 
 class UserRegister(BaseModel):
@@ -60,6 +124,15 @@ class UserLogin(BaseModel):
     username: str
     password: str
 
+class BatchRequest(BaseModel):
+    ids: List[int] = Field(..., max_length=MAX_BATCH_IDS)
+
+class MixedBatchRequest(BaseModel):
+    poems: List[int] = Field(default_factory=list, max_length=MAX_BATCH_IDS)
+    heritage: List[int] = Field(default_factory=list, max_length=MAX_BATCH_IDS)
+    history: List[int] = Field(default_factory=list, max_length=MAX_BATCH_IDS)
+    scenic: List[int] = Field(default_factory=list, max_length=MAX_BATCH_IDS)
+
 def hash_password(password: str) -> str:
     """使用 SHA256 加密密码"""
     return hashlib.sha256(password.encode()).hexdigest()
@@ -105,7 +178,7 @@ def register_user(user: UserRegister):
             }
         }
 
-    except HTTPException:
+    except (HTTPException, PoolTimeoutError):
         raise
     except Exception as e:
         conn.rollback()
@@ -116,28 +189,23 @@ def register_user(user: UserRegister):
 
     finally:
         cursor.close()
-        conn.close()
+        release_db_connection(conn)
 
 @app.post("/api/auth/login")
-def login_user(user: UserLogin):
-    """用户登录"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
+async def login_user(user: UserLogin):
+    """用户登录（只读查询，通过异步数据访问层执行，不占用线程池）"""
     try:
         # 1. 查询用户
         hashed_password = hash_password(user.password)
-        cursor.execute(
+        user_data = await async_db.fetch_one(
             """
             SELECT id, username, avatar_url, create_time, role_id
             FROM users.users
-            WHERE username = %s AND password = %s
+            WHERE username = $1 AND password = $2
             """,
-            (user.username, hashed_password)
+            user.username, hashed_password
         )
 
-        user_data = cursor.fetchone()
-
         if not user_data:
             raise HTTPException(status_code=401, detail="用户名或密码错误")
 
@@ -153,7 +221,7 @@ def login_user(user: UserLogin):
             }
         }
 
-    except HTTPException:
+    except (HTTPException, PoolTimeoutError):
         raise
     except Exception as e:
         print(f"Error logging in: {e}")
@@ -161,75 +229,70 @@ def login_user(user: UserLogin):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"登录失败: {str(e)}")
 
-    finally:
-        cursor.close()
-        conn.close()
-
 # ==================== 数据API ====================
 
 @app.get("/")
 def read_root():
     return {"message": "蜀道数据可视化 API 服务运行中"}
 
+@app.get("/api/stats/db")
+def get_db_stats():
+    """数据库连接池使用情况（用于调整连接池大小）"""
+    return {
+        "success": True,
+        "data": {
+            "sync": get_pool_stats(),
+            "async": get_async_pool_stats()
+        }
+    }
+
+@app.get("/api/stats/cache")
+def get_cache_stats():
+    """数据快照缓存命中情况"""
+    return {
+        "success": True,
+        "data": snapshots.stats()
+    }
+
+@app.post("/api/cache/invalidate")
+def invalidate_cache(dataset: Optional[str] = None):
+    """
+    使数据快照失效（数据更新后调用），下次请求时重新从数据库加载
+    不指定 dataset 时使全部数据集失效
+    """
+    if dataset is not None and dataset not in SNAPSHOT_LOADERS:
+        raise HTTPException(status_code=404, detail=f"未知数据集: {dataset}")
+    snapshots.invalidate(dataset)
+    return {
+        "success": True,
+        "message": f"已使 {dataset or '全部数据集'} 的缓存失效"
+    }
+
 @app.get("/api/poems")
-def get_poems():
+def get_poems(
+    request: Request,
+    bbox: Optional[str] = None,
+    zoom: Optional[float] = Query(None, ge=0, le=24),
+    fields: Optional[str] = None,
+    lite: bool = False,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=10000),
+    output_format: str = Query("json", alias="format", pattern="^(json|ndjson)$")
+):
     """
     获取所有诗词数据及其对应的地理位置（经纬度）
     直接从 poems 表读取 latitude 和 longitude 字段
+    结果来自内存快照（已预先序列化），过期或失效后才重新查询数据库
+    响应带 ETag，客户端带 If-None-Match 且内容未变化时返回 304
+    bbox=minLon,minLat,maxLon,maxLat 只返回视野内的要素，zoom 为地图缩放级别（低缩放级别时抽稀）
+    fields=id,name,... 只返回指定字段，lite=true 只返回地图展示所需字段
+    after_id + limit 为按 id 的游标分页，format=ndjson 时以 NDJSON 流式返回
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
     try:
-        # 直接查询诗词表，过滤掉无效的经纬度值
-        query = """
-        SELECT
-            id,
-            name,
-            author,
-            dynasty,
-            content,
-            keywords,
-            poemtype,
-            city,
-            county,
-            province,
-            longitude,
-            latitude
-        FROM poems.poems
-        WHERE longitude IS NOT NULL
-          AND latitude IS NOT NULL
-          AND longitude <> 'NaN'::float
-          AND latitude <> 'NaN'::float
-          AND longitude BETWEEN -180 AND 180
-          AND latitude BETWEEN -90 AND 90
-        ORDER BY id;
-        """
-
-        cursor.execute(query)
-        poems = cursor.fetchall()
-
-        # 转换为字典列表，并再次验证数值有效性
-        result = []
-        for poem in poems:
-            poem_dict = dict(poem)
-            # 确保经纬度是有效数值
-            try:
-                lon = float(poem_dict['longitude'])
-                lat = float(poem_dict['latitude'])
-                # 检查是否为有限数值
-                if -180 <= lon <= 180 and -90 <= lat <= 90:
-                    result.append(poem_dict)
-            except (ValueError, TypeError):
-                # 跳过无效数据
-                continue
-
-        return {
-            "success": True,
-            "count": len(result),
-            "data": result
-        }
+        return dataset_response(request, "poems", bbox, zoom, fields, lite, after_id, limit, output_format)
 
+    except (HTTPException, PoolTimeoutError):
+        raise
     except Exception as e:
         print(f"Error querying poems: {e}")
         import traceback
@@ -240,10 +303,6 @@ def get_poems():
             "data": []
         }
 
-    finally:
-        cursor.close()
-        conn.close()
-
 @app.get("/api/poems/{poem_id}")
 def get_poem_by_id(poem_id: int):
     """
@@ -286,6 +345,8 @@ def get_poem_by_id(poem_id: int):
                 "error": "Poem not found"
             }
 
+    except PoolTimeoutError:
+        raise
     except Exception as e:
         print(f"Error querying poem: {e}")
         return {
@@ -295,59 +356,102 @@ def get_poem_by_id(poem_id: int):
 
     finally:
         cursor.close()
-        conn.close()
+        release_db_connection(conn)
 
 @app.get("/api/heritage")
-def get_heritage():
+def get_heritage(
+    request: Request,
+    bbox: Optional[str] = None,
+    zoom: Optional[float] = Query(None, ge=0, le=24),
+    fields: Optional[str] = None,
+    lite: bool = False,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=10000),
+    output_format: str = Query("json", alias="format", pattern="^(json|ndjson)$")
+):
     """
     获取所有非遗数据及其对应的地理位置（经纬度）
+    结果来自内存快照（已预先序列化），过期或失效后才重新查询数据库
+    响应带 ETag，客户端带 If-None-Match 且内容未变化时返回 304
+    bbox=minLon,minLat,maxLon,maxLat 只返回视野内的要素，zoom 为地图缩放级别（低缩放级别时抽稀）
+    fields=id,name,... 只返回指定字段，lite=true 只返回地图展示所需字段
+    after_id + limit 为按 id 的游标分页，format=ndjson 时以 NDJSON 流式返回
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
     try:
-        query = """
-        SELECT
-            id,
-            name,
-            rx_time,
-            content,
-            province,
-            type,
-            longitude,
-            latitude
-        FROM heritage.heritage
-        WHERE longitude IS NOT NULL
-          AND latitude IS NOT NULL
-          AND longitude <> 'NaN'::float
-          AND latitude <> 'NaN'::float
-          AND longitude BETWEEN -180 AND 180
-          AND latitude BETWEEN -90 AND 90
-        ORDER BY id;
-        """
+        return dataset_response(request, "heritage", bbox, zoom, fields, lite, after_id, limit, output_format)
 
-        cursor.execute(query)
-        items = cursor.fetchall()
+    except (HTTPException, PoolTimeoutError):
+        raise
+    except Exception as e:
+        print(f"Error querying heritage: {e}")
+        import traceback
+        traceback.print_exc()
+        return {
+            "success": False,
+            "error": str(e),
+            "data": []
+        }
 
-        result = []
-        for item in items:
-            item_dict = dict(item)
-            try:
-                lon = float(item_dict['longitude'])
-                lat = float(item_dict['latitude'])
-                if -180 <= lon <= 180 and -90 <= lat <= 90:
-                    result.append(item_dict)
-            except (ValueError, TypeError):
-                continue
+@app.get("/api/history")
+def get_history(
+    request: Request,
+    bbox: Optional[str] = None,
+    zoom: Optional[float] = Query(None, ge=0, le=24),
+    fields: Optional[str] = None,
+    lite: bool = False,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=10000),
+    output_format: str = Query("json", alias="format", pattern="^(json|ndjson)$")
+):
+    """
+    获取所有历史数据及其对应的地理位置（经纬度）
+    结果来自内存快照（已预先序列化），过期或失效后才重新查询数据库
+    响应带 ETag，客户端带 If-None-Match 且内容未变化时返回 304
+    bbox=minLon,minLat,maxLon,maxLat 只返回视野内的要素，zoom 为地图缩放级别（低缩放级别时抽稀）
+    fields=id,name,... 只返回指定字段，lite=true 只返回地图展示所需字段
+    after_id + limit 为按 id 的游标分页，format=ndjson 时以 NDJSON 流式返回
+    """
+    try:
+        return dataset_response(request, "history", bbox, zoom, fields, lite, after_id, limit, output_format)
 
+    except (HTTPException, PoolTimeoutError):
+        raise
+    except Exception as e:
+        print(f"Error querying history: {e}")
+        import traceback
+        traceback.print_exc()
         return {
-            "success": True,
-            "count": len(result),
-            "data": result
+            "success": False,
+            "error": str(e),
+            "data": []
         }
 
+@app.get("/api/scenic")
+def get_scenic(
+    request: Request,
+    bbox: Optional[str] = None,
+    zoom: Optional[float] = Query(None, ge=0, le=24),
+    fields: Optional[str] = None,
+    lite: bool = False,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=10000),
+    output_format: str = Query("json", alias="format", pattern="^(json|ndjson)$")
+):
+    """
+    获取所有景点数据及其对应的地理位置（经纬度）
+    结果来自内存快照（已预先序列化），过期或失效后才重新查询数据库
+    响应带 ETag，客户端带 If-None-Match 且内容未变化时返回 304
+    bbox=minLon,minLat,maxLon,maxLat 只返回视野内的要素，zoom 为地图缩放级别（低缩放级别时抽稀）
+    fields=id,name,... 只返回指定字段，lite=true 只返回地图展示所需字段
+    after_id + limit 为按 id 的游标分页，format=ndjson 时以 NDJSON 流式返回
+    """
+    try:
+        return dataset_response(request, "scenic", bbox, zoom, fields, lite, after_id, limit, output_format)
+
+    except (HTTPException, PoolTimeoutError):
+        raise
     except Exception as e:
-        print(f"Error querying heritage: {e}")
+        print(f"Error querying scenic: {e}")
         import traceback
         traceback.print_exc()
         return {
@@ -356,250 +460,454 @@ def get_heritage():
             "data": []
         }
 
-    finally:
-        cursor.close()
-        conn.close()
-
-@app.get("/api/history")
-def get_history():
+@app.post("/api/batch")
+def get_mixed_batch(batch: MixedBatchRequest):
     """
-    获取所有历史数据及其对应的地理位置（经纬度）
+    一次请求批量获取多种类型的记录（用于知识图谱展开邻居节点）
+    每种类型只执行一条查询，结果按类型和 id 分组
     """
     conn = get_db_connection()
     cursor = conn.cursor()
 
     try:
-        query = """
-        SELECT
-            id,
-            name,
-            people,
-            description,
-            province,
-            property,
-            city,
-            county,
-            period,
-            longitude,
-            latitude
-        FROM history.history
-        WHERE longitude IS NOT NULL
-          AND latitude IS NOT NULL
-          AND longitude <> 'NaN'::float
-          AND latitude <> 'NaN'::float
-          AND longitude BETWEEN -180 AND 180
-          AND latitude BETWEEN -90 AND 90
-        ORDER BY id;
-        """
-
-        cursor.execute(query)
-        items = cursor.fetchall()
-
-        result = []
-        for item in items:
-            item_dict = dict(item)
-            try:
-                lon = float(item_dict['longitude'])
-                lat = float(item_dict['latitude'])
-                if -180 <= lon <= 180 and -90 <= lat <= 90:
-                    result.append(item_dict)
-            except (ValueError, TypeError):
-                continue
+        data = {}
+        missing = {}
+        for name in DATASETS:
+            ids = getattr(batch, name)
+            found = fetch_by_ids(cursor, name, ids)
+            data[name] = {str(k): v for k, v in found.items()}
+            missing[name] = [i for i in dict.fromkeys(ids) if i not in found]
 
         return {
             "success": True,
-            "count": len(result),
-            "data": result
+            "data": data,
+            "missing": missing
         }
 
+    except PoolTimeoutError:
+        raise
     except Exception as e:
-        print(f"Error querying history: {e}")
+        print(f"Error querying mixed batch: {e}")
         import traceback
         traceback.print_exc()
         return {
             "success": False,
-            "error": str(e),
-            "data": []
+            "error": str(e)
         }
 
     finally:
         cursor.close()
-        conn.close()
+        release_db_connection(conn)
 
-@app.get("/api/scenic")
-def get_scenic():
+@app.post("/api/{dataset}/batch")
+def get_batch(dataset: str, batch: BatchRequest):
     """
-    获取所有景点数据及其对应的地理位置（经纬度）
+    按 id 批量获取诗词 / 非遗 / 历史 / 景点详情
+    一条 = ANY 查询取回全部记录，结果以 id 为键
     """
+    if dataset not in DATASETS:
+        raise HTTPException(status_code=404, detail=f"未知数据集: {dataset}")
+
     conn = get_db_connection()
     cursor = conn.cursor()
 
     try:
-        query = """
-        SELECT
-            id,
-            name,
-            description,
-            place,
-            score,
-            sight_level,
-            price,
-            longitude,
-            latitude,
-            recommend_reason,
-            comment
-        FROM scenic.scenic
-        WHERE longitude IS NOT NULL
-          AND latitude IS NOT NULL
-          AND longitude <> 'NaN'::float
-          AND latitude <> 'NaN'::float
-          AND longitude BETWEEN -180 AND 180
-          AND latitude BETWEEN -90 AND 90
-        ORDER BY id;
-        """
+        found = fetch_by_ids(cursor, dataset, batch.ids)
+        return {
+            "success": True,
+            "count": len(found),
+            "data": {str(k): v for k, v in found.items()},
+            "missing": [i for i in dict.fromkeys(batch.ids) if i not in found]
+        }
+
+    except PoolTimeoutError:
+        raise
+    except Exception as e:
+        print(f"Error querying {dataset} batch: {e}")
+        import traceback
+        traceback.print_exc()
+        return {
+            "success": False,
+            "error": str(e)
+        }
 
-        cursor.execute(query)
-        items = cursor.fetchall()
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+@app.get("/api/clusters/{dataset}")
+def get_clusters(
+    request: Request,
+    dataset: str,
+    zoom: float = Query(..., ge=0, le=24),
+    bbox: Optional[str] = None
+):
+    """
+    获取某个数据集在指定缩放级别下的点聚合结果
+    用于低缩放级别（省级视野）下替代前端聚合，每个聚合返回中心点、数量和代表要素 id
+    """
+    if dataset not in DATASETS:
+        raise HTTPException(status_code=404, detail=f"未知数据集: {dataset}")
 
-        result = []
-        for item in items:
-            item_dict = dict(item)
-            try:
-                lon = float(item_dict['longitude'])
-                lat = float(item_dict['latitude'])
-                if -180 <= lon <= 180 and -90 <= lat <= 90:
-                    result.append(item_dict)
-            except (ValueError, TypeError):
-                continue
+    try:
+        snapshot = snapshots.get(dataset)
+        box = parse_bbox(bbox)
+        clusters = get_cluster_index(snapshot).query(zoom, box)
+        body = dump_json({
+            "success": True,
+            "count": len(clusters),
+            "data": [cluster.to_dict() for cluster in clusters]
+        })
+        return cached_response(request, body, derive_etag(snapshot.etag, "clusters", zoom, box))
+
+    except (HTTPException, PoolTimeoutError):
+        raise
+    except Exception as e:
+        print(f"Error querying clusters: {e}")
+        import traceback
+        traceback.print_exc()
+        return {
+            "success": False,
+            "error": str(e),
+            "data": []
+        }
+
+@app.get("/api/nearby")
+def get_nearby(
+    scenic_id: Optional[int] = None,
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    radius_km: float = Query(10, gt=0, le=500),
+    limit: int = Query(10, ge=1, le=200),
+    types: Optional[List[str]] = Query(None)
+):
+    """
+    周边查询：以景点（scenic_id）或任意坐标（lon、lat）为中心，
+    返回半径 radius_km 公里内每类最近的 limit 个诗词、非遗、历史事件和景点，按距离升序
+    """
+    if types:
+        unknown = set(types) - set(DATASETS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"未知数据集: {', '.join(sorted(unknown))}")
+    if scenic_id is None and (lon is None or lat is None):
+        raise HTTPException(status_code=400, detail="需要提供 scenic_id 或 lon、lat")
+
+    try:
+        origin = None
+        if scenic_id is not None:
+            snapshot = snapshots.get("scenic")
+            ids = get_id_list(snapshot)
+            pos = bisect.bisect_left(ids, scenic_id)
+            if pos == len(ids) or ids[pos] != scenic_id:
+                raise HTTPException(status_code=404, detail="景点不存在")
+            lon = float(snapshot.rows[pos]['longitude'])
+            lat = float(snapshot.rows[pos]['latitude'])
+            origin = ("scenic", scenic_id)
 
         return {
             "success": True,
-            "count": len(result),
-            "data": result
+            "center": {"longitude": lon, "latitude": lat},
+            "radius_km": radius_km,
+            "data": find_nearby(lon, lat, radius_km, limit, types, origin)
         }
 
+    except (HTTPException, PoolTimeoutError):
+        raise
     except Exception as e:
-        print(f"Error querying scenic: {e}")
+        print(f"Error querying nearby items: {e}")
         import traceback
         traceback.print_exc()
         return {
             "success": False,
             "error": str(e),
-            "data": []
+            "data": {}
         }
 
-    finally:
-        cursor.close()
-        conn.close()
-
 @app.get("/api/filters/options")
-def get_filter_options():
+def get_filter_options(request: Request):
     """
     获取所有筛选字段的可选值
     用于知识图谱的高级筛选功能
+    结果来自内存快照（一条查询统计整张表），带 ETag，未变化时返回 304
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    try:
+        snapshot = snapshots.get("filter_options")
+        return snapshot_response(request, snapshot)
+
+    except PoolTimeoutError:
+        raise
+    except Exception as e:
+        print(f"Error getting filter options: {e}")
+        import traceback
+        traceback.print_exc()
+        return {
+            "success": False,
+            "error": str(e)
+        }
 
+@app.get("/api/keywords")
+def get_keywords(
+    prefix: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=1000)
+):
+    """
+    诗词关键词列表（基于关键词倒排索引）
+    不带 prefix 时返回出现次数最多的关键词，带 prefix 时返回前缀补全结果，均按出现次数降序
+    """
     try:
-        options = {}
-
-        # 1. 获取所有朝代（诗词）
-        cursor.execute("SELECT DISTINCT dynasty FROM poems.poems WHERE dynasty IS NOT NULL AND dynasty != '' ORDER BY dynasty")
-        options['dynasties'] = [row['dynasty'] for row in cursor.fetchall()]
-
-        # 2. 获取所有作者（诗词）
-        cursor.execute("SELECT DISTINCT author FROM poems.poems WHERE author IS NOT NULL AND author != '' ORDER BY author")
-        options['authors'] = [row['author'] for row in cursor.fetchall()]
-
-        # 3. 获取所有诗词类型
-        cursor.execute("SELECT DISTINCT poemtype FROM poems.poems WHERE poemtype IS NOT NULL AND poemtype != '' ORDER BY poemtype")
-        options['poemtypes'] = [row['poemtype'] for row in cursor.fetchall()]
-
-        # 4. 获取所有关键词（诗词）- 可能需要拆分
-        cursor.execute("SELECT DISTINCT keywords FROM poems.poems WHERE keywords IS NOT NULL AND keywords != '' LIMIT 100")
-        keywords_set = set()
-        for row in cursor.fetchall():
-            if row['keywords']:
-                # 假设关键词可能用逗号或空格分隔
-                keywords_set.update([k.strip() for k in str(row['keywords']).split(',') if k.strip()])
-        options['keywords'] = sorted(list(keywords_set))[:50]  # 限制数量
-
-        # 5. 获取所有非遗入选时间
-        cursor.execute("SELECT DISTINCT rx_time FROM heritage.heritage WHERE rx_time IS NOT NULL AND rx_time != '' ORDER BY rx_time")
-        options['rx_times'] = [row['rx_time'] for row in cursor.fetchall()]
-
-        # 6. 获取所有非遗类型
-        cursor.execute("SELECT DISTINCT type FROM heritage.heritage WHERE type IS NOT NULL AND type != '' ORDER BY type")
-        options['heritage_types'] = [row['type'] for row in cursor.fetchall()]
-
-        # 7. 获取所有历史人物
-        cursor.execute("SELECT DISTINCT people FROM history.history WHERE people IS NOT NULL AND people != '' ORDER BY people")
-        options['people'] = [row['people'] for row in cursor.fetchall()]
-
-        # 8. 获取所有历史时期
-        cursor.execute("SELECT DISTINCT period FROM history.history WHERE period IS NOT NULL AND period != '' ORDER BY period")
-        options['periods'] = [row['period'] for row in cursor.fetchall()]
-
-        # 9. 获取所有历史事件性质
-        cursor.execute("SELECT DISTINCT property FROM history.history WHERE property IS NOT NULL AND property != '' ORDER BY property")
-        options['properties'] = [row['property'] for row in cursor.fetchall()]
-
-        # 10. 获取所有景点等级
-        cursor.execute("SELECT DISTINCT sight_level FROM scenic.scenic WHERE sight_level IS NOT NULL AND sight_level != '' ORDER BY sight_level")
-        options['sight_levels'] = [row['sight_level'] for row in cursor.fetchall()]
-
-        # 11. 获取所有省份（从所有表汇总）
-        provinces_set = set()
-        cursor.execute("SELECT DISTINCT province FROM poems.poems WHERE province IS NOT NULL AND province != ''")
-        provinces_set.update([row['province'] for row in cursor.fetchall()])
-        cursor.execute("SELECT DISTINCT province FROM heritage.heritage WHERE province IS NOT NULL AND province != ''")
-        provinces_set.update([str(row['province']) for row in cursor.fetchall()])
-        cursor.execute("SELECT DISTINCT province FROM history.history WHERE province IS NOT NULL AND province != ''")
-        provinces_set.update([str(row['province']) for row in cursor.fetchall()])
-        options['provinces'] = sorted(list(provinces_set))
-
-        # 12. 获取所有城市
-        cities_set = set()
-        cursor.execute("SELECT DISTINCT city FROM poems.poems WHERE city IS NOT NULL AND city != ''")
-        cities_set.update([row['city'] for row in cursor.fetchall()])
-        cursor.execute("SELECT DISTINCT city FROM history.history WHERE city IS NOT NULL AND city != ''")
-        cities_set.update([row['city'] for row in cursor.fetchall()])
-        options['cities'] = sorted(list(cities_set))
-
-        # 13. 获取所有区县
-        counties_set = set()
-        cursor.execute("SELECT DISTINCT county FROM poems.poems WHERE county IS NOT NULL AND county != ''")
-        counties_set.update([row['county'] for row in cursor.fetchall()])
-        cursor.execute("SELECT DISTINCT county FROM history.history WHERE county IS NOT NULL AND county != ''")
-        counties_set.update([row['county'] for row in cursor.fetchall()])
-        options['counties'] = sorted(list(counties_set))
-
-        # 14. 获取评分范围（景点）
-        cursor.execute("SELECT MIN(score) as min_score, MAX(score) as max_score FROM scenic.scenic WHERE score IS NOT NULL")
-        score_range = cursor.fetchone()
-        options['score_range'] = {
-            'min': float(score_range['min_score']) if score_range['min_score'] else 0,
-            'max': float(score_range['max_score']) if score_range['max_score'] else 5
+        index = get_keyword_index()
+        keywords = index.complete(prefix, limit) if prefix else index.top(limit)
+        return {
+            "success": True,
+            "total": len(index.keywords),
+            "count": len(keywords),
+            "data": [{"keyword": k, "count": index.count(k)} for k in keywords]
         }
 
+    except PoolTimeoutError:
+        raise
+    except Exception as e:
+        print(f"Error querying keywords: {e}")
+        import traceback
+        traceback.print_exc()
+        return {
+            "success": False,
+            "error": str(e),
+            "data": []
+        }
+
+@app.get("/api/keywords/{keyword}/poems")
+def get_keyword_poems(keyword: str):
+    """获取包含某个关键词的全部诗词 id"""
+    try:
+        ids = get_keyword_index().poem_ids(keyword)
         return {
             "success": True,
-            "data": options
+            "keyword": keyword,
+            "count": len(ids),
+            "data": ids
         }
 
+    except PoolTimeoutError:
+        raise
     except Exception as e:
-        print(f"Error getting filter options: {e}")
+        print(f"Error querying keyword poems: {e}")
         import traceback
         traceback.print_exc()
         return {
             "success": False,
-            "error": str(e)
+            "error": str(e),
+            "data": []
         }
 
-    finally:
-        cursor.close()
-        conn.close()
+def search_filters(
+    dynasty: Optional[List[str]] = Query(None),
+    author: Optional[List[str]] = Query(None),
+    poemtype: Optional[List[str]] = Query(None),
+    province: Optional[List[str]] = Query(None),
+    city: Optional[List[str]] = Query(None),
+    county: Optional[List[str]] = Query(None),
+    heritage_type: Optional[List[str]] = Query(None),
+    rx_time: Optional[List[str]] = Query(None),
+    people: Optional[List[str]] = Query(None),
+    period: Optional[List[str]] = Query(None),
+    property: Optional[List[str]] = Query(None),
+    sight_level: Optional[List[str]] = Query(None)
+) -> Dict[str, List[str]]:
+    """/api/search 与 /api/graph 共用的筛选参数（同一参数可重复传入多个取值）"""
+    return {
+        "dynasty": dynasty, "author": author, "poemtype": poemtype,
+        "province": province, "city": city, "county": county,
+        "heritage_type": heritage_type, "rx_time": rx_time,
+        "people": people, "period": period, "property": property,
+        "sight_level": sight_level,
+    }
+
+def check_search_params(types: Optional[List[str]], score_min: Optional[float], score_max: Optional[float]):
+    if types:
+        unknown = set(types) - set(DATASETS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"未知数据集: {', '.join(sorted(unknown))}")
+    if score_min is not None and score_max is not None and score_min > score_max:
+        raise HTTPException(status_code=400, detail="score_min 不能大于 score_max")
+
+@app.get("/api/search")
+def search_items(
+    request: Request,
+    filters: Dict[str, List[str]] = Depends(search_filters),
+    score_min: Optional[float] = None,
+    score_max: Optional[float] = None,
+    bbox: Optional[str] = None,
+    types: Optional[List[str]] = Query(None),
+    counts: bool = True
+):
+    """
+    知识图谱的组合筛选，返回四个数据集中满足条件的 id
+    同一参数可重复传入多个取值（取值之间为“或”），不同参数之间为“且”；
+    counts=true 时同时返回筛选结果中各筛选字段取值的数量
+    """
+    check_search_params(types, score_min, score_max)
+
+    try:
+        box = parse_bbox(bbox)
+        payload, etags = search(filters, box, types, score_min, score_max, counts)
+        body = dump_json({"success": True, **payload})
+        etag = derive_etag("".join(etags), "search", sorted(request.query_params.multi_items()))
+        return cached_response(request, body, etag)
+
+    except (HTTPException, PoolTimeoutError):
+        raise
+    except Exception as e:
+        print(f"Error searching: {e}")
+        import traceback
+        traceback.print_exc()
+        return {
+            "success": False,
+            "error": str(e),
+            "data": {}
+        }
+
+@app.get("/api/graph")
+def get_graph(
+    request: Request,
+    mode: str = Query("network", pattern="^(network|independent)$"),
+    filters: Dict[str, List[str]] = Depends(search_filters),
+    score_min: Optional[float] = None,
+    score_max: Optional[float] = None,
+    bbox: Optional[str] = None,
+    types: Optional[List[str]] = Query(None),
+    limit: Optional[int] = Query(None, ge=1)
+):
+    """
+    在服务端构建知识图谱（与前端 graphBuilder.ts 的 buildGraphData 结构相同）
+    筛选参数与 /api/search 相同，limit 限制中心节点数量；
+    节点以列式数组返回，节点 id 为数组下标，edges 为 [源, 目标, 源, 目标, ...] 扁平数组
+    """
+    check_search_params(types, score_min, score_max)
+
+    try:
+        box = parse_bbox(bbox)
+        body, etag = graph_cache.get(mode, filters, box, types, score_min, score_max, limit)
+        return cached_response(request, body, etag)
+
+    except (HTTPException, PoolTimeoutError):
+        raise
+    except Exception as e:
+        print(f"Error building graph: {e}")
+        import traceback
+        traceback.print_exc()
+        return {
+            "success": False,
+            "error": str(e),
+            "data": {}
+        }
+
+@app.get("/api/graph/neighbors/{dataset}/{item_id}")
+def get_graph_neighbors(
+    dataset: str,
+    item_id: int,
+    k: int = Query(1, ge=1, le=3),
+    via: Optional[List[str]] = Query(None),
+    max_degree: int = Query(DEFAULT_MAX_DEGREE, ge=1, le=1000),
+    limit: int = Query(500, ge=1, le=5000)
+):
+    """
+    从一首诗词、一个非遗、历史事件或景点出发，经共享属性（作者、朝代、城市、区县、省份、地点）扩展 k 层邻居
+    via 限定经过的属性种类；max_degree 限制每个属性节点展开的记录数（如“唐”“四川”），
+    limit 限制返回的记录总数。节点 key 与 graphBuilder.ts network 模式一致，edges 为扁平的下标数组
+    """
+    if dataset not in DATASETS:
+        raise HTTPException(status_code=404, detail=f"未知数据集: {dataset}")
+    if via:
+        unknown = set(via) - set(NEIGHBOR_KINDS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"未知属性: {', '.join(sorted(unknown))}")
+
+    try:
+        index = adjacency_index.get()
+        start = index.record_node(dataset, item_id)
+        if start is None:
+            raise HTTPException(status_code=404, detail="记录不存在")
+        return {"success": True, "data": index.expand(start, k, max_degree, limit, via)}
+
+    except (HTTPException, PoolTimeoutError):
+        raise
+    except Exception as e:
+        print(f"Error expanding graph neighbors: {e}")
+        import traceback
+        traceback.print_exc()
+        return {
+            "success": False,
+            "error": str(e),
+            "data": {}
+        }
+
+@app.get("/api/search/text")
+def search_text(
+    q: str = Query(..., min_length=1),
+    types: Optional[List[str]] = Query(None),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100)
+):
+    """
+    全文检索诗词正文/名称、非遗内容、历史描述、景点介绍和评论
+    多个检索词用空格分隔（需全部命中），结果按相关度降序，highlights 中为带 <em> 标记的摘要
+    """
+    if types:
+        unknown = set(types) - set(DATASETS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"未知数据集: {', '.join(sorted(unknown))}")
+
+    try:
+        result = text_search(q, types, offset, limit)
+        return {"success": True, "query": q, **result}
+
+    except PoolTimeoutError:
+        raise
+    except Exception as e:
+        print(f"Error in text search: {e}")
+        import traceback
+        traceback.print_exc()
+        return {
+            "success": False,
+            "error": str(e),
+            "data": []
+        }
+
+@app.get("/api/autocomplete")
+def autocomplete(
+    q: str = Query(..., min_length=1, max_length=64),
+    category: Optional[List[str]] = Query(None),
+    limit: int = Query(10, ge=1, le=50)
+):
+    """
+    搜索框输入提示：诗词名、作者、非遗名、景点名、城市、区县的前缀补全
+    支持汉字、全拼（如 libai）和拼音首字母（如 lb），只读内存中的前缀数组
+    """
+    if category:
+        unknown = set(category) - set(SUGGEST_SOURCES)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"未知类别: {', '.join(sorted(unknown))}")
+
+    try:
+        suggestions = autocomplete_index.get().complete(q, limit, category)
+        return {
+            "success": True,
+            "count": len(suggestions),
+            "data": suggestions
+        }
+
+    except PoolTimeoutError:
+        raise
+    except Exception as e:
+        print(f"Error in autocomplete: {e}")
+        import traceback
+        traceback.print_exc()
+        return {
+            "success": False,
+            "error": str(e),
+            "data": []
+        }
 
 if __name__ == "__main__":
     import uvicorn
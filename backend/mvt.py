@@ -0,0 +1,116 @@
+"""
+mvt.py - Mapbox Vector Tile（MVT 2.1）点图层编码
+只实现点要素所需的部分，不依赖 protobuf 库
+规范：https://github.com/mapbox/vector-tile-spec/tree/master/2.1
+"""
+import math
+import struct
+from typing import Any, Dict, List, Sequence, Tuple
+
+EXTENT = 4096
+
+# protobuf 字段类型
+_VARINT = 0
+_LENGTH_DELIMITED = 2
+_FIXED64 = 1
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def _key(field: int, wire_type: int) -> bytes:
+    return _varint((field << 3) | wire_type)
+
+
+def _bytes_field(field: int, payload: bytes) -> bytes:
+    return _key(field, _LENGTH_DELIMITED) + _varint(len(payload)) + payload
+
+
+def _packed(field: int, values: Sequence[int]) -> bytes:
+    return _bytes_field(field, b"".join(_varint(v) for v in values))
+
+
+def _encode_value(value: Any) -> bytes:
+    """Tile.Value：字符串 / 浮点数 / 整数 / 布尔值"""
+    if isinstance(value, bool):
+        return _key(7, _VARINT) + _varint(int(value))
+    if isinstance(value, int):
+        if value >= 0:
+            return _key(5, _VARINT) + _varint(value)
+        return _key(6, _VARINT) + _varint(_zigzag(value))
+    if isinstance(value, float):
+        return _key(3, _FIXED64) + struct.pack("<d", value)
+    return _bytes_field(1, str(value).encode("utf-8"))
+
+
+def lonlat_to_tile(lon: float, lat: float, z: int, x: int, y: int, extent: int = EXTENT) -> Tuple[int, int]:
+    """经纬度转换为瓦片 (z, x, y) 内的坐标（Web 墨卡托，左上角为原点）"""
+    n = 2 ** z
+    lat = max(min(lat, 85.0511287798), -85.0511287798)
+    px = (lon + 180.0) / 360.0 * n
+    lat_rad = math.radians(lat)
+    py = (1.0 - math.log(math.tan(lat_rad) + 1.0 / math.cos(lat_rad)) / math.pi) / 2.0 * n
+    return int(round((px - x) * extent)), int(round((py - y) * extent))
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """瓦片的经纬度范围 (minLon, minLat, maxLon, maxLat)"""
+    n = 2 ** z
+
+    def lat(row: float) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return (x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y))
+
+
+def encode_point_layer(name: str, features: List[Tuple[int, int, int, Dict[str, Any]]],
+                       extent: int = EXTENT) -> bytes:
+    """
+    编码一个点图层
+    features 为 (要素 id, 瓦片内 x, 瓦片内 y, 属性字典) 列表
+    """
+    keys: Dict[str, int] = {}
+    values: Dict[Tuple[type, Any], int] = {}
+    encoded_features = []
+
+    for feature_id, px, py, properties in features:
+        tags = []
+        for k, v in properties.items():
+            if v is None or v == "":
+                continue
+            tags.append(keys.setdefault(k, len(keys)))
+            tags.append(values.setdefault((type(v), v), len(values)))
+
+        # MoveTo 命令，1 个点，坐标为相对 (0, 0) 的 zigzag 编码
+        geometry = [(1 & 0x7) | (1 << 3), _zigzag(px), _zigzag(py)]
+        feature = (
+            _key(1, _VARINT) + _varint(feature_id) +
+            (_packed(2, tags) if tags else b"") +
+            _key(3, _VARINT) + _varint(1) +
+            _packed(4, geometry)
+        )
+        encoded_features.append(_bytes_field(2, feature))
+
+    layer = (
+        _key(15, _VARINT) + _varint(2) +
+        _bytes_field(1, name.encode("utf-8")) +
+        b"".join(encoded_features) +
+        b"".join(_bytes_field(3, k.encode("utf-8")) for k in keys) +
+        b"".join(_bytes_field(4, _encode_value(v)) for (_, v) in values) +
+        _key(5, _VARINT) + _varint(extent)
+    )
+    # Tile.layers = 3
+    return _bytes_field(3, layer)
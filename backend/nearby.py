@@ -0,0 +1,72 @@
+"""
+nearby.py - 周边要素查询（“这个景点附近有什么”）
+每个数据集快照上缓存一份 NumPy 经纬度数组，查询时对整列做向量化 haversine，
+再用 argpartition 取半径范围内最近的若干个，不逐行扫描数据库
+"""
+import bisect
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from datasets import DATASETS, MAP_FIELDS, get_id_list, snapshots
+from geo import haversine_km
+
+
+class NearbyIndex:
+    """某个数据集快照的经纬度数组"""
+
+    def __init__(self, rows: List[dict]):
+        self.lons = np.array([float(row['longitude']) for row in rows], dtype=np.float64)
+        self.lats = np.array([float(row['latitude']) for row in rows], dtype=np.float64)
+
+    def query(self, lon: float, lat: float, radius_km: float, limit: int,
+              exclude: Optional[int] = None) -> List[Tuple[int, float]]:
+        """半径 radius_km 内最近的 limit 个要素 (行号, 距离)，按距离升序"""
+        if not len(self.lons):
+            return []
+        dist = haversine_km(lon, lat, self.lons, self.lats)
+        if exclude is not None:
+            dist[exclude] = np.inf
+        candidates = np.flatnonzero(dist <= radius_km)
+        if len(candidates) > limit:
+            # 先用 partition 找到第 limit 近的距离，只对不超过该距离的要素排序
+            kth = np.partition(dist[candidates], limit - 1)[limit - 1]
+            candidates = candidates[dist[candidates] <= kth]
+        # 稳定排序：距离相同时行号（id）小的在前
+        candidates = candidates[np.argsort(dist[candidates], kind="stable")][:limit]
+        return [(int(i), float(dist[i])) for i in candidates]
+
+
+def get_nearby_index(snapshot) -> NearbyIndex:
+    """获取快照对应的经纬度数组（随快照缓存）"""
+    return snapshot.derived("nearby_index", lambda s: NearbyIndex(s.rows))
+
+
+def _row_position(snapshot, item_id: int) -> Optional[int]:
+    """id 在快照中的行号，不存在时为 None"""
+    ids = get_id_list(snapshot)
+    pos = bisect.bisect_left(ids, item_id)
+    return pos if pos < len(ids) and ids[pos] == item_id else None
+
+
+def find_nearby(lon: float, lat: float, radius_km: float, limit: int,
+                types: Optional[Sequence[str]] = None,
+                origin: Optional[Tuple[str, int]] = None) -> Dict[str, List[dict]]:
+    """
+    各数据集中距离 (lon, lat) 最近的要素，每类最多 limit 个
+    origin 为 (数据集, id) 时结果中不包含该要素本身（在本次使用的快照中按 id 查找行号）
+    """
+    result = {}
+    for name in DATASETS:
+        if types and name not in types:
+            continue
+        snapshot = snapshots.get(name)
+        exclude = _row_position(snapshot, origin[1]) if origin is not None and origin[0] == name else None
+        items = []
+        for i, distance in get_nearby_index(snapshot).query(lon, lat, radius_km, limit, exclude):
+            row = snapshot.rows[i]
+            item = {field: row.get(field) for field in MAP_FIELDS[name]}
+            item["distance_km"] = round(distance, 3)
+            items.append(item)
+        result[name] = items
+    return result
@@ -0,0 +1,257 @@
+"""
+planner.py - 景点游览顺序规划
+在预先计算的距离矩阵上用最近邻构造初始路线，再用 2-opt 和 Or-opt 局部搜索改进；
+给出时间、门票预算或距离上限时，超出上限则按“评分 / 占用的资源”从低到高舍弃景点，
+之后再尝试把舍弃的景点按评分从高到低插回（定向越野问题的启发式）
+
+距离矩阵的第 0 个节点为起点、最后一个节点为终点，中间为景点：
+没有起点时起点到各点的距离为 0（从任意景点出发），不返回起点时各点到终点的距离为 0，
+两种情况都化为首尾固定的路径问题
+"""
+import time
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+# 默认平均行驶速度（公里/小时），距离为直线距离，速度应相应取得偏低
+DEFAULT_SPEED_KMH = 40.0
+# 默认每个景点的游览时间（分钟）
+DEFAULT_VISIT_MINUTES = 90.0
+# 默认及最大的优化时间（毫秒）
+DEFAULT_TIME_LIMIT_MS = 300
+MAX_TIME_LIMIT_MS = 5000
+# 一次规划的景点数上限
+MAX_PLAN_STOPS = 300
+# Or-opt 移动的最长景点段
+OR_OPT_MAX_SEGMENT = 3
+# 最近邻构造占优化时间的比例（没有起点时尝试从不同景点出发）
+CONSTRUCTION_SHARE = 0.3
+# 舍弃景点时，用量超出上限不到该比例才在每次舍弃后重新优化顺序
+REOPTIMIZE_EXCESS = 1.2
+
+EPS = 1e-9
+
+
+def plan_matrix(stop_dist: np.ndarray, start_dist: Optional[np.ndarray], return_to_start: bool) -> np.ndarray:
+    """
+    景点距离矩阵 (n, n) 及起点到各景点的距离 -> 首尾固定的 (n + 2, n + 2) 矩阵
+    start_dist 为 None 时不指定起点
+    """
+    n = len(stop_dist)
+    dist = np.zeros((n + 2, n + 2))
+    dist[1:n + 1, 1:n + 1] = stop_dist
+    if start_dist is not None:
+        dist[0, 1:n + 1] = start_dist
+        if return_to_start:
+            dist[1:n + 1, n + 1] = start_dist
+    return dist
+
+
+def path_length(path: Sequence[int], dist: np.ndarray) -> float:
+    p = np.asarray(path)
+    return float(dist[p[:-1], p[1:]].sum())
+
+
+def nearest_neighbour(dist: np.ndarray, stops: Sequence[int], first: Optional[int] = None) -> List[int]:
+    """最近邻构造：从起点（或 first 指定的第一个景点）出发，每次前往最近的未访问景点"""
+    end = len(dist) - 1
+    remaining = np.asarray(stops)
+    path = [0]
+    if first is not None:
+        path.append(first)
+        remaining = remaining[remaining != first]
+    while len(remaining):
+        k = int(np.argmin(dist[path[-1], remaining]))
+        path.append(int(remaining[k]))
+        remaining = np.delete(remaining, k)
+    path.append(end)
+    return path
+
+
+def construct(dist: np.ndarray, stops: Sequence[int], free_start: bool, deadline: float) -> List[int]:
+    """初始路线；没有起点时在时间允许的范围内从每个景点出发各构造一次，取最短的"""
+    best = nearest_neighbour(dist, stops)
+    if not free_start:
+        return best
+    best_length = path_length(best, dist)
+    for first in stops:
+        if time.perf_counter() > deadline:
+            break
+        path = nearest_neighbour(dist, stops, first)
+        length = path_length(path, dist)
+        if length < best_length - EPS:
+            best, best_length = path, length
+    return best
+
+
+def two_opt(path: np.ndarray, dist: np.ndarray, deadline: float) -> bool:
+    """2-opt：反转 path[i..j]，对每个 i 一次计算所有 j 的收益并采用最好的；返回是否有改进"""
+    m = len(path)
+    improved = False
+    for i in range(1, m - 2):
+        if time.perf_counter() > deadline:
+            break
+        j = np.arange(i + 1, m - 1)
+        a, b = path[i - 1], path[i]
+        delta = dist[a, path[j]] + dist[b, path[j + 1]] - dist[a, b] - dist[path[j], path[j + 1]]
+        k = int(np.argmin(delta))
+        if delta[k] < -EPS:
+            path[i:j[k] + 1] = path[i:j[k] + 1][::-1].copy()
+            improved = True
+    return improved
+
+
+def or_opt(path: np.ndarray, dist: np.ndarray, deadline: float) -> np.ndarray:
+    """
+    Or-opt：把连续 1~OR_OPT_MAX_SEGMENT 个景点（可反向）移到其他位置，采用每段最好的位置；
+    返回新的路径，没有改进时为原路径
+    """
+    for k in range(1, OR_OPT_MAX_SEGMENT + 1):
+        i = 1
+        while i + k <= len(path) - 1:
+            if time.perf_counter() > deadline:
+                return path
+            a, s0, s1, b = path[i - 1], path[i], path[i + k - 1], path[i + k]
+            gain = dist[a, s0] + dist[s1, b] - dist[a, b]
+            rest = np.concatenate((path[:i], path[i + k:]))
+            u, v = rest[:-1], rest[1:]
+            forward = dist[u, s0] + dist[s1, v] - dist[u, v]
+            backward = dist[u, s1] + dist[s0, v] - dist[u, v]
+            f, r = int(np.argmin(forward)), int(np.argmin(backward))
+            if min(forward[f], backward[r]) < gain - EPS:
+                if forward[f] <= backward[r]:
+                    pos, segment = f, path[i:i + k]
+                else:
+                    pos, segment = r, path[i:i + k][::-1]
+                path = np.concatenate((rest[:pos + 1], segment, rest[pos + 1:]))
+            i += 1
+    return path
+
+
+def improve(path: Sequence[int], dist: np.ndarray, deadline: float) -> List[int]:
+    """交替执行 2-opt 和 Or-opt，直到没有改进或超时"""
+    p = np.asarray(path)
+    while time.perf_counter() < deadline:
+        improved = two_opt(p, dist, deadline)
+        length = path_length(p, dist)
+        p = or_opt(p, dist, deadline)
+        if not improved and path_length(p, dist) >= length - EPS:
+            break
+    return p.tolist()
+
+
+class PlanLimits:
+    """路线的资源上限及计算方式（为 None 的上限不限制）"""
+
+    def __init__(self, max_hours: Optional[float] = None, max_budget: Optional[float] = None,
+                 max_distance_km: Optional[float] = None, speed_kmh: float = DEFAULT_SPEED_KMH,
+                 visit_minutes: float = DEFAULT_VISIT_MINUTES):
+        self.max_hours = max_hours
+        self.max_budget = max_budget
+        self.max_distance_km = max_distance_km
+        self.speed_kmh = speed_kmh
+        self.visit_hours = visit_minutes / 60
+
+    def usage(self, path: Sequence[int], dist: np.ndarray, prices: np.ndarray) -> dict:
+        distance = path_length(path, dist)
+        stops = len(path) - 2
+        return {
+            "distance": distance,
+            "travel_hours": distance / self.speed_kmh,
+            "visit_hours": stops * self.visit_hours,
+            "total_hours": distance / self.speed_kmh + stops * self.visit_hours,
+            "ticket_cost": float(prices[np.asarray(path)].sum()),
+        }
+
+    def violated(self, usage: dict) -> dict:
+        """超出的上限 -> 上限值"""
+        checks = (
+            ("hours", usage["total_hours"], self.max_hours),
+            ("budget", usage["ticket_cost"], self.max_budget),
+            ("distance", usage["distance"], self.max_distance_km),
+        )
+        return {name: limit for name, used, limit in checks if limit is not None and used > limit + EPS}
+
+    def excess(self, usage: dict) -> float:
+        """用量与上限之比的最大值（没有上限时为 0）"""
+        ratios = [
+            used / max(limit, EPS) for used, limit in (
+                (usage["total_hours"], self.max_hours),
+                (usage["ticket_cost"], self.max_budget),
+                (usage["distance"], self.max_distance_km),
+            ) if limit is not None
+        ]
+        return max(ratios, default=0.0)
+
+
+def _drop_stop(path: List[int], dist: np.ndarray, values: np.ndarray, prices: np.ndarray,
+               limits: PlanLimits, violated: dict) -> int:
+    """舍弃“评分 / 对超出的上限节省的比例”最低的景点，返回其节点号"""
+    p = np.asarray(path)
+    prev, stop, nxt = p[:-2], p[1:-1], p[2:]
+    saving = dist[prev, stop] + dist[stop, nxt] - dist[prev, nxt]
+    share = np.zeros(len(stop))
+    if "hours" in violated:
+        share += (saving / limits.speed_kmh + limits.visit_hours) / max(violated["hours"], EPS)
+    if "budget" in violated:
+        share += prices[stop] / max(violated["budget"], EPS)
+    if "distance" in violated:
+        share += saving / max(violated["distance"], EPS)
+    k = int(np.argmin(values[stop] / np.maximum(share, EPS)))
+    path.pop(k + 1)
+    return int(stop[k])
+
+
+def _cheapest_insertion(path: List[int], node: int, dist: np.ndarray) -> List[int]:
+    p = np.asarray(path)
+    cost = dist[p[:-1], node] + dist[node, p[1:]] - dist[p[:-1], p[1:]]
+    k = int(np.argmin(cost))
+    return path[:k + 1] + [node] + path[k + 1:]
+
+
+def plan_tour(dist: np.ndarray, values: np.ndarray, prices: np.ndarray, limits: PlanLimits,
+              free_start: bool = False, time_limit_ms: int = DEFAULT_TIME_LIMIT_MS) -> dict:
+    """
+    规划游览顺序；dist 为 plan_matrix 的结果，values / prices 为各节点的评分和门票（首尾节点为 0）
+    返回 {path, dropped, initial_distance, 以及 PlanLimits.usage 的各项}，path 含首尾节点
+    """
+    started = time.perf_counter()
+    deadline = started + time_limit_ms / 1000
+    stops = list(range(1, len(dist) - 1))
+
+    path = construct(dist, stops, free_start, started + time_limit_ms / 1000 * CONSTRUCTION_SHARE)
+    initial_distance = path_length(path, dist)
+    path = improve(path, dist, deadline)
+
+    # 超出上限时逐个舍弃景点；离上限较远时舍弃后不重新优化（去掉一个点的局部最优路线仍接近最优）
+    dropped = []
+    usage = limits.usage(path, dist, prices)
+    violated = limits.violated(usage)
+    while violated and len(path) > 2:
+        dropped.append(_drop_stop(path, dist, values, prices, limits, violated))
+        usage = limits.usage(path, dist, prices)
+        if limits.excess(usage) <= REOPTIMIZE_EXCESS:
+            path = improve(path, dist, deadline)
+            usage = limits.usage(path, dist, prices)
+        violated = limits.violated(usage)
+
+    # 按评分从高到低尝试以最小代价插回舍弃的景点，优化顺序后路线变短，可能还能再插回
+    inserted = True
+    while dropped and inserted:
+        inserted = False
+        for node in sorted(dropped, key=lambda n: -values[n]):
+            candidate = _cheapest_insertion(path, node, dist)
+            if not limits.violated(limits.usage(candidate, dist, prices)):
+                path = candidate
+                dropped.remove(node)
+                inserted = True
+        # 优化顺序只会缩短路线，不会超出上限
+        path = improve(path, dist, deadline)
+
+    return {
+        "path": path,
+        "dropped": dropped,
+        "initial_distance": initial_distance,
+        "elapsed_ms": (time.perf_counter() - started) * 1000,
+        **limits.usage(path, dist, prices),
+    }
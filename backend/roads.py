@@ -0,0 +1,57 @@
+"""
+roads.py - 蜀道古道线路数据
+从前端数据目录的 *道.csv（id, 地点, x, y）读取各条古道的途经点，首次使用时加载并缓存
+"""
+import csv
+import glob
+import os
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# 古道数据所在目录
+ROADS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "assets", "data")
+
+
+class HistoricRoad:
+    """一条古道：途经点及其经纬度数组"""
+
+    def __init__(self, name: str, points: List[dict]):
+        self.name = name
+        self.points = points
+        self.lons = np.array([p['longitude'] for p in points], dtype=np.float64)
+        self.lats = np.array([p['latitude'] for p in points], dtype=np.float64)
+
+    def summary(self) -> dict:
+        return {"name": self.name, "points": self.points}
+
+
+def load_roads(directory: str = ROADS_DIR) -> Dict[str, HistoricRoad]:
+    """读取目录下所有古道 CSV，途经点按 id 排序"""
+    roads = {}
+    for path in sorted(glob.glob(os.path.join(directory, "*道.csv"))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        with open(path, encoding="utf-8-sig") as f:
+            rows = sorted(csv.DictReader(f), key=lambda row: int(row['id']))
+        points = [
+            {"name": row['地点'], "longitude": float(row['x']), "latitude": float(row['y'])}
+            for row in rows if row.get('x') and row.get('y')
+        ]
+        if points:
+            roads[name] = HistoricRoad(name, points)
+    return roads
+
+
+_roads: Optional[Dict[str, HistoricRoad]] = None
+_roads_lock = threading.Lock()
+
+
+def get_roads() -> Dict[str, HistoricRoad]:
+    """所有古道（首次调用时加载）"""
+    global _roads
+    if _roads is None:
+        with _roads_lock:
+            if _roads is None:
+                _roads = load_roads()
+    return _roads
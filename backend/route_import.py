@@ -0,0 +1,300 @@
+"""
+route_import.py - KML / KMZ / GPX 路线批量导入
+用 iterparse 流式解析，每条轨迹解析完即释放对应的 XML 元素，单条轨迹最多保存 MAX_TRACK_POINTS 个点，
+KMZ 解压后的大小也受 MAX_IMPORT_BYTES 限制，内存占用与文件大小无关；
+轨迹经校验、简化后分批写入，整个文件的所有路线在同一个事务中提交
+"""
+import functools
+import json
+import math
+import zipfile
+import zlib
+from typing import IO, Iterable, Iterator, List, Optional, Tuple
+from xml.etree.ElementTree import ParseError, iterparse
+
+from psycopg2.extras import execute_values
+
+from route_store import (
+    ROUTE_DERIVED_COLUMNS, ROUTE_DERIVED_FIELDS, compute_route_metrics, prepare_route_points, route_columns,
+    simplify_route_points
+)
+
+# 上传文件大小上限（字节），KMZ 中 KML 解压后的大小同样受此限制
+MAX_IMPORT_BYTES = 200 * 1024 * 1024
+# 单条轨迹的点数上限，超过的点不再保存（计入去掉的点数）
+MAX_TRACK_POINTS = 500_000
+# 默认简化容差（公里），只去掉 GPS 轨迹中几乎共线的冗余点
+DEFAULT_IMPORT_SIMPLIFY_KM = 0.005
+# 每批写入的路线数和点数上限（任一达到即写入）
+IMPORT_BATCH_SIZE = 200
+IMPORT_BATCH_POINTS = 200_000
+
+IMPORT_FORMATS = ("kml", "kmz", "gpx")
+
+# (名称, 描述, 点列表, 去掉的点数)
+Track = Tuple[Optional[str], Optional[str], List[dict], int]
+
+
+class ImportFormatError(Exception):
+    """文件不是有效的 KML / KMZ / GPX"""
+
+
+@functools.lru_cache(maxsize=256)
+def _local(tag: str) -> str:
+    """去掉命名空间：{http://www.opengis.net/kml/2.2}Placemark -> Placemark"""
+    return tag.rsplit("}", 1)[-1]
+
+
+def _text(value: Optional[str]) -> Optional[str]:
+    value = (value or "").strip()
+    return value or None
+
+
+def _make_point(lon, lat, elevation=None) -> Optional[dict]:
+    """校验坐标，无效时返回 None"""
+    try:
+        lon, lat = float(lon), float(lat)
+    except (TypeError, ValueError):
+        return None
+    if not (math.isfinite(lon) and math.isfinite(lat) and -180 <= lon <= 180 and -90 <= lat <= 90):
+        return None
+    point = {"longitude": lon, "latitude": lat}
+    try:
+        if elevation is not None and math.isfinite(float(elevation)):
+            point["elevation"] = float(elevation)
+    except ValueError:
+        pass
+    return point
+
+
+class _TrackPoints:
+    """
+    收集一条轨迹的点：去掉无效坐标和连续重复的点，
+    达到 MAX_TRACK_POINTS 后只计数不再保存，单条轨迹的内存占用有上限
+    """
+
+    def __init__(self):
+        self.points: List[dict] = []
+        self.dropped = 0
+
+    def add(self, point: Optional[dict]):
+        points = self.points
+        if point is None or len(points) >= MAX_TRACK_POINTS or (
+            points and point['longitude'] == points[-1]['longitude'] and point['latitude'] == points[-1]['latitude']
+        ):
+            self.dropped += 1
+        else:
+            points.append(point)
+
+    def extend(self, points: Iterable[Optional[dict]]):
+        for point in points:
+            self.add(point)
+
+
+class _LimitedReader:
+    """限制读取的总字节数，超过 limit 时抛出 ImportFormatError（防止 KMZ 压缩炸弹）"""
+
+    def __init__(self, stream: IO[bytes], limit: int):
+        self._stream = stream
+        self._remaining = limit
+
+    def read(self, size: int = -1) -> bytes:
+        # 多读一个字节用于判断是否超出
+        if size is None or size < 0 or size > self._remaining + 1:
+            size = self._remaining + 1
+        data = self._stream.read(size)
+        self._remaining -= len(data)
+        if self._remaining < 0:
+            raise ImportFormatError("KMZ 中的 KML 解压后过大")
+        return data
+
+
+def _parse_kml_coordinates(text: Optional[str]) -> Iterator[Optional[dict]]:
+    """KML <coordinates>：以空白分隔的 lon,lat[,alt]"""
+    for pair in (text or "").split():
+        parts = pair.split(",")
+        yield _make_point(parts[0], parts[1], parts[2] if len(parts) > 2 else None) if len(parts) >= 2 else None
+
+
+def _iter_events(source: IO[bytes]) -> Iterator[Tuple[bool, str, object, object]]:
+    """
+    iterparse 的 (是否为开始事件, 去掉命名空间的标签, 元素, 父元素)，
+    父元素用于在处理完元素后把它移除，避免已解析的元素在树中累积
+    """
+    stack = []
+    try:
+        for event, elem in iterparse(source, events=("start", "end")):
+            if event == "start":
+                yield True, _local(elem.tag), elem, stack[-1] if stack else None
+                stack.append(elem)
+            else:
+                stack.pop()
+                yield False, _local(elem.tag), elem, stack[-1] if stack else None
+    except ParseError as e:
+        raise ImportFormatError(f"XML 解析失败: {e}")
+
+
+def _discard(elem, parent):
+    """释放已处理的元素"""
+    elem.clear()
+    if parent is not None:
+        parent.remove(elem)
+
+
+def _child_texts(elem, *names: str) -> List[Optional[str]]:
+    """直接子元素中各名称对应的文本"""
+    texts = {}
+    for child in elem:
+        texts.setdefault(_local(child.tag), _text(child.text))
+    return [texts.get(name) for name in names]
+
+
+def iter_kml_tracks(source: IO[bytes]) -> Iterator[Track]:
+    """
+    逐个返回 KML 中的轨迹 (名称, 描述, 点列表, 去掉的点数)
+    一个 Placemark 内的 LineString / gx:Track（含 MultiGeometry 中的多段）按顺序拼接为一条轨迹，
+    Point、Polygon 等非线要素的坐标不计入
+    """
+    track = _TrackPoints()
+    in_line = 0
+    for start, tag, elem, parent in _iter_events(source):
+        if start:
+            if tag == "Placemark":
+                track = _TrackPoints()
+            elif tag in ("LineString", "Track"):
+                in_line += 1
+            continue
+
+        if tag == "coordinates":
+            if in_line:
+                track.extend(_parse_kml_coordinates(elem.text))
+            _discard(elem, parent)
+        elif tag == "coord":
+            if in_line:
+                parts = (elem.text or "").split()
+                track.add(_make_point(parts[0], parts[1], parts[2] if len(parts) > 2 else None)
+                          if len(parts) >= 2 else None)
+            _discard(elem, parent)
+        elif tag in ("LineString", "Track"):
+            in_line -= 1
+        elif tag == "Placemark":
+            name, description = _child_texts(elem, "name", "description")
+            yield name, description, track.points, track.dropped
+            track = _TrackPoints()
+            _discard(elem, parent)
+
+
+def iter_gpx_tracks(source: IO[bytes]) -> Iterator[Track]:
+    """
+    逐个返回 GPX 中的轨迹 (名称, 描述, 点列表, 去掉的点数)
+    每个 <trk>（所有 trkseg 拼接）和 <rte> 各为一条轨迹，航点 <wpt> 不计入
+    """
+    track = _TrackPoints()
+    elevation = None
+    for start, tag, elem, parent in _iter_events(source):
+        if start:
+            if tag in ("trk", "rte"):
+                track = _TrackPoints()
+            elif tag in ("trkpt", "rtept"):
+                elevation = None
+            continue
+
+        if tag == "ele":
+            elevation = elem.text
+        elif tag in ("trkpt", "rtept"):
+            track.add(_make_point(elem.get("lon"), elem.get("lat"), elevation))
+            _discard(elem, parent)
+        elif tag in ("trk", "rte"):
+            name, description = _child_texts(elem, "name", "desc")
+            yield name, description, track.points, track.dropped
+            track = _TrackPoints()
+            _discard(elem, parent)
+        elif tag == "wpt":
+            _discard(elem, parent)
+
+
+def iter_tracks(source: IO[bytes], file_format: str) -> Iterator[Track]:
+    """
+    按格式解析轨迹；KMZ 为 zip 压缩包，读取其中的 KML（优先 doc.kml），
+    解压后的大小超过 MAX_IMPORT_BYTES 时抛出 ImportFormatError
+    """
+    if file_format == "gpx":
+        yield from iter_gpx_tracks(source)
+    elif file_format == "kml":
+        yield from iter_kml_tracks(source)
+    else:
+        try:
+            archive = zipfile.ZipFile(source)
+        except zipfile.BadZipFile:
+            raise ImportFormatError("KMZ 文件不是有效的压缩包")
+        with archive:
+            names = sorted(
+                (n for n in archive.namelist() if n.lower().endswith(".kml")),
+                key=lambda n: (n.lower() != "doc.kml", n)
+            )
+            if not names:
+                raise ImportFormatError("KMZ 文件中没有 KML")
+            # 先按压缩包中记录的大小检查，读取时再按实际解压的字节数检查（记录的大小可能不可信）
+            if archive.getinfo(names[0]).file_size > MAX_IMPORT_BYTES:
+                raise ImportFormatError("KMZ 中的 KML 解压后过大")
+            try:
+                with archive.open(names[0]) as kml:
+                    yield from iter_kml_tracks(_LimitedReader(kml, MAX_IMPORT_BYTES))
+            except (zipfile.BadZipFile, zlib.error) as e:
+                raise ImportFormatError(f"KMZ 解压失败: {e}")
+
+
+def _insert_routes(cursor, user_id: int, batch: List[tuple]) -> List[dict]:
+    """批量写入路线，返回 (id, name)"""
+    rows = execute_values(cursor, f"""
+    INSERT INTO actions.routes (user_id, name, scenic_list, description, create_time, {ROUTE_DERIVED_FIELDS})
+    VALUES %s
+    RETURNING id, name;
+    """, [(user_id, *values) for values in batch],
+        template="(%s, %s, %s, %s, NOW(), " + ", ".join(
+            f"%s::{t}" for t in ROUTE_DERIVED_COLUMNS.values()) + ")",
+        page_size=len(batch), fetch=True)
+    return rows
+
+
+def import_tracks(cursor, user_id: int, tracks: Iterator[Track], default_name: str,
+                  simplify_km: float = DEFAULT_IMPORT_SIMPLIFY_KM) -> dict:
+    """
+    校验、简化轨迹（简化后再用 DEM 填充高程）并分批写入（不提交，由调用方在同一事务中提交或回滚）
+    返回导入的路线 {id, name, points_count, distance} 列表和跳过的轨迹数量
+    """
+    imported = []
+    skipped = 0
+    dropped_points = 0
+    batch: List[tuple] = []
+    batch_info: List[dict] = []
+    batch_points = 0
+
+    def flush():
+        nonlocal batch_points
+        for row, info in zip(_insert_routes(cursor, user_id, batch), batch_info):
+            imported.append({"id": row['id'], **info})
+        batch.clear()
+        batch_info.clear()
+        batch_points = 0
+
+    for index, (name, description, points, dropped) in enumerate(tracks, start=1):
+        dropped_points += dropped
+        if len(points) < 2:
+            skipped += 1
+            continue
+        if simplify_km > 0:
+            points = simplify_route_points(points, simplify_km)
+        points = prepare_route_points(points)
+
+        metrics = compute_route_metrics([points])[0]
+        name = name or f"{default_name} {index}"
+        batch.append((name, json.dumps(points), description, *route_columns(points, metrics).values()))
+        batch_info.append({"name": name, "points_count": metrics['points_count'], "distance": metrics['distance']})
+        batch_points += len(points)
+        if len(batch) >= IMPORT_BATCH_SIZE or batch_points >= IMPORT_BATCH_POINTS:
+            flush()
+    if batch:
+        flush()
+
+    return {"routes": imported, "skipped_tracks": skipped, "dropped_points": dropped_points}
@@ -0,0 +1,287 @@
+"""
+route_store.py - 路线派生数据的存储
+总距离、点数、外包框、起终点在创建/更新路线时计算一次，保存在 actions.routes 的列中，
+读取路线（尤其是路线摘要）时直接使用，不再解析点位 JSON；
+同时以 PostgreSQL 原生几何类型保存外包框（box，GiST 索引）和折线（path），
+按范围、按距离、按古道查询路线都在数据库中完成筛选；
+另外按几个容差预先简化路线，以 Encoded Polyline 保存，路线列表和地图概览按缩放级别读取；
+写入时用本地 DEM 填充各点高程（elevation.py），累计爬升/下降和海拔范围同样保存在列中
+
+已有数据回填：python route_store.py [--all] [--batch-size 500]
+"""
+import argparse
+import json
+import re
+from typing import Dict, List, Optional, Sequence
+
+from psycopg2.extras import execute_values
+
+from db import get_db_connection, release_db_connection
+from elevation import elevation_summary, fill_route_elevations
+from geo import batch_route_metrics, decode_polyline, encode_polyline, points_to_arrays, simplify
+
+# 派生数据列 -> 类型
+ROUTE_METRIC_COLUMNS = {
+    "distance": "double precision",
+    "points_count": "integer",
+    "min_lon": "double precision",
+    "min_lat": "double precision",
+    "max_lon": "double precision",
+    "max_lat": "double precision",
+    "start_lon": "double precision",
+    "start_lat": "double precision",
+    "end_lon": "double precision",
+    "end_lat": "double precision",
+    "ascent": "double precision",
+    "descent": "double precision",
+    "min_elevation": "double precision",
+    "max_elevation": "double precision",
+}
+
+ROUTE_METRIC_FIELDS = ", ".join(ROUTE_METRIC_COLUMNS)
+
+# 空间查询用的几何列（经纬度坐标），只用于查询条件，不随路线返回
+ROUTE_SPATIAL_COLUMNS = {
+    "route_bbox": "box",
+    "route_path": "path",
+}
+
+# 简化级别 -> Douglas-Peucker 容差（公里），约为对应缩放级别范围内最大级别下一个像素的大小
+ROUTE_DETAIL_LEVELS = {
+    "low": 0.5,
+    "medium": 0.06,
+    "high": 0.01,
+}
+# 不简化
+FULL_DETAIL = "full"
+
+# (最大缩放级别, 简化级别)，超过最后一项时不简化
+ZOOM_DETAIL_LEVELS = ((8, "low"), (11, "medium"), (14, "high"))
+
+# 各简化级别的路线（Encoded Polyline）
+ROUTE_DETAIL_COLUMNS = {f"points_{level}": "text" for level in ROUTE_DETAIL_LEVELS}
+
+# 前端导入 KML 时自动生成的点名（点位1、点位2 ...），简化时不作为必须保留的途经点
+PLACEHOLDER_POINT_NAME = re.compile(r"^点位\d+$")
+
+# 派生列的计算方式变化时加 1，回填命令会重新计算版本不一致的路线
+# 2: 简化时不再保留自动生成点名的点
+# 3: 用 DEM 填充点位高程，增加爬升/下降、海拔范围
+ROUTE_DERIVED_VERSION = 3
+
+# 创建/更新路线时写入的全部派生列
+ROUTE_DERIVED_COLUMNS = {
+    **ROUTE_METRIC_COLUMNS, **ROUTE_SPATIAL_COLUMNS, **ROUTE_DETAIL_COLUMNS,
+    "derived_version": "integer",
+}
+ROUTE_DERIVED_FIELDS = ", ".join(ROUTE_DERIVED_COLUMNS)
+
+
+def load_points(scenic_list) -> list:
+    """解析 scenic_list 中保存的路线点（json/jsonb 列由驱动解码后已是列表）"""
+    if isinstance(scenic_list, list):
+        return scenic_list
+    try:
+        return json.loads(scenic_list) if scenic_list else []
+    except (json.JSONDecodeError, TypeError):
+        return []
+
+
+def compute_route_metrics(points_list: Sequence[Sequence[dict]]) -> List[dict]:
+    """
+    批量计算路线的 {distance, points_count, bbox, start, end, ascent, descent, min_elevation, max_elevation}
+    高程统计使用点位中已有的 elevation（见 prepare_route_points）
+    """
+    metrics = batch_route_metrics(points_list)
+    for points, item in zip(points_list, metrics):
+        item["start"] = [points[0]['longitude'], points[0]['latitude']] if points else None
+        item["end"] = [points[-1]['longitude'], points[-1]['latitude']] if points else None
+        item.update(elevation_summary(points))
+    return metrics
+
+
+def prepare_route_points(points: Sequence[dict]) -> List[dict]:
+    """写入前处理路线点：有 DEM 覆盖的点以 DEM 高程为准"""
+    return fill_route_elevations(points)
+
+
+def detail_for_zoom(zoom: float) -> str:
+    """地图缩放级别 -> 简化级别"""
+    for max_zoom, level in ZOOM_DETAIL_LEVELS:
+        if zoom <= max_zoom:
+            return level
+    return FULL_DETAIL
+
+
+def simplify_route_points(points: Sequence[dict], tolerance_km: float) -> List[dict]:
+    """简化路线，有名称的点（途经景点等）总是保留"""
+    if len(points) <= 2:
+        return list(points)
+    lons, lats = points_to_arrays(points)
+    anchors = [i for i, p in enumerate(points) if p.get('name') and not PLACEHOLDER_POINT_NAME.match(p['name'])]
+    return [points[i] for i in simplify(lons, lats, tolerance_km, anchors).tolist()]
+
+
+def encode_route_points(points: Sequence[dict]) -> str:
+    """路线点 -> Encoded Polyline"""
+    return encode_polyline(*points_to_arrays(points))
+
+
+def decode_route_points(encoded: str) -> List[dict]:
+    """Encoded Polyline -> 路线点（只有经纬度）"""
+    lons, lats = decode_polyline(encoded)
+    return [{"longitude": lon, "latitude": lat} for lon, lat in zip(lons.tolist(), lats.tolist())]
+
+
+def box_literal(bbox) -> str:
+    """(minLon, minLat, maxLon, maxLat) -> box 字面量"""
+    return f"(({bbox[0]},{bbox[1]}),({bbox[2]},{bbox[3]}))"
+
+
+def path_literal(points: Sequence[dict]) -> str:
+    """路线点 -> 开放 path 字面量"""
+    return "[" + ",".join(f"({float(p['longitude'])},{float(p['latitude'])})" for p in points) + "]"
+
+
+def route_columns(points: Sequence[dict], metrics: dict) -> Dict[str, object]:
+    """路线点及 compute_route_metrics 的结果 -> 派生列的值（与 ROUTE_DERIVED_COLUMNS 顺序一致）"""
+    bbox = metrics["bbox"] or (None, None, None, None)
+    start = metrics["start"] or (None, None)
+    end = metrics["end"] or (None, None)
+    return {
+        "distance": metrics["distance"],
+        "points_count": metrics["points_count"],
+        "min_lon": bbox[0], "min_lat": bbox[1], "max_lon": bbox[2], "max_lat": bbox[3],
+        "start_lon": start[0], "start_lat": start[1],
+        "end_lon": end[0], "end_lat": end[1],
+        "ascent": metrics["ascent"], "descent": metrics["descent"],
+        "min_elevation": metrics["min_elevation"], "max_elevation": metrics["max_elevation"],
+        "route_bbox": box_literal(metrics["bbox"]) if points else None,
+        "route_path": path_literal(points) if points else None,
+        **{
+            f"points_{level}": encode_route_points(simplify_route_points(points, tolerance))
+            for level, tolerance in ROUTE_DETAIL_LEVELS.items()
+        },
+        "derived_version": ROUTE_DERIVED_VERSION,
+    }
+
+
+def metrics_from_row(row: dict) -> Optional[dict]:
+    """
+    从数据库行中取出派生数据列（同时从 row 中删除），
+    尚未回填的旧数据返回 None
+    """
+    values = {column: row.pop(column, None) for column in ROUTE_METRIC_COLUMNS}
+    if values["distance"] is None:
+        return None
+    has_points = values["points_count"]
+    return {
+        "distance": values["distance"],
+        "points_count": values["points_count"],
+        "bbox": (values["min_lon"], values["min_lat"], values["max_lon"], values["max_lat"]) if has_points else None,
+        "start": [values["start_lon"], values["start_lat"]] if has_points else None,
+        "end": [values["end_lon"], values["end_lat"]] if has_points else None,
+        "ascent": values["ascent"],
+        "descent": values["descent"],
+        "min_elevation": values["min_elevation"],
+        "max_elevation": values["max_elevation"],
+    }
+
+
+def ensure_route_schema(cursor):
+    """为 actions.routes 添加派生数据列及空间索引（可重复执行）"""
+    for column, column_type in ROUTE_DERIVED_COLUMNS.items():
+        cursor.execute(f"ALTER TABLE actions.routes ADD COLUMN IF NOT EXISTS {column} {column_type};")
+    cursor.execute("CREATE INDEX IF NOT EXISTS routes_route_bbox_gist ON actions.routes USING gist (route_bbox);")
+
+
+def init_route_schema():
+    """应用启动时检查并添加派生数据列"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        ensure_route_schema(cursor)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+
+def _column_type(cursor, column: str) -> str:
+    """actions.routes 中某列的类型（如 text、jsonb）"""
+    cursor.execute("""
+    SELECT format_type(atttypid, atttypmod) AS column_type FROM pg_attribute
+    WHERE attrelid = 'actions.routes'::regclass AND attname = %s AND NOT attisdropped;
+    """, (column,))
+    return cursor.fetchone()['column_type']
+
+
+def backfill_route_metrics(recompute_all: bool = False, batch_size: int = 500) -> int:
+    """
+    为已有路线计算并写入派生数据，按 id 分批处理、每批提交一次
+    默认只处理尚未计算或计算方式已变化（derived_version 不一致）的路线，
+    recompute_all=True 时全部重新计算；点位高程由 DEM 填充后有变化的，同时更新 scenic_list；
+    返回处理的路线数
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    updated = 0
+    last_id = 0
+    try:
+        ensure_route_schema(cursor)
+        conn.commit()
+        # scenic_list 可能是 text、json 或 jsonb，VALUES 中的值按列类型转换
+        scenic_list_type = _column_type(cursor, "scenic_list")
+        while True:
+            cursor.execute(f"""
+            SELECT id, scenic_list FROM actions.routes
+            WHERE id > %s {"" if recompute_all else "AND derived_version IS DISTINCT FROM %s"}
+            ORDER BY id LIMIT %s;
+            """, (last_id, batch_size) if recompute_all else (last_id, ROUTE_DERIVED_VERSION, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+
+            loaded = [load_points(row['scenic_list']) for row in rows]
+            points_list = [prepare_route_points(points) for points in loaded]
+            metrics = compute_route_metrics(points_list)
+            values = [
+                (row['id'], json.dumps(points) if points != original else None,
+                 *route_columns(points, item).values())
+                for row, original, points, item in zip(rows, loaded, points_list, metrics)
+            ]
+            execute_values(cursor, f"""
+            UPDATE actions.routes AS r SET scenic_list = COALESCE(v.scenic_list::{scenic_list_type}, r.scenic_list),
+                {", ".join(f"{c} = v.{c}" for c in ROUTE_DERIVED_COLUMNS)}
+            FROM (VALUES %s) AS v (id, scenic_list, {ROUTE_DERIVED_FIELDS})
+            WHERE r.id = v.id;
+            """, values, template="(%s, %s, " + ", ".join(
+                f"%s::{t}" for t in ROUTE_DERIVED_COLUMNS.values()) + ")")
+            conn.commit()
+
+            updated += len(rows)
+            last_id = rows[-1]['id']
+            print(f"已回填 {updated} 条路线")
+        return updated
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回填路线派生数据（距离、点数、外包框、起终点、高程、几何列、简化路线）")
+    parser.add_argument("--all", action="store_true", help="重新计算所有路线（默认只处理尚未计算的路线）")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    count = backfill_route_metrics(args.all, args.batch_size)
+    print(f"完成，共处理 {count} 条路线")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,42 +3,58 @@
 单独的路线相关接口，可以导入到 main.py 中使用
 """
 
-from fastapi import APIRouter
-from pydantic import BaseModel
-from typing import List, Optional
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import IO, List, Optional, Tuple
+from datetime import datetime
+import base64
 import json
+import math
+import tempfile
+
+import numpy as np
+
+from cache import dump_json
+from elevation import elevation_profile
+from geo import (
+    bounding_box, degree_radius, distance_matrix, haversine_km, point_to_polyline_km, points_to_arrays,
+    polyline_distance_km, route_geometry
+)
+from planner import (
+    DEFAULT_SPEED_KMH, DEFAULT_TIME_LIMIT_MS, DEFAULT_VISIT_MINUTES, MAX_PLAN_STOPS, MAX_TIME_LIMIT_MS, PlanLimits,
+    plan_matrix, plan_tour
+)
+from roads import get_roads
+from route_import import (
+    DEFAULT_IMPORT_SIMPLIFY_KM, MAX_IMPORT_BYTES, ImportFormatError, import_tracks, iter_tracks
+)
+from route_store import (
+    FULL_DETAIL, ROUTE_DERIVED_FIELDS, ROUTE_DERIVED_VERSION, ROUTE_DETAIL_LEVELS, ROUTE_METRIC_FIELDS, box_literal,
+    compute_route_metrics, decode_route_points, detail_for_zoom, encode_route_points, load_points, metrics_from_row,
+    path_literal, prepare_route_points, route_columns, simplify_route_points
+)
+from spatial import parse_bbox
+import async_db
+from db import PoolTimeoutError, get_db_connection, release_db_connection, get_user_id_by_username, stream_rows
 
 # 创建路由器
 router = APIRouter(prefix="/api/routes", tags=["routes"])
 
-# 数据库连接配置（本地连接）
-DB_CONFIG = {
-    "host": "localhost",
-    "port": 5432,
-    "dbname": "shudao",
-    "user": "postgres",
-    "password": "123456"
-}
-
-def get_db_connection():
-    """获取数据库连接"""
-    return psycopg2.connect(**DB_CONFIG, cursor_factory=RealDictCursor)
-
-def get_user_id_by_username(username: str) -> Optional[int]:
-    """根据用户名获取用户ID"""
-    try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("SELECT id FROM users.users WHERE username = %s", (username,))
-        result = cursor.fetchone()
-        cursor.close()
-        conn.close()
-        return result['id'] if result else None
-    except Exception as e:
-        print(f"获取用户ID失败: {e}")
-        return None
+# 查询/返回路线时读取的列
+ROUTE_FIELDS = f"id, user_id, name, scenic_list, description, create_time, {ROUTE_METRIC_FIELDS}"
+# 高程剖面取样点数上限
+MAX_PROFILE_SAMPLES = 5000
+# 导入文件在内存中缓冲的上限（字节），超过后写入磁盘临时文件
+IMPORT_SPOOL_BYTES = 8 * 1024 * 1024
+
+# detail 参数的取值
+DETAIL_PATTERN = "^(" + "|".join([*ROUTE_DETAIL_LEVELS, FULL_DETAIL]) + ")$"
+# 沿古道查询时计算距离使用的简化级别列
+ALONG_DETAIL_COLUMN = "points_high"
+# 空间查询结果中的路线（不含点位）
+ROUTE_BRIEF_FIELDS = f"id, user_id, name, description, create_time, {ROUTE_METRIC_FIELDS}"
 
 # ==================== 数据模型 ====================
 
@@ -58,94 +74,228 @@ class RouteUpdate(BaseModel):
     description: Optional[str] = None
     points: Optional[List[RoutePoint]] = None
 
-# ==================== 工具函数 ====================
+class RoutePlanRequest(BaseModel):
+    scenic_ids: Optional[List[int]] = None
+    username: Optional[str] = None
+    start: Optional[RoutePoint] = None
+    return_to_start: bool = False
+    max_hours: Optional[float] = Field(None, gt=0)
+    max_budget: Optional[float] = Field(None, ge=0)
+    max_distance_km: Optional[float] = Field(None, gt=0)
+    speed_kmh: float = Field(DEFAULT_SPEED_KMH, gt=0)
+    visit_minutes: float = Field(DEFAULT_VISIT_MINUTES, ge=0)
+    time_limit_ms: int = Field(DEFAULT_TIME_LIMIT_MS, ge=10, le=MAX_TIME_LIMIT_MS)
 
-def calculate_distance(point1: dict, point2: dict) -> float:
-    """计算两点之间的距离（公里）"""
-    import math
-    R = 6371  # 地球半径（公里）
-    
-    lat1 = math.radians(point1['latitude'])
-    lat2 = math.radians(point2['latitude'])
-    delta_lat = math.radians(point2['latitude'] - point1['latitude'])
-    delta_lon = math.radians(point2['longitude'] - point1['longitude'])
-    
-    a = math.sin(delta_lat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(delta_lon/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    
-    return R * c
+# ==================== 工具函数 ====================
 
 def calculate_total_distance(points: list) -> float:
-    """计算路线总距离"""
-    if len(points) < 2:
-        return 0
-    
-    total = 0
-    for i in range(len(points) - 1):
-        total += calculate_distance(points[i], points[i+1])
-    
-    return round(total, 1)
-
-def parse_route(route_row: dict) -> dict:
-    """解析数据库行为路线对象"""
+    """计算路线总距离（公里）"""
+    return compute_route_metrics([points])[0]['distance']
+
+def route_fields(detail: str = FULL_DETAIL) -> str:
+    """
+    按简化级别选择读取的列：简化级别只读取预先简化好的路线，
+    该级别尚未回填时才读取完整的 scenic_list
+    """
+    if detail == FULL_DETAIL:
+        return ROUTE_FIELDS
+    column = f"points_{detail}"
+    return (
+        f"id, user_id, name, description, create_time, {ROUTE_METRIC_FIELDS}, {column}, "
+        f"CASE WHEN {column} IS NULL THEN scenic_list END AS scenic_list"
+    )
+
+def resolve_detail(detail: str, zoom: Optional[float]) -> str:
+    """给出 zoom 时按地图缩放级别选择简化级别，否则使用 detail"""
+    return detail_for_zoom(zoom) if zoom is not None else detail
+
+def parse_route(route_row: dict, metrics: Optional[dict] = None, geometry: bool = False,
+                simplify_km: Optional[float] = None, detail: str = FULL_DETAIL,
+                encoding: str = "json") -> dict:
+    """
+    解析数据库行为路线对象
+    距离等派生数据优先使用写入时保存的列，尚未回填的旧数据才现场计算；
+    detail 为简化级别时 points 为预先简化的路线（只有经纬度，有名称的点总是保留）；
+    encoding=polyline 时以 Encoded Polyline 字符串（polyline 字段）代替 points；
+    geometry=True 时附带分段长度、累计距离（以及按 simplify_km 简化后的折线），基于返回的点计算
+    """
     route_dict = dict(route_row)
-    
-    # 解析 scenic_list 为 points
-    try:
-        if route_dict['scenic_list']:
-            route_dict['points'] = json.loads(route_dict['scenic_list'])
-        else:
-            route_dict['points'] = []
-    except (json.JSONDecodeError, TypeError):
-        route_dict['points'] = []
-    
-    # 计算距离
-    route_dict['distance'] = calculate_total_distance(route_dict['points'])
-    
-    # 删除 scenic_list
-    del route_dict['scenic_list']
-    
+    stored = metrics_from_row(route_dict)
+    scenic_list = route_dict.pop('scenic_list', None)
+    encoded = route_dict.pop(f"points_{detail}", None) if detail != FULL_DETAIL else None
+
+    # 预先简化好且直接输出 polyline 时不需要解码
+    points = None
+    if encoded is None:
+        points = load_points(scenic_list)
+        if metrics is None and stored is None:
+            metrics = compute_route_metrics([points])[0]
+        if detail != FULL_DETAIL:
+            # 尚未回填的旧数据现场简化
+            points = simplify_route_points(points, ROUTE_DETAIL_LEVELS[detail])
+    elif encoding != "polyline" or geometry or simplify_km is not None:
+        points = decode_route_points(encoded)
+
+    route_dict.update(metrics or stored)
+    if encoding == "polyline":
+        route_dict['polyline'] = encoded if encoded is not None else encode_route_points(points)
+    else:
+        route_dict['points'] = points
+
+    if geometry or simplify_km is not None:
+        info = route_geometry(points, simplify_km)
+        route_dict['geometry'] = {
+            k: v for k, v in info.items() if k not in ("distance", "points_count", "bbox")
+        }
+
     # 转换时间格式
     if route_dict.get('create_time'):
         route_dict['create_time'] = route_dict['create_time'].isoformat()
-    
+
     return route_dict
 
+def parse_routes(routes: list, geometry: bool = False, simplify_km: Optional[float] = None,
+                 detail: str = FULL_DETAIL, encoding: str = "json") -> list:
+    """批量解析路线，尚未保存派生数据的路线一次向量化计算"""
+    missing = [i for i, route in enumerate(routes) if route.get('distance') is None]
+    metrics_list = [None] * len(routes)
+    points_list = [load_points(routes[i]['scenic_list']) for i in missing]
+    for i, metrics in zip(missing, compute_route_metrics(points_list)):
+        metrics_list[i] = metrics
+    return [
+        parse_route(route, metrics, geometry, simplify_km, detail, encoding)
+        for route, metrics in zip(routes, metrics_list)
+    ]
+
+def parse_route_brief(route_row: dict) -> dict:
+    """解析数据库行为不含点位的路线对象（空间查询结果）"""
+    route_dict = dict(route_row)
+    route_dict.update(metrics_from_row(route_dict) or {})
+    if route_dict.get('create_time'):
+        route_dict['create_time'] = route_dict['create_time'].isoformat()
+    return route_dict
+
+def encode_route_cursor(create_time: Optional[datetime], route_id: int) -> str:
+    """把分页位置 (create_time, id) 编码为不透明的游标字符串"""
+    raw = f"{create_time.isoformat() if create_time else ''}|{route_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_route_cursor(value: str) -> Tuple[Optional[datetime], int]:
+    """解析游标字符串"""
+    try:
+        raw = base64.urlsafe_b64decode(value.encode()).decode()
+        time_part, id_part = raw.split("|")
+        return (datetime.fromisoformat(time_part) if time_part else None), int(id_part)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+def route_keyset_condition(create_time: Optional[datetime], route_id: int) -> Tuple[str, list]:
+    """
+    排序为 create_time DESC NULLS LAST, id DESC 时，位于游标之后的记录的查询条件
+    """
+    if create_time is None:
+        return "(create_time IS NULL AND id < %s)", [route_id]
+    return (
+        "(create_time < %s OR (create_time = %s AND id < %s) OR create_time IS NULL)",
+        [create_time, create_time, route_id]
+    )
+
+def stream_routes_ndjson(query: str, params: list, limit: Optional[int], geometry: bool,
+                         simplify_km: Optional[float], detail: str, encoding: str):
+    """
+    逐行输出路线；分页时查询多取的一条只用于判断是否还有下一页，不输出，
+    最后一行为 {"next_cursor": ...}（没有下一页时为 null）
+    """
+    count = 0
+    last = None
+    has_more = False
+    for route in stream_rows(query, params):
+        if limit is not None and count >= limit:
+            has_more = True
+            break
+        last = (route['create_time'], route['id'])
+        count += 1
+        yield dump_json(parse_route(route, None, geometry, simplify_km, detail, encoding)) + b"\n"
+    if limit is not None:
+        yield dump_json({"next_cursor": encode_route_cursor(*last) if has_more else None}) + b"\n"
+
 # ==================== API 接口 ====================
 
 @router.get("")
-def get_routes(username: Optional[str] = None):
-    """获取自定义路线（可选用户名筛选）"""
+def get_routes(
+    username: Optional[str] = None,
+    page_cursor: Optional[str] = Query(None, alias="cursor"),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    output_format: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+    geometry: bool = False,
+    simplify_km: Optional[float] = Query(None, gt=0),
+    detail: str = Query(FULL_DETAIL, pattern=DETAIL_PATTERN),
+    zoom: Optional[float] = Query(None, ge=0, le=22),
+    encoding: str = Query("json", pattern="^(json|polyline)$")
+):
+    """
+    获取自定义路线（可选用户名筛选）
+    cursor + limit 为按 (create_time, id) 的游标分页，响应中的 next_cursor 为下一页的 cursor
+    format=ndjson 时使用服务端游标以 NDJSON 流式返回，内存占用与路线数量无关；
+    同时给出 limit 时最后一行为 {"next_cursor": ...}
+    geometry=true 时附带分段长度和累计距离，simplify_km 为简化折线的容差（公里）
+    detail=low|medium|high 返回预先简化的路线（full 为完整路线），给出 zoom 时按地图缩放级别选择；
+    encoding=polyline 时点位以 Encoded Polyline 字符串返回
+    """
+    detail = resolve_detail(detail, zoom)
     conn = get_db_connection()
     cursor = conn.cursor()
 
     try:
+        conditions = []
+        params = []
         if username:
-            user_id = get_user_id_by_username(username)
+            user_id = get_user_id_by_username(username, cursor)
             if not user_id:
                 return {"success": False, "error": "用户不存在", "data": []}
+            conditions.append("user_id = %s")
+            params.append(user_id)
 
-            query = """
-            SELECT id, user_id, name, scenic_list, description, create_time
-            FROM actions.routes
-            WHERE user_id = %s
-            ORDER BY create_time DESC;
-            """
-            cursor.execute(query, (user_id,))
-        else:
-            # 如果没有提供用户名，返回所有路线
-            query = """
-            SELECT id, user_id, name, scenic_list, description, create_time
-            FROM actions.routes
-            ORDER BY create_time DESC;
-            """
-            cursor.execute(query)
+        if page_cursor is not None:
+            keyset_condition, keyset_params = route_keyset_condition(*decode_route_cursor(page_cursor))
+            conditions.append(keyset_condition)
+            params.extend(keyset_params)
+
+        # 如果没有提供用户名，返回所有路线
+        query = f"""
+        SELECT {route_fields(detail)}
+        FROM actions.routes
+        {"WHERE " + " AND ".join(conditions) if conditions else ""}
+        ORDER BY create_time DESC NULLS LAST, id DESC
+        {"LIMIT %s" if limit is not None else ""};
+        """
+        if limit is not None:
+            # 多取一条用于判断是否还有下一页
+            params.append(limit + 1)
+
+        if output_format == "ndjson":
+            return StreamingResponse(
+                stream_routes_ndjson(query, params, limit, geometry, simplify_km, detail, encoding),
+                media_type="application/x-ndjson"
+            )
 
+        cursor.execute(query, params)
         routes = cursor.fetchall()
-        result = [parse_route(route) for route in routes]
 
-        return {"success": True, "count": len(result), "data": result}
+        next_cursor = None
+        if limit is not None and len(routes) > limit:
+            routes = routes[:limit]
+            next_cursor = encode_route_cursor(routes[-1]['create_time'], routes[-1]['id'])
+
+        result = parse_routes(routes, geometry, simplify_km, detail, encoding)
 
+        response = {"success": True, "count": len(result), "data": result}
+        if page_cursor is not None or limit is not None:
+            response["next_cursor"] = next_cursor
+        return response
+
+    except (HTTPException, PoolTimeoutError):
+        raise
     except Exception as e:
         print(f"Error querying routes: {e}")
         import traceback
@@ -153,89 +303,357 @@ def get_routes(username: Optional[str] = None):
         return {"success": False, "error": str(e), "data": []}
     finally:
         cursor.close()
-        conn.close()
+        release_db_connection(conn)
 
 @router.get("/summary")
-def get_routes_summary(username: Optional[str] = None):
-    """获取路线摘要（用于用户页面显示，可选用户名筛选）"""
+async def get_routes_summary(username: Optional[str] = None):
+    """
+    获取路线摘要（用于用户页面显示，可选用户名筛选）
+    只读取写入时保存的列，不解析点位，通过异步数据访问层查询，不占用线程池
+    """
+    try:
+        async with async_db.acquire() as conn:
+            if username:
+                user_id = await async_db.get_user_id_by_username(username, conn=conn)
+                if not user_id:
+                    return {"success": False, "error": "用户不存在", "data": []}
+
+                routes = await async_db.fetch_all(
+                    """
+                    SELECT id, name, distance, points_count, create_time
+                    FROM actions.routes
+                    WHERE user_id = $1
+                    ORDER BY create_time DESC;
+                    """,
+                    user_id,
+                    conn=conn
+                )
+            else:
+                # 如果没有提供用户名，返回所有路线
+                routes = await async_db.fetch_all(
+                    """
+                    SELECT id, name, distance, points_count, create_time
+                    FROM actions.routes
+                    ORDER BY create_time DESC;
+                    """,
+                    conn=conn
+                )
+
+        # 距离和点数为写入时保存的列；尚未回填的旧数据为 null
+        result = []
+        for route in routes:
+            result.append({
+                "id": route['id'],
+                "name": route['name'],
+                "distance": route['distance'],
+                "points_count": route['points_count'],
+                "create_time": route['create_time'].isoformat() if route['create_time'] else None
+            })
+
+        return {"success": True, "count": len(result), "data": result}
+
+    except PoolTimeoutError:
+        raise
+    except Exception as e:
+        print(f"Error querying routes summary: {e}")
+        return {"success": False, "error": str(e), "data": []}
+
+@router.get("/within")
+def get_routes_within(
+    bbox: str,
+    username: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """
+    范围查询：返回经过 bbox（minLon,minLat,maxLon,maxLat）的路线，按创建时间倒序
+    先用外包框的 GiST 索引筛选，再判断起点在范围内或折线与范围边界相交
+    """
+    query_box = parse_bbox(bbox)
+    if query_box is None:
+        raise HTTPException(status_code=400, detail="需要提供 bbox")
+
     conn = get_db_connection()
     cursor = conn.cursor()
 
     try:
+        box = box_literal(query_box)
+        conditions = [
+            "route_bbox && %s::box",
+            "(%s::box @> point(start_lon, start_lat) OR route_path ?# path(polygon(%s::box)))"
+        ]
+        params = [box, box, box]
         if username:
-            user_id = get_user_id_by_username(username)
+            user_id = get_user_id_by_username(username, cursor)
             if not user_id:
                 return {"success": False, "error": "用户不存在", "data": []}
+            conditions.append("user_id = %s")
+            params.append(user_id)
+        params.append(limit)
+
+        cursor.execute(f"""
+        SELECT {ROUTE_BRIEF_FIELDS}
+        FROM actions.routes
+        WHERE {" AND ".join(conditions)}
+        ORDER BY create_time DESC NULLS LAST, id DESC
+        LIMIT %s;
+        """, params)
+        result = [parse_route_brief(route) for route in cursor.fetchall()]
 
-            query = """
-            SELECT id, name, scenic_list, create_time
-            FROM actions.routes
-            WHERE user_id = %s
-            ORDER BY create_time DESC;
-            """
-            cursor.execute(query, (user_id,))
-        else:
-            # 如果没有提供用户名，返回所有路线
-            query = """
-            SELECT id, name, scenic_list, create_time
-            FROM actions.routes
-            ORDER BY create_time DESC;
-            """
-            cursor.execute(query)
+        return {"success": True, "count": len(result), "data": result}
 
-        routes = cursor.fetchall()
+    except PoolTimeoutError:
+        raise
+    except Exception as e:
+        print(f"Error querying routes within bbox: {e}")
+        import traceback
+        traceback.print_exc()
+        return {"success": False, "error": str(e), "data": []}
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+@router.get("/near")
+def get_routes_near(
+    scenic_id: Optional[int] = None,
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    radius_km: float = Query(5, gt=0, le=100),
+    username: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500)
+):
+    """
+    周边路线：返回经过景点（scenic_id）或坐标（lon、lat）radius_km 公里范围内的路线，按最近距离升序
+    数据库中用外包框索引和折线距离粗筛，只对候选路线计算精确距离
+    """
+    if scenic_id is None and (lon is None or lat is None):
+        raise HTTPException(status_code=400, detail="需要提供 scenic_id 或 lon、lat")
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        if scenic_id is not None:
+            cursor.execute("SELECT longitude, latitude FROM scenic.scenic WHERE id = %s;", (scenic_id,))
+            scenic = cursor.fetchone()
+            if not scenic or scenic['longitude'] is None or scenic['latitude'] is None:
+                raise HTTPException(status_code=404, detail="景点不存在")
+            lon, lat = float(scenic['longitude']), float(scenic['latitude'])
+
+        radius = degree_radius(lat, radius_km)
+        conditions = ["route_bbox && %s::box", "route_path <-> point(%s, %s) <= %s"]
+        params = [box_literal((lon - radius, lat - radius, lon + radius, lat + radius)), lon, lat, radius]
+        if username:
+            user_id = get_user_id_by_username(username, cursor)
+            if not user_id:
+                return {"success": False, "error": "用户不存在", "data": []}
+            conditions.append("user_id = %s")
+            params.append(user_id)
+
+        cursor.execute(f"""
+        SELECT {ROUTE_BRIEF_FIELDS}, scenic_list
+        FROM actions.routes
+        WHERE {" AND ".join(conditions)};
+        """, params)
 
         result = []
-        for route in routes:
-            # 解析点位计算距离
-            try:
-                points = json.loads(route['scenic_list']) if route['scenic_list'] else []
-            except:
-                points = []
+        for route in cursor.fetchall():
+            lons, lats = points_to_arrays(load_points(route.pop('scenic_list')))
+            distance = point_to_polyline_km(lon, lat, lons, lats)
+            if distance <= radius_km:
+                item = parse_route_brief(route)
+                item["distance_km"] = round(distance, 3)
+                result.append(item)
+        result.sort(key=lambda item: (item["distance_km"], item["id"]))
+        result = result[:limit]
+
+        return {
+            "success": True,
+            "center": {"longitude": lon, "latitude": lat},
+            "radius_km": radius_km,
+            "count": len(result),
+            "data": result
+        }
+
+    except (HTTPException, PoolTimeoutError):
+        raise
+    except Exception as e:
+        print(f"Error querying routes near point: {e}")
+        import traceback
+        traceback.print_exc()
+        return {"success": False, "error": str(e), "data": []}
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+@router.get("/roads")
+def get_historic_roads():
+    """蜀道古道列表及途经点（用于按古道查询路线）"""
+    try:
+        roads = [road.summary() for road in get_roads().values()]
+        return {"success": True, "count": len(roads), "data": roads}
+    except PoolTimeoutError:
+        raise
+    except Exception as e:
+        print(f"Error loading historic roads: {e}")
+        return {"success": False, "error": str(e), "data": []}
 
-            distance = calculate_total_distance(points)
+@router.get("/along/{road_name}")
+def get_routes_along_road(
+    road_name: str,
+    buffer_km: float = Query(0, ge=0, le=50),
+    username: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """
+    沿古道的路线：返回与古道 road_name（如 金牛道）相交、或与古道距离不超过 buffer_km 公里的路线，
+    按距离升序（相交的距离为 0）；距离用预先简化的 high 级别路线（容差 10 米）计算，长轨迹不必逐点比较
+    """
+    road = get_roads().get(road_name)
+    if road is None:
+        raise HTTPException(status_code=404, detail="古道不存在")
 
-            result.append({
-                "id": route['id'],
-                "name": route['name'],
-                "distance": distance,
-                "points_count": len(points),
-                "create_time": route['create_time'].isoformat() if route['create_time'] else None
-            })
+    conn = get_db_connection()
+    cursor = conn.cursor()
 
-        return {"success": True, "count": len(result), "data": result}
+    try:
+        road_path = path_literal(road.points)
+        min_lon, min_lat, max_lon, max_lat = bounding_box(road.lons, road.lats)
+        radius = degree_radius(max(abs(min_lat), abs(max_lat)), buffer_km)
+        conditions = ["route_bbox && %s::box", "route_path <-> %s::path <= %s"]
+        params = [
+            road_path,
+            box_literal((min_lon - radius, min_lat - radius, max_lon + radius, max_lat + radius)),
+            road_path, radius
+        ]
+        if username:
+            user_id = get_user_id_by_username(username, cursor)
+            if not user_id:
+                return {"success": False, "error": "用户不存在", "data": []}
+            conditions.append("user_id = %s")
+            params.append(user_id)
+
+        cursor.execute(f"""
+        SELECT {ROUTE_BRIEF_FIELDS}, {ALONG_DETAIL_COLUMN},
+               CASE WHEN {ALONG_DETAIL_COLUMN} IS NULL THEN scenic_list END AS scenic_list,
+               route_path ?# %s::path AS crosses
+        FROM actions.routes
+        WHERE {" AND ".join(conditions)};
+        """, params)
 
+        result = []
+        for route in cursor.fetchall():
+            encoded = route.pop(ALONG_DETAIL_COLUMN)
+            scenic_list = route.pop('scenic_list')
+            if route.pop('crosses'):
+                distance = 0.0
+            else:
+                points = decode_route_points(encoded) if encoded is not None else load_points(scenic_list)
+                lons, lats = points_to_arrays(points)
+                distance = polyline_distance_km(lons, lats, road.lons, road.lats)
+            if distance <= buffer_km:
+                item = parse_route_brief(route)
+                item["distance_km"] = round(distance, 3)
+                result.append(item)
+        result.sort(key=lambda item: (item["distance_km"], item["id"]))
+        result = result[:limit]
+
+        return {"success": True, "road": road.summary(), "count": len(result), "data": result}
+
+    except PoolTimeoutError:
+        raise
     except Exception as e:
-        print(f"Error querying routes summary: {e}")
+        print(f"Error querying routes along road: {e}")
+        import traceback
+        traceback.print_exc()
         return {"success": False, "error": str(e), "data": []}
     finally:
         cursor.close()
-        conn.close()
+        release_db_connection(conn)
 
 @router.get("/{route_id}")
-def get_route_by_id(route_id: int):
-    """根据 ID 获取单个路线"""
+def get_route_by_id(
+    route_id: int,
+    geometry: bool = False,
+    simplify_km: Optional[float] = Query(None, gt=0),
+    detail: str = Query(FULL_DETAIL, pattern=DETAIL_PATTERN),
+    zoom: Optional[float] = Query(None, ge=0, le=22),
+    encoding: str = Query("json", pattern="^(json|polyline)$")
+):
+    """根据 ID 获取单个路线（geometry / simplify_km / detail / zoom / encoding 同路线列表接口）"""
+    detail = resolve_detail(detail, zoom)
     conn = get_db_connection()
     cursor = conn.cursor()
 
     try:
-        query = """
-        SELECT id, user_id, name, scenic_list, description, create_time
+        query = f"""
+        SELECT {route_fields(detail)}
         FROM actions.routes WHERE id = %s;
         """
         cursor.execute(query, (route_id,))
         route = cursor.fetchone()
 
         if route:
-            return {"success": True, "data": parse_route(route)}
+            return {"success": True, "data": parse_route(route, None, geometry, simplify_km, detail, encoding)}
         else:
             return {"success": False, "error": "Route not found"}
 
+    except PoolTimeoutError:
+        raise
     except Exception as e:
         return {"success": False, "error": str(e)}
     finally:
         cursor.close()
-        conn.close()
+        release_db_connection(conn)
+
+@router.get("/{route_id}/profile")
+def get_route_profile(route_id: int, samples: Optional[int] = Query(None, ge=2, le=MAX_PROFILE_SAMPLES)):
+    """
+    路线的高程剖面：累计距离（公里）和高程（米）数组，以及保存的爬升/下降、海拔范围
+    samples 为按距离等间隔取样的点数（缺省时返回全部点）；尚未回填高程的旧路线现场用 DEM 填充
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        query = f"""
+        SELECT id, name, scenic_list, derived_version, {ROUTE_METRIC_FIELDS}
+        FROM actions.routes WHERE id = %s;
+        """
+        cursor.execute(query, (route_id,))
+        route = cursor.fetchone()
+        if not route:
+            raise HTTPException(status_code=404, detail="Route not found")
+
+        points = load_points(route['scenic_list'])
+        metrics = metrics_from_row(dict(route))
+        if metrics is None or (route['derived_version'] or 0) < ROUTE_DERIVED_VERSION:
+            points = prepare_route_points(points)
+            metrics = compute_route_metrics([points])[0]
+
+        return {
+            "success": True,
+            "data": {
+                "id": route['id'],
+                "name": route['name'],
+                "distance": metrics['distance'],
+                "ascent": metrics['ascent'],
+                "descent": metrics['descent'],
+                "min_elevation": metrics['min_elevation'],
+                "max_elevation": metrics['max_elevation'],
+                "profile": elevation_profile(points, samples)
+            }
+        }
+
+    except (HTTPException, PoolTimeoutError):
+        raise
+    except Exception as e:
+        print(f"Error building route profile: {e}")
+        import traceback
+        traceback.print_exc()
+        return {"success": False, "error": str(e)}
+    finally:
+        cursor.close()
+        release_db_connection(conn)
 
 @router.post("")
 def create_route(route: RouteCreate, username: Optional[str] = None):
@@ -248,25 +666,28 @@ def create_route(route: RouteCreate, username: Optional[str] = None):
         if not username:
             return {"success": False, "error": "需要提供用户名"}
 
-        user_id = get_user_id_by_username(username)
+        user_id = get_user_id_by_username(username, cursor)
         if not user_id:
             return {"success": False, "error": "用户不存在"}
 
-        # 转换 points 为 JSON 存入 scenic_list
-        points_json = json.dumps([p.dict() for p in route.points])
+        # 转换 points 为 JSON 存入 scenic_list，同时保存距离等派生数据
+        points = prepare_route_points([p.dict() for p in route.points])
+        columns = route_columns(points, compute_route_metrics([points])[0])
 
-        query = """
-        INSERT INTO actions.routes (user_id, name, scenic_list, description, create_time)
-        VALUES (%s, %s, %s, %s, NOW())
-        RETURNING id, user_id, name, scenic_list, description, create_time;
+        query = f"""
+        INSERT INTO actions.routes (user_id, name, scenic_list, description, create_time, {ROUTE_DERIVED_FIELDS})
+        VALUES (%s, %s, %s, %s, NOW(), {", ".join(["%s"] * len(columns))})
+        RETURNING {ROUTE_FIELDS};
         """
-        cursor.execute(query, (user_id, route.name, points_json, route.description))
+        cursor.execute(query, (user_id, route.name, json.dumps(points), route.description, *columns.values()))
         conn.commit()
 
         new_route = cursor.fetchone()
 
         return {"success": True, "data": parse_route(new_route)}
 
+    except PoolTimeoutError:
+        raise
     except Exception as e:
         conn.rollback()
         print(f"Error creating route: {e}")
@@ -275,7 +696,187 @@ def create_route(route: RouteCreate, username: Optional[str] = None):
         return {"success": False, "error": str(e)}
     finally:
         cursor.close()
-        conn.close()
+        release_db_connection(conn)
+
+def import_route_file(source: IO[bytes], file_format: str, username: str,
+                      default_name: str, simplify_km: float) -> dict:
+    """解析上传的文件并在一个事务中写入所有路线（在线程池中执行）"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        user_id = get_user_id_by_username(username, cursor)
+        if not user_id:
+            return {"success": False, "error": "用户不存在"}
+
+        result = import_tracks(cursor, user_id, iter_tracks(source, file_format), default_name, simplify_km)
+        conn.commit()
+
+        return {
+            "success": True,
+            "count": len(result["routes"]),
+            "data": result["routes"],
+            "skipped_tracks": result["skipped_tracks"],
+            "dropped_points": result["dropped_points"]
+        }
+
+    except ImportFormatError as e:
+        conn.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except PoolTimeoutError:
+        raise
+    except Exception as e:
+        conn.rollback()
+        print(f"Error importing routes: {e}")
+        import traceback
+        traceback.print_exc()
+        return {"success": False, "error": str(e)}
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+@router.post("/import")
+async def import_routes(
+    request: Request,
+    username: str,
+    file_format: str = Query(..., alias="format", pattern="^(kml|kmz|gpx)$"),
+    name: Optional[str] = None,
+    simplify_km: float = Query(DEFAULT_IMPORT_SIMPLIFY_KM, ge=0, le=1)
+):
+    """
+    批量导入路线：请求体为 KML / KMZ / GPX 文件内容本身（不是表单），每条轨迹导入为一条路线
+    轨迹名称缺省时为 name（默认“导入路线”）加序号；simplify_km 为简化容差（公里，0 为不简化）
+    上传内容先写入临时文件，再在线程池中流式解析，全部路线在同一个事务中写入
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_BYTES)
+    try:
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > MAX_IMPORT_BYTES:
+                raise HTTPException(status_code=413, detail="文件过大")
+            spool.write(chunk)
+        if not size:
+            raise HTTPException(status_code=400, detail="文件为空")
+        spool.seek(0)
+
+        return await run_in_threadpool(
+            import_route_file, spool, file_format, username, name or "导入路线", simplify_km
+        )
+    finally:
+        spool.close()
+
+@router.post("/plan")
+def plan_route(plan: RoutePlanRequest):
+    """
+    规划景点游览顺序：景点为 scenic_ids，未提供时为 username 的收藏
+    start 为起点（可选，return_to_start=true 时返回起点）；max_hours（行驶 + 游览时间）、
+    max_budget（门票）、max_distance_km 为上限，超出时舍弃评分相对较低的景点；距离为直线距离
+    返回的 points 可直接作为创建路线接口的 points
+    """
+    if plan.return_to_start and plan.start is None:
+        raise HTTPException(status_code=400, detail="返回起点时需要提供 start")
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        scenic_ids = plan.scenic_ids
+        if scenic_ids is None:
+            if not plan.username:
+                raise HTTPException(status_code=400, detail="需要提供 scenic_ids 或 username")
+            user_id = get_user_id_by_username(plan.username, cursor)
+            if not user_id:
+                return {"success": False, "error": "用户不存在"}
+            cursor.execute("SELECT scenic_id FROM actions.favorites WHERE user_id = %s ORDER BY create_time;",
+                           (user_id,))
+            scenic_ids = [row['scenic_id'] for row in cursor.fetchall()]
+
+        scenic_ids = list(dict.fromkeys(scenic_ids))
+        if len(scenic_ids) > MAX_PLAN_STOPS:
+            raise HTTPException(status_code=400, detail=f"一次最多规划 {MAX_PLAN_STOPS} 个景点")
+
+        cursor.execute("""
+        SELECT id, name, longitude, latitude, score, price
+        FROM scenic.scenic WHERE id = ANY(%s);
+        """, (scenic_ids,))
+        found = {row['id']: row for row in cursor.fetchall()}
+        stops, skipped = [], []
+        for scenic_id in scenic_ids:
+            row = found.get(scenic_id)
+            if row is None:
+                skipped.append({"id": scenic_id, "name": None, "reason": "not_found"})
+            elif not all(v is not None and math.isfinite(v) for v in (row['longitude'], row['latitude'])):
+                skipped.append({"id": scenic_id, "name": row['name'], "reason": "no_location"})
+            else:
+                stops.append(row)
+        if not stops:
+            raise HTTPException(status_code=400, detail="没有可规划的景点")
+
+        # 距离矩阵：第 0 个节点为起点，最后一个为终点
+        lons = np.array([row['longitude'] for row in stops], dtype=np.float64)
+        lats = np.array([row['latitude'] for row in stops], dtype=np.float64)
+        start_dist = haversine_km(plan.start.longitude, plan.start.latitude, lons, lats) if plan.start else None
+        dist = plan_matrix(distance_matrix(lons, lats), start_dist, plan.return_to_start)
+        # 没有评分的景点按 1 分计，评分为 0 的景点保持 0
+        values = np.array([0.0, *(1.0 if row['score'] is None else float(row['score']) for row in stops), 0.0])
+        prices = np.array([0.0, *(float(row['price'] or 0.0) for row in stops), 0.0])
+        limits = PlanLimits(plan.max_hours, plan.max_budget, plan.max_distance_km, plan.speed_kmh, plan.visit_minutes)
+        result = plan_tour(dist, values, prices, limits, plan.start is None, plan.time_limit_ms)
+
+        # 各景点的到达里程
+        path = result['path']
+        legs = dist[path[:-1], path[1:]]
+        ordered = []
+        cumulative = 0.0
+        for node, leg in zip(path[1:-1], legs.tolist()):
+            row = stops[node - 1]
+            cumulative += leg
+            ordered.append({
+                "id": row['id'], "name": row['name'],
+                "longitude": row['longitude'], "latitude": row['latitude'],
+                "score": float(row['score']) if row['score'] is not None else None,
+                "price": float(row['price']) if row['price'] is not None else None,
+                "leg_km": round(leg, 1), "cumulative_km": round(cumulative, 1)
+            })
+        skipped.extend(
+            {"id": stops[node - 1]['id'], "name": stops[node - 1]['name'], "reason": "limit"}
+            for node in result['dropped']
+        )
+
+        start_point = (
+            [{"longitude": plan.start.longitude, "latitude": plan.start.latitude, "name": plan.start.name or "起点"}]
+            if plan.start else []
+        )
+        points = start_point + [
+            {"longitude": s['longitude'], "latitude": s['latitude'], "name": s['name']} for s in ordered
+        ] + (start_point if plan.return_to_start else [])
+
+        return {
+            "success": True,
+            "data": {
+                "stops": ordered,
+                "skipped": skipped,
+                "points": points,
+                "distance": round(result['distance'], 1),
+                "initial_distance": round(result['initial_distance'], 1),
+                "travel_hours": round(result['travel_hours'], 2),
+                "visit_hours": round(result['visit_hours'], 2),
+                "total_hours": round(result['total_hours'], 2),
+                "ticket_cost": round(result['ticket_cost'], 2),
+                "elapsed_ms": round(result['elapsed_ms'], 1)
+            }
+        }
+
+    except (HTTPException, PoolTimeoutError):
+        raise
+    except Exception as e:
+        print(f"Error planning route: {e}")
+        import traceback
+        traceback.print_exc()
+        return {"success": False, "error": str(e)}
+    finally:
+        cursor.close()
+        release_db_connection(conn)
 
 @router.put("/{route_id}")
 def update_route(route_id: int, route: RouteUpdate):
@@ -294,8 +895,12 @@ def update_route(route_id: int, route: RouteUpdate):
             updates.append("description = %s")
             values.append(route.description)
         if route.points is not None:
+            points = prepare_route_points([p.dict() for p in route.points])
             updates.append("scenic_list = %s")
-            values.append(json.dumps([p.dict() for p in route.points]))
+            values.append(json.dumps(points))
+            for column, value in route_columns(points, compute_route_metrics([points])[0]).items():
+                updates.append(f"{column} = %s")
+                values.append(value)
         
         if not updates:
             return {"success": False, "error": "No fields to update"}
@@ -305,7 +910,7 @@ def update_route(route_id: int, route: RouteUpdate):
         query = f"""
         UPDATE actions.routes SET {', '.join(updates)}
         WHERE id = %s
-        RETURNING id, user_id, name, scenic_list, description, create_time;
+        RETURNING {ROUTE_FIELDS};
         """
         cursor.execute(query, values)
         conn.commit()
@@ -316,12 +921,14 @@ def update_route(route_id: int, route: RouteUpdate):
         else:
             return {"success": False, "error": "Route not found"}
 
+    except PoolTimeoutError:
+        raise
     except Exception as e:
         conn.rollback()
         return {"success": False, "error": str(e)}
     finally:
         cursor.close()
-        conn.close()
+        release_db_connection(conn)
 
 @router.delete("/{route_id}")
 def delete_route(route_id: int):
@@ -340,9 +947,11 @@ def delete_route(route_id: int):
         else:
             return {"success": False, "error": "Route not found"}
 
+    except PoolTimeoutError:
+        raise
     except Exception as e:
         conn.rollback()
         return {"success": False, "error": str(e)}
     finally:
         cursor.close()
-        conn.close()
\ No newline at end of file
+        release_db_connection(conn)
\ No newline at end of file
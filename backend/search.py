@@ -0,0 +1,178 @@
+"""
+search.py - 知识图谱的服务端分面筛选
+每个数据集的快照上预先为每个筛选字段的每个取值建立位图（Python 大整数，第 i 位对应快照第 i 行），
+组合筛选只是若干次按位与/或运算，同时用 bit_count 统计剩余结果中各取值的数量
+"""
+import bisect
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from datasets import DATASETS, snapshots, get_id_list
+from spatial import BBox, get_grid_index
+
+# 筛选参数 -> {数据集: 字段}
+SEARCH_FACETS = {
+    "dynasty": {"poems": "dynasty"},
+    "author": {"poems": "author"},
+    "poemtype": {"poems": "poemtype"},
+    "province": {"poems": "province", "heritage": "province", "history": "province"},
+    "city": {"poems": "city", "history": "city"},
+    "county": {"poems": "county", "history": "county"},
+    "heritage_type": {"heritage": "type"},
+    "rx_time": {"heritage": "rx_time"},
+    "people": {"history": "people"},
+    "period": {"history": "period"},
+    "property": {"history": "property"},
+    "sight_level": {"scenic": "sight_level"},
+}
+
+# 评分区间筛选只作用于景点
+SCORE_DATASET = "scenic"
+
+
+def positions_to_bitmap(positions: Sequence[int]) -> int:
+    """行号列表 -> 位图"""
+    if not positions:
+        return 0
+    buf = bytearray(max(positions) // 8 + 1)
+    for i in positions:
+        buf[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buf, "little")
+
+
+def bitmap_to_positions(bitmap: int) -> List[int]:
+    """位图 -> 行号列表（升序）"""
+    positions = []
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+    for byte_index, byte in enumerate(data):
+        base = byte_index << 3
+        while byte:
+            low = byte & -byte
+            positions.append(base + low.bit_length() - 1)
+            byte ^= low
+    return positions
+
+
+class FacetBitmaps:
+    """某个数据集快照上的分面位图索引"""
+
+    def __init__(self, rows: List[dict], fields: Sequence[str], score_field: Optional[str] = None):
+        self.size = len(rows)
+        self.all = (1 << self.size) - 1
+        positions: Dict[str, Dict[str, List[int]]] = {field: {} for field in fields}
+        scores: Dict[float, List[int]] = {}
+        for i, row in enumerate(rows):
+            for field in fields:
+                value = row.get(field)
+                if value is not None and value != "":
+                    positions[field].setdefault(str(value), []).append(i)
+            if score_field is not None and row.get(score_field) is not None:
+                scores.setdefault(float(row[score_field]), []).append(i)
+
+        self.bitmaps: Dict[str, Dict[str, int]] = {
+            field: {value: positions_to_bitmap(p) for value, p in values.items()}
+            for field, values in positions.items()
+        }
+        # 评分按取值升序排列，区间查询时二分定位后合并对应的位图
+        self.score_values = sorted(scores)
+        self.score_bitmaps = [positions_to_bitmap(scores[v]) for v in self.score_values]
+
+    def match(self, field: str, values: Sequence[str]) -> int:
+        """字段取值为 values 中任意一个的行"""
+        bitmaps = self.bitmaps.get(field, {})
+        result = 0
+        for value in values:
+            result |= bitmaps.get(value, 0)
+        return result
+
+    def score_range(self, min_score: Optional[float], max_score: Optional[float]) -> int:
+        start = 0 if min_score is None else bisect.bisect_left(self.score_values, min_score)
+        end = len(self.score_values) if max_score is None else bisect.bisect_right(self.score_values, max_score)
+        result = 0
+        for bitmap in self.score_bitmaps[start:end]:
+            result |= bitmap
+        return result
+
+    def counts(self, field: str, result: int) -> Dict[str, int]:
+        """result 中该字段各取值的数量（只返回数量大于 0 的取值）"""
+        counts = {}
+        for value, bitmap in self.bitmaps.get(field, {}).items():
+            count = (bitmap & result).bit_count()
+            if count:
+                counts[value] = count
+        return counts
+
+
+def get_facet_bitmaps(snapshot) -> FacetBitmaps:
+    """获取快照对应的分面位图索引（随快照缓存）"""
+    fields = [spec[snapshot.name] for spec in SEARCH_FACETS.values() if snapshot.name in spec]
+    score_field = "score" if snapshot.name == SCORE_DATASET else None
+    return snapshot.derived("facet_bitmaps", lambda s: FacetBitmaps(s.rows, fields, score_field))
+
+
+def filter_rows(filters: Dict[str, List[str]], bbox: Optional[BBox] = None,
+                types: Optional[Sequence[str]] = None, min_score: Optional[float] = None,
+                max_score: Optional[float] = None) -> Dict[str, Tuple[object, int]]:
+    """
+    在四个数据集中按组合条件筛选，返回 {数据集: (快照, 满足条件的行位图)}
+    - 同一筛选参数的多个取值之间为“或”，不同参数之间为“且”
+    - 数据集没有某个已设置的筛选字段时，该数据集不返回结果（如设置了朝代时只返回诗词）
+    """
+    active = {param: values for param, values in filters.items() if values}
+    score_active = min_score is not None or max_score is not None
+    matched = {}
+
+    for name in DATASETS:
+        snapshot = snapshots.get(name)
+        matched[name] = (snapshot, 0)
+        if types and name not in types:
+            continue
+        if any(name not in SEARCH_FACETS[param] for param in active):
+            continue
+        if score_active and name != SCORE_DATASET:
+            continue
+
+        index = get_facet_bitmaps(snapshot)
+        result = index.all
+        for param, values in active.items():
+            result &= index.match(SEARCH_FACETS[param][name], values)
+        if score_active:
+            result &= index.score_range(min_score, max_score)
+        if bbox is not None and result:
+            result &= positions_to_bitmap(get_grid_index(snapshot).query(bbox))
+        matched[name] = (snapshot, result)
+    return matched
+
+
+def search(filters: Dict[str, List[str]], bbox: Optional[BBox] = None,
+           types: Optional[Sequence[str]] = None, min_score: Optional[float] = None,
+           max_score: Optional[float] = None, with_counts: bool = True) -> Tuple[dict, Tuple[str, ...]]:
+    """
+    组合筛选，返回 (各数据集满足条件的 id 及剩余取值数量, 各数据集快照 ETag)
+    """
+    ids: Dict[str, List[int]] = {}
+    facet_counts: Dict[str, Dict[str, int]] = {param: {} for param in SEARCH_FACETS}
+    matched = filter_rows(filters, bbox, types, min_score, max_score)
+
+    for name, (snapshot, result) in matched.items():
+        if types and name not in types:
+            continue
+        id_list = get_id_list(snapshot)
+        ids[name] = [id_list[i] for i in bitmap_to_positions(result)]
+
+        if with_counts and result:
+            index = get_facet_bitmaps(snapshot)
+            for param, spec in SEARCH_FACETS.items():
+                if name in spec:
+                    for value, count in index.counts(spec[name], result).items():
+                        facet_counts[param][value] = facet_counts[param].get(value, 0) + count
+
+    payload = {
+        "count": sum(len(v) for v in ids.values()),
+        "data": ids,
+    }
+    if with_counts:
+        payload["facets"] = {
+            param: dict(sorted(counts.items(), key=lambda item: (-item[1], item[0])))
+            for param, counts in facet_counts.items()
+        }
+    return payload, tuple(snapshot.etag for snapshot, _ in matched.values())
@@ -0,0 +1,106 @@
+"""
+spatial.py - 基于内存快照的网格空间索引
+地图平移、缩放时只返回视野范围内的要素，查询耗时与可见要素数量相关，与表大小无关
+"""
+import math
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+# 网格单元大小（度）
+GRID_CELL_SIZE = 0.25
+# 缩放级别低于该值时按屏幕像素网格抽稀
+THIN_MAX_ZOOM = 12
+# 抽稀网格的像素大小：每个 THIN_PIXELS x THIN_PIXELS 像素的方格内只保留一个要素
+THIN_PIXELS = 8
+
+BBox = Tuple[float, float, float, float]
+
+
+def parse_bbox(bbox: Optional[str]) -> Optional[BBox]:
+    """解析 bbox=minLon,minLat,maxLon,maxLat 参数"""
+    if bbox is None or bbox == "":
+        return None
+    try:
+        min_lon, min_lat, max_lon, max_lat = [float(v) for v in bbox.split(",")]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox 格式应为 minLon,minLat,maxLon,maxLat")
+    if not all(math.isfinite(v) for v in (min_lon, min_lat, max_lon, max_lat)):
+        raise HTTPException(status_code=400, detail="bbox 坐标必须为有效数值")
+    if min_lon > max_lon or min_lat > max_lat:
+        raise HTTPException(status_code=400, detail="bbox 最小值不能大于最大值")
+    return (max(min_lon, -180.0), max(min_lat, -90.0), min(max_lon, 180.0), min(max_lat, 90.0))
+
+
+def thin_cell_size(zoom: float) -> float:
+    """缩放级别 zoom 下一个抽稀方格对应的经纬度跨度（Web 墨卡托、256 像素瓦片）"""
+    return 360.0 / (256 * 2 ** zoom) * THIN_PIXELS
+
+
+class GridIndex:
+    """
+    等经纬度网格索引
+    每个格子保存落在其中的行号（快照 rows 中的下标），行号按 id 升序
+    """
+
+    def __init__(self, rows: List[dict], cell_size: float = GRID_CELL_SIZE):
+        self.cell_size = cell_size
+        self.lons = [float(row['longitude']) for row in rows]
+        self.lats = [float(row['latitude']) for row in rows]
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+        for i, (lon, lat) in enumerate(zip(self.lons, self.lats)):
+            self.cells.setdefault(self._cell(lon, lat), []).append(i)
+
+    def _cell(self, lon: float, lat: float) -> Tuple[int, int]:
+        return (math.floor(lon / self.cell_size), math.floor(lat / self.cell_size))
+
+    def query(self, bbox: BBox) -> List[int]:
+        """返回 bbox 内所有要素的行号（升序）"""
+        min_lon, min_lat, max_lon, max_lat = bbox
+        x0, y0 = self._cell(min_lon, min_lat)
+        x1, y1 = self._cell(max_lon, max_lat)
+
+        # 视野覆盖的格子比有数据的格子还多时，直接遍历有数据的格子
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self.cells):
+            candidates = (
+                cell for key, cell in self.cells.items()
+                if x0 <= key[0] <= x1 and y0 <= key[1] <= y1
+            )
+        else:
+            candidates = (
+                self.cells[(x, y)]
+                for x in range(x0, x1 + 1)
+                for y in range(y0, y1 + 1)
+                if (x, y) in self.cells
+            )
+
+        result = []
+        lons, lats = self.lons, self.lats
+        for cell in candidates:
+            for i in cell:
+                if min_lon <= lons[i] <= max_lon and min_lat <= lats[i] <= max_lat:
+                    result.append(i)
+        result.sort()
+        return result
+
+    def all(self) -> List[int]:
+        return list(range(len(self.lons)))
+
+    def thin(self, positions: List[int], zoom: float) -> List[int]:
+        """低缩放级别下抽稀：每个屏幕方格只保留 id 最小的要素"""
+        if zoom >= THIN_MAX_ZOOM:
+            return positions
+        size = thin_cell_size(zoom)
+        seen = set()
+        result = []
+        for i in positions:
+            key = (math.floor(self.lons[i] / size), math.floor(self.lats[i] / size))
+            if key not in seen:
+                seen.add(key)
+                result.append(i)
+        return result
+
+
+def get_grid_index(snapshot) -> GridIndex:
+    """获取快照对应的网格索引（随快照缓存）"""
+    return snapshot.derived("grid_index", lambda s: GridIndex(s.rows))
@@ -0,0 +1,212 @@
+"""
+textsearch.py - 中文全文检索
+在每个数据集的快照上建立进程内倒排索引：汉字按单字和相邻二字（bigram）切分，
+查询时取各检索词二字组的倒排列表求交，再用原文子串校验，按 BM25 排序并生成高亮摘要
+"""
+import html
+import math
+import re
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from datasets import DATASETS, snapshots
+
+# 参与检索的字段及权重（名称命中比正文命中更重要）
+TEXT_FIELDS = {
+    "poems": {"name": 2.0, "content": 1.0},
+    "heritage": {"name": 2.0, "content": 1.0},
+    "history": {"name": 2.0, "description": 1.0},
+    "scenic": {"name": 2.0, "description": 1.0, "comment": 0.5},
+}
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# 检索词最大长度和个数
+MAX_QUERY_LENGTH = 64
+MAX_QUERY_TERMS = 8
+# 高亮摘要长度（字符）
+SNIPPET_CHARS = 80
+# 缓存最近的排序结果，翻页时不重新检索
+RESULT_CACHE_SIZE = 256
+
+_WORD_RUNS = re.compile(r"\w+")
+# 已分词文本中汉字之间的空白（如景点评论），去掉后才能匹配跨词的二字组
+_CJK_GAP = re.compile(r"(?<=[㐀-鿿])\s+(?=[㐀-鿿])")
+
+
+def normalize_text(value) -> str:
+    """NFKC 规范化、转小写，并去掉汉字之间的空白"""
+    if not value:
+        return ""
+    text = unicodedata.normalize("NFKC", str(value)).lower()
+    return _CJK_GAP.sub("", text)
+
+
+def index_tokens(text: str) -> List[str]:
+    """建索引用的词元：每个连续字符片段的单字和二字组"""
+    tokens = []
+    for run in _WORD_RUNS.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def query_tokens(term: str) -> List[str]:
+    """检索词的词元：单字检索词用单字，否则用二字组"""
+    tokens = []
+    for run in _WORD_RUNS.findall(term):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return list(dict.fromkeys(tokens))
+
+
+def parse_query(q: str) -> List[str]:
+    """按空白拆分检索词，各检索词之间为“且”"""
+    terms = [normalize_text(t) for t in q[:MAX_QUERY_LENGTH].split()]
+    return list(dict.fromkeys(t for t in terms if _WORD_RUNS.search(t)))[:MAX_QUERY_TERMS]
+
+
+class TextIndex:
+    """某个数据集快照的倒排索引，文档为快照中的行号"""
+
+    def __init__(self, rows: List[dict], fields: Dict[str, float]):
+        self.fields = fields
+        self.texts: List[Dict[str, str]] = []
+        self.lengths = array("f")
+        counts: Dict[str, Dict[int, float]] = {}
+        for i, row in enumerate(rows):
+            texts = {field: normalize_text(row.get(field)) for field in fields}
+            self.texts.append(texts)
+            length = 0.0
+            for field, weight in fields.items():
+                tokens = index_tokens(texts[field])
+                length += weight * len(tokens)
+                for token in tokens:
+                    doc_counts = counts.setdefault(token, {})
+                    doc_counts[i] = doc_counts.get(i, 0.0) + weight
+            self.lengths.append(length)
+
+        self.size = len(rows)
+        self.avg_length = (sum(self.lengths) / self.size) if self.size else 0.0
+        # 词元 -> (行号数组, 加权词频数组)，行号升序
+        self.postings: Dict[str, Tuple[array, array]] = {
+            token: (array("I", doc_counts.keys()), array("f", doc_counts.values()))
+            for token, doc_counts in counts.items()
+        }
+
+    def search(self, terms: Sequence[str]) -> List[Tuple[float, int]]:
+        """返回同时包含全部检索词的行 (BM25 分数, 行号)"""
+        tokens = list(dict.fromkeys(t for term in terms for t in query_tokens(term)))
+        if not tokens or any(t not in self.postings for t in tokens):
+            return []
+
+        # 从最短的倒排列表开始求交
+        tokens.sort(key=lambda t: len(self.postings[t][0]))
+        candidates = set(self.postings[tokens[0]][0])
+        for token in tokens[1:]:
+            candidates.intersection_update(self.postings[token][0])
+            if not candidates:
+                return []
+
+        # 二字组都出现不代表检索词连续出现，用原文再校验一次
+        candidates = {
+            i for i in candidates
+            if all(any(term in text for text in self.texts[i].values()) for term in terms)
+        }
+        if not candidates:
+            return []
+
+        scores = dict.fromkeys(candidates, 0.0)
+        for token in tokens:
+            positions, freqs = self.postings[token]
+            idf = math.log(1 + (self.size - len(positions) + 0.5) / (len(positions) + 0.5))
+            for i, tf in zip(positions, freqs):
+                if i in scores:
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[i] / self.avg_length)
+                    scores[i] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return [(score, i) for i, score in scores.items()]
+
+    def highlight(self, position: int, terms: Sequence[str]) -> Dict[str, str]:
+        """命中字段的摘要，检索词用 <em> 标出（其余文本已做 HTML 转义）"""
+        pattern = re.compile("|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True)))
+        result = {}
+        for field, text in self.texts[position].items():
+            match = pattern.search(text)
+            if match is None:
+                continue
+            start = max(0, match.start() - SNIPPET_CHARS // 4)
+            end = min(len(text), start + SNIPPET_CHARS)
+            snippet = text[start:end]
+            parts = []
+            last = 0
+            for m in pattern.finditer(snippet):
+                parts.append(html.escape(snippet[last:m.start()]))
+                parts.append("<em>" + html.escape(m.group()) + "</em>")
+                last = m.end()
+            parts.append(html.escape(snippet[last:]))
+            result[field] = ("…" if start > 0 else "") + "".join(parts) + ("…" if end < len(text) else "")
+        return result
+
+
+def get_text_index(snapshot) -> TextIndex:
+    """获取快照对应的全文索引（随快照缓存）"""
+    return snapshot.derived("text_index", lambda s: TextIndex(s.rows, TEXT_FIELDS[s.name]))
+
+
+_results: "OrderedDict[tuple, List[Tuple[float, str, int]]]" = OrderedDict()
+_results_lock = threading.Lock()
+
+
+def text_search(q: str, types: Optional[Sequence[str]] = None,
+                offset: int = 0, limit: int = 20) -> dict:
+    """
+    全文检索，结果按相关度降序分页
+    排序结果按 (各数据集快照版本, 检索词, 数据集) 缓存，翻页和重复查询不重新检索
+    """
+    terms = parse_query(q)
+    names = [name for name in DATASETS if not types or name in types]
+    current = {name: snapshots.get(name) for name in names}
+    if not terms:
+        return {"total": 0, "count": 0, "data": [], "next_offset": None}
+
+    key = (tuple(s.etag for s in current.values()), tuple(terms), tuple(names))
+    with _results_lock:
+        ranked = _results.get(key)
+        if ranked is not None:
+            _results.move_to_end(key)
+    if ranked is None:
+        ranked = []
+        for name, snapshot in current.items():
+            ranked.extend((score, name, i) for score, i in get_text_index(snapshot).search(terms))
+        ranked.sort(key=lambda item: (-item[0], item[1], item[2]))
+        with _results_lock:
+            _results[key] = ranked
+            while len(_results) > RESULT_CACHE_SIZE:
+                _results.popitem(last=False)
+
+    items = []
+    for score, name, i in ranked[offset:offset + limit]:
+        row = current[name].rows[i]
+        items.append({
+            "type": name,
+            "id": row['id'],
+            "name": row.get('name'),
+            "score": round(score, 4),
+            "highlights": get_text_index(current[name]).highlight(i, terms),
+        })
+    next_offset = offset + limit if offset + limit < len(ranked) else None
+    return {"total": len(ranked), "count": len(items), "data": items, "next_offset": next_offset}
+
+
+def warm_text_indexes():
+    """预先加载快照并建立全文索引，避免首次检索时等待建索引（在后台线程中调用）"""
+    for name in DATASETS:
+        try:
+            get_text_index(snapshots.get(name))
+        except Exception as e:
+            print(f"预建全文索引失败 ({name}): {e}")
@@ -0,0 +1,129 @@
+"""
+tiles.py - 矢量瓦片（MVT）接口
+/tiles/{layer}/{z}/{x}/{y}.pbf 提供诗词、非遗、历史、景点四个图层，
+瓦片只包含地图展示所需的字段，并缓存在磁盘上；数据变化后旧版本瓦片自动清理
+"""
+import os
+import shutil
+import threading
+from decimal import Decimal
+
+from fastapi import APIRouter, HTTPException, Request, Response
+
+from cache import HTTP_MAX_AGE, derive_etag, etag_matches
+from datasets import DATASETS, MAP_FIELDS, snapshots
+from mvt import encode_point_layer, lonlat_to_tile, tile_bounds, EXTENT
+from spatial import get_grid_index, THIN_MAX_ZOOM
+
+router = APIRouter(prefix="/tiles", tags=["tiles"])
+
+# 瓦片磁盘缓存目录
+TILE_CACHE_DIR = os.getenv("TILE_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "tile_cache"))
+MAX_TILE_ZOOM = 22
+# 瓦片四周的缓冲区（瓦片坐标单位），避免图标在瓦片边界被截断
+TILE_BUFFER = 64
+# 低缩放级别下每个 TILE_THIN_UNITS x TILE_THIN_UNITS 的瓦片坐标方格只保留一个要素（约 4 像素）
+TILE_THIN_UNITS = 64
+
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+
+_cleanup_lock = threading.Lock()
+# 图层 -> (快照代数, 瓦片缓存版本)
+_current_versions = {}
+
+
+def _version_key(snapshot) -> str:
+    """以快照内容哈希作为瓦片缓存版本，数据不变时重启服务也能复用磁盘缓存"""
+    return snapshot.etag.strip('"')[:16]
+
+
+def _cleanup_old_versions(layer: str, snapshot) -> bool:
+    """
+    数据变化后删除该图层旧版本的瓦片缓存
+    仍持有旧快照的请求（快照代数小于已记录的）不做清理，返回 False，调用方不应写入磁盘缓存
+    """
+    version = _version_key(snapshot)
+    with _cleanup_lock:
+        generation, current = _current_versions.get(layer, (0, None))
+        if snapshot.version < generation:
+            return False
+        if current != version:
+            layer_dir = os.path.join(TILE_CACHE_DIR, layer)
+            if os.path.isdir(layer_dir):
+                for entry in os.listdir(layer_dir):
+                    if entry != version:
+                        shutil.rmtree(os.path.join(layer_dir, entry), ignore_errors=True)
+        _current_versions[layer] = (snapshot.version, version)
+        return True
+
+
+def _tile_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def build_tile(snapshot, layer: str, z: int, x: int, y: int) -> bytes:
+    """生成一个瓦片"""
+    min_lon, min_lat, max_lon, max_lat = tile_bounds(z, x, y)
+    # 按缓冲区扩大查询范围
+    pad_lon = (max_lon - min_lon) * TILE_BUFFER / EXTENT
+    pad_lat = (max_lat - min_lat) * TILE_BUFFER / EXTENT
+    index = get_grid_index(snapshot)
+    positions = index.query((min_lon - pad_lon, min_lat - pad_lat, max_lon + pad_lon, max_lat + pad_lat))
+    if not positions:
+        return b""
+
+    fields = [f for f in MAP_FIELDS[layer] if f not in ("id", "longitude", "latitude")]
+    features = []
+    seen = set()
+    for i in positions:
+        row = snapshot.rows[i]
+        px, py = lonlat_to_tile(index.lons[i], index.lats[i], z, x, y)
+        if z < THIN_MAX_ZOOM:
+            cell = (px // TILE_THIN_UNITS, py // TILE_THIN_UNITS)
+            if cell in seen:
+                continue
+            seen.add(cell)
+        features.append((row['id'], px, py, {f: _tile_value(row.get(f)) for f in fields}))
+    return encode_point_layer(layer, features)
+
+
+@router.get("/{layer}/{z}/{x}/{y}.pbf")
+def get_tile(request: Request, layer: str, z: int, x: int, y: int):
+    """获取矢量瓦片（Mapbox Vector Tile），OpenLayers 可通过 VectorTile 图层直接加载"""
+    if layer not in DATASETS:
+        raise HTTPException(status_code=404, detail=f"未知图层: {layer}")
+    if not (0 <= z <= MAX_TILE_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=400, detail="瓦片坐标超出范围")
+
+    snapshot = snapshots.get(layer)
+    version = _version_key(snapshot)
+    etag = derive_etag(snapshot.etag, "tile", z, x, y)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={HTTP_MAX_AGE}, must-revalidate",
+    }
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    path = os.path.join(TILE_CACHE_DIR, layer, version, str(z), str(x), f"{y}.pbf")
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            content = f.read()
+    else:
+        content = build_tile(snapshot, layer, z, x, y)
+        if not _cleanup_old_versions(layer, snapshot):
+            # 旧快照生成的瓦片只返回，不写入缓存
+            return Response(content=content, media_type=MVT_MEDIA_TYPE, headers=headers)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先写临时文件再改名，避免并发请求读到写了一半的瓦片
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"写入瓦片缓存失败: {e}")
+
+    return Response(content=content, media_type=MVT_MEDIA_TYPE, headers=headers)
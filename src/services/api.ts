@@ -114,6 +114,47 @@ export async function fetchPoemById(id: number): Promise<Poem | null> {
   }
 }
 
+export type DatasetName = 'poems' | 'heritage' | 'history' | 'scenic';
+
+export interface BatchResult {
+  poems: Record<string, Poem>;
+  heritage: Record<string, Heritage>;
+  history: Record<string, History>;
+  scenic: Record<string, Scenic>;
+}
+
+/**
+ * 批量获取多种类型的详情（一次请求，结果按类型和 id 分组）
+ * 用于知识图谱展开邻居节点，替代逐个调用 fetchPoemById
+ */
+export async function fetchBatchByIds(
+  ids: Partial<Record<DatasetName, number[]>>
+): Promise<BatchResult | null> {
+  try {
+    const response = await fetch(`${API_BASE_URL}/api/batch`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(ids)
+    });
+
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+
+    const result: ApiResponse<BatchResult> = await response.json();
+
+    if (result.success) {
+      return result.data;
+    } else {
+      console.error('❌ API 返回错误:', result.error);
+      return null;
+    }
+  } catch (error) {
+    console.error('❌ 批量获取详情失败:', error);
+    return null;
+  }
+}
+
 /**
  * 获取所有非遗数据
  */
@@ -238,3 +279,323 @@ export async function fetchFilterOptions(): Promise<FilterOptions | null> {
     return null;
   }
 }
+
+export interface SearchFilters {
+  dynasty?: string[];
+  author?: string[];
+  poemtype?: string[];
+  province?: string[];
+  city?: string[];
+  county?: string[];
+  heritage_type?: string[];
+  rx_time?: string[];
+  people?: string[];
+  period?: string[];
+  property?: string[];
+  sight_level?: string[];
+  score_min?: number;
+  score_max?: number;
+  bbox?: [number, number, number, number];
+  types?: DatasetName[];
+}
+
+export interface SearchResult {
+  count: number;
+  data: Partial<Record<DatasetName, number[]>>;
+  facets?: Record<string, Record<string, number>>;
+}
+
+/**
+ * 服务端组合筛选：返回各数据集中满足条件的 id 以及剩余结果中各筛选取值的数量
+ */
+export async function searchItems(filters: SearchFilters): Promise<SearchResult | null> {
+  try {
+    const params = new URLSearchParams();
+    Object.entries(filters).forEach(([key, value]) => {
+      if (value === undefined || value === null) return;
+      if (key === 'bbox') {
+        params.append(key, (value as number[]).join(','));
+      } else if (Array.isArray(value)) {
+        value.forEach((v) => params.append(key, String(v)));
+      } else {
+        params.append(key, String(value));
+      }
+    });
+
+    const response = await fetch(`${API_BASE_URL}/api/search?${params.toString()}`);
+
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+
+    const result = await response.json();
+
+    if (result.success) {
+      return { count: result.count, data: result.data, facets: result.facets };
+    } else {
+      console.error('❌ API 返回错误:', result.error);
+      return null;
+    }
+  } catch (error) {
+    console.error('❌ 组合筛选失败:', error);
+    return null;
+  }
+}
+
+export interface TextSearchHit {
+  type: DatasetName;
+  id: number;
+  name: string;
+  score: number;
+  highlights: Record<string, string>;
+}
+
+export interface TextSearchResult {
+  total: number;
+  count: number;
+  data: TextSearchHit[];
+  next_offset: number | null;
+}
+
+/**
+ * 全文检索（诗词、非遗、历史、景点），结果按相关度排序并分页
+ * highlights 中的摘要已做 HTML 转义，检索词用 <em> 标出
+ */
+export async function searchText(
+  q: string,
+  offset: number = 0,
+  limit: number = 20,
+  types?: DatasetName[]
+): Promise<TextSearchResult | null> {
+  try {
+    const params = new URLSearchParams({ q, offset: String(offset), limit: String(limit) });
+    types?.forEach((t) => params.append('types', t));
+
+    const response = await fetch(`${API_BASE_URL}/api/search/text?${params.toString()}`);
+
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+
+    const result = await response.json();
+
+    if (result.success) {
+      return {
+        total: result.total,
+        count: result.count,
+        data: result.data,
+        next_offset: result.next_offset
+      };
+    } else {
+      console.error('❌ API 返回错误:', result.error);
+      return null;
+    }
+  } catch (error) {
+    console.error('❌ 全文检索失败:', error);
+    return null;
+  }
+}
+
+export type SuggestCategory = 'poem' | 'author' | 'heritage' | 'scenic' | 'city' | 'county';
+
+export interface Suggestion {
+  text: string;
+  category: SuggestCategory;
+  count: number;
+  match: 'text' | 'pinyin' | 'initials';
+  ids?: number[];
+}
+
+/**
+ * 搜索框输入提示（支持汉字、全拼和拼音首字母前缀）
+ */
+export async function fetchSuggestions(
+  q: string,
+  limit: number = 10,
+  categories?: SuggestCategory[]
+): Promise<Suggestion[]> {
+  try {
+    const params = new URLSearchParams({ q, limit: String(limit) });
+    categories?.forEach((c) => params.append('category', c));
+
+    const response = await fetch(`${API_BASE_URL}/api/autocomplete?${params.toString()}`);
+
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+
+    const result: ApiResponse<Suggestion[]> = await response.json();
+
+    if (result.success) {
+      return result.data;
+    } else {
+      console.error('❌ API 返回错误:', result.error);
+      return [];
+    }
+  } catch (error) {
+    console.error('❌ 获取输入提示失败:', error);
+    return [];
+  }
+}
+
+/**
+ * 服务端构建的知识图谱（紧凑格式）
+ * 节点 id 为数组下标，edges 为 [源, 目标, 源, 目标, ...] 扁平数组
+ */
+export interface CompactGraph {
+  mode: 'network' | 'independent';
+  node_types: string[];
+  node_count: number;
+  edge_count: number;
+  nodes: {
+    keys: string[];
+    labels: string[];
+    types: number[];
+    record_ids: Array<number | null>;
+    combos?: number[];
+  };
+  edges: number[];
+  combos?: {
+    keys: string[];
+    labels: string[];
+    types: number[];
+  };
+}
+
+/**
+ * 获取服务端构建的知识图谱（筛选参数与 searchItems 相同）
+ */
+export async function fetchGraph(
+  mode: 'network' | 'independent' = 'network',
+  filters: SearchFilters = {},
+  limit?: number
+): Promise<CompactGraph | null> {
+  try {
+    const params = new URLSearchParams({ mode });
+    Object.entries(filters).forEach(([key, value]) => {
+      if (value === undefined || value === null) return;
+      if (key === 'bbox') {
+        params.append(key, (value as number[]).join(','));
+      } else if (Array.isArray(value)) {
+        value.forEach((v) => params.append(key, String(v)));
+      } else {
+        params.append(key, String(value));
+      }
+    });
+    if (limit !== undefined) params.append('limit', String(limit));
+
+    const response = await fetch(`${API_BASE_URL}/api/graph?${params.toString()}`);
+
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+
+    const result: ApiResponse<CompactGraph> = await response.json();
+
+    if (result.success) {
+      return result.data;
+    } else {
+      console.error('❌ API 返回错误:', result.error);
+      return null;
+    }
+  } catch (error) {
+    console.error('❌ 获取知识图谱失败:', error);
+    return null;
+  }
+}
+
+export interface NeighborNode {
+  key: string;
+  label: string;
+  type: string;
+  hop: number;
+  dataset?: DatasetName;
+  id?: number;
+  kind?: string;
+  degree?: number;
+  truncated?: boolean;
+}
+
+export interface NeighborGraph {
+  node_count: number;
+  edge_count: number;
+  truncated: boolean;
+  nodes: NeighborNode[];
+  edges: number[];
+}
+
+/**
+ * 从一个节点出发按共享属性扩展 k 层邻居（用于知识图谱按需加载）
+ * 节点 key 与 buildGraphData 的 network 模式一致
+ */
+export async function fetchNeighbors(
+  dataset: DatasetName,
+  id: number,
+  k: number = 1,
+  maxDegree: number = 50,
+  via?: string[]
+): Promise<NeighborGraph | null> {
+  try {
+    const params = new URLSearchParams({ k: String(k), max_degree: String(maxDegree) });
+    via?.forEach((v) => params.append('via', v));
+
+    const response = await fetch(`${API_BASE_URL}/api/graph/neighbors/${dataset}/${id}?${params.toString()}`);
+
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+
+    const result: ApiResponse<NeighborGraph> = await response.json();
+
+    if (result.success) {
+      return result.data;
+    } else {
+      console.error('❌ API 返回错误:', result.error);
+      return null;
+    }
+  } catch (error) {
+    console.error('❌ 获取邻居节点失败:', error);
+    return null;
+  }
+}
+
+export type NearbyItem = Record<string, any> & { id: number; name: string; distance_km: number };
+
+/**
+ * 周边查询：景点（或任意坐标）附近的诗词、非遗、历史事件和景点，每类按距离升序
+ */
+export async function fetchNearby(
+  center: { scenicId: number } | { lon: number; lat: number },
+  radiusKm: number = 10,
+  limit: number = 10,
+  types?: DatasetName[]
+): Promise<Partial<Record<DatasetName, NearbyItem[]>> | null> {
+  try {
+    const params = new URLSearchParams({ radius_km: String(radiusKm), limit: String(limit) });
+    if ('scenicId' in center) {
+      params.append('scenic_id', String(center.scenicId));
+    } else {
+      params.append('lon', String(center.lon));
+      params.append('lat', String(center.lat));
+    }
+    types?.forEach((t) => params.append('types', t));
+
+    const response = await fetch(`${API_BASE_URL}/api/nearby?${params.toString()}`);
+
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+
+    const result: ApiResponse<Partial<Record<DatasetName, NearbyItem[]>>> = await response.json();
+
+    if (result.success) {
+      return result.data;
+    } else {
+      console.error('❌ API 返回错误:', result.error);
+      return null;
+    }
+  } catch (error) {
+    console.error('❌ 周边查询失败:', error);
+    return null;
+  }
+}
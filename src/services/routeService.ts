@@ -33,6 +33,7 @@ export interface CustomRoute {
   color: string;
   points: RoutePoint[];
   distance?: number;
+  points_count?: number;  // 完整路线的点数（points 为简化路线时与 points.length 不同）
   create_time?: string;
 }
 
@@ -189,14 +190,20 @@ export function calculateTotalDistance(points: RoutePoint[]): number {
 
 // ==================== 自定义路线 API 调用 ====================
 
+// 路线简化级别：low / medium / high 为后端预先简化的路线（只有经纬度），full 为完整路线
+export type RouteDetail = 'low' | 'medium' | 'high' | 'full';
+
 /**
  * 获取所有自定义路线（可选用户名筛选）
+ * 路线列表、地图概览可传入 detail 只获取简化后的路线
  */
-export async function getCustomRoutes(username?: string): Promise<CustomRoute[]> {
+export async function getCustomRoutes(username?: string, detail: RouteDetail = 'full'): Promise<CustomRoute[]> {
   try {
-    const url = username
-      ? `${API_BASE}/api/routes?username=${encodeURIComponent(username)}`
-      : `${API_BASE}/api/routes`;
+    const params = new URLSearchParams();
+    if (username) params.append('username', username);
+    if (detail !== 'full') params.append('detail', detail);
+    const query = params.toString();
+    const url = query ? `${API_BASE}/api/routes?${query}` : `${API_BASE}/api/routes`;
     const response = await fetch(url);
     const result = await response.json();
 
@@ -214,6 +221,28 @@ export async function getCustomRoutes(username?: string): Promise<CustomRoute[]>
   }
 }
 
+/**
+ * 根据 ID 获取单条自定义路线（打开路线查看、编辑时获取完整点位）
+ */
+export async function getCustomRouteById(id: number, detail: RouteDetail = 'full'): Promise<CustomRoute | null> {
+  try {
+    const query = detail !== 'full' ? `?detail=${detail}` : '';
+    const response = await fetch(`${API_BASE}/api/routes/${id}${query}`);
+    const result = await response.json();
+
+    if (result.success) {
+      return {
+        ...result.data,
+        color: generateRandomColor(),
+      };
+    }
+    return null;
+  } catch (error) {
+    console.error('获取路线失败:', error);
+    return null;
+  }
+}
+
 /**
  * 获取路线摘要（用于用户页面）
  */
@@ -321,6 +350,145 @@ export async function deleteCustomRoute(id: number): Promise<boolean> {
   }
 }
 
+// ==================== 路线空间查询 ====================
+
+export interface RouteBrief {
+  id: number;
+  user_id: number;
+  name: string;
+  description?: string;
+  create_time?: string;
+  distance?: number;
+  points_count?: number;
+  bbox?: [number, number, number, number] | null;
+  start?: [number, number] | null;
+  end?: [number, number] | null;
+  distance_km?: number;  // 周边/沿古道查询时为与目标的最近距离
+}
+
+async function fetchRouteBriefs(path: string, params: URLSearchParams, errorText: string): Promise<RouteBrief[]> {
+  try {
+    const response = await fetch(`${API_BASE}/api/routes/${path}?${params.toString()}`);
+    const result = await response.json();
+
+    if (result.success) {
+      return result.data;
+    }
+    console.error(`${errorText}:`, result.error ?? result.detail);
+    return [];
+  } catch (error) {
+    console.error(`${errorText}:`, error);
+    return [];
+  }
+}
+
+/**
+ * 查询经过指定范围 [minLon, minLat, maxLon, maxLat] 的路线
+ */
+export async function findRoutesInBBox(
+  bbox: [number, number, number, number],
+  username?: string
+): Promise<RouteBrief[]> {
+  const params = new URLSearchParams({ bbox: bbox.join(',') });
+  if (username) params.append('username', username);
+  return fetchRouteBriefs('within', params, '范围查询路线失败');
+}
+
+/**
+ * 查询经过景点（或任意坐标）附近的路线，按距离升序
+ */
+export async function findRoutesNear(
+  center: { scenicId: number } | { lon: number; lat: number },
+  radiusKm: number = 5,
+  username?: string
+): Promise<RouteBrief[]> {
+  const params = new URLSearchParams({ radius_km: String(radiusKm) });
+  if ('scenicId' in center) {
+    params.append('scenic_id', String(center.scenicId));
+  } else {
+    params.append('lon', String(center.lon));
+    params.append('lat', String(center.lat));
+  }
+  if (username) params.append('username', username);
+  return fetchRouteBriefs('near', params, '查询周边路线失败');
+}
+
+/**
+ * 查询与古道（如 金牛道）相交或距离不超过 bufferKm 公里的路线
+ */
+export async function findRoutesAlongRoad(
+  roadName: string,
+  bufferKm: number = 0,
+  username?: string
+): Promise<RouteBrief[]> {
+  const params = new URLSearchParams({ buffer_km: String(bufferKm) });
+  if (username) params.append('username', username);
+  return fetchRouteBriefs(`along/${encodeURIComponent(roadName)}`, params, '查询沿古道路线失败');
+}
+
+// ==================== 路线规划 ====================
+
+export interface RoutePlanOptions {
+  scenicIds?: number[];          // 未提供时使用 username 的收藏
+  username?: string;
+  start?: RoutePoint;
+  returnToStart?: boolean;
+  maxHours?: number;             // 行驶 + 游览时间上限
+  maxBudget?: number;            // 门票上限
+  maxDistanceKm?: number;
+  speedKmh?: number;
+  visitMinutes?: number;
+}
+
+export interface RoutePlan {
+  stops: {
+    id: number; name: string; longitude: number; latitude: number;
+    score: number | null; price: number | null; leg_km: number; cumulative_km: number;
+  }[];
+  skipped: { id: number; name: string | null; reason: 'not_found' | 'no_location' | 'limit' }[];
+  points: RoutePoint[];          // 可直接用 saveCustomRoute 保存
+  distance: number;
+  initial_distance: number;
+  travel_hours: number;
+  visit_hours: number;
+  total_hours: number;
+  ticket_cost: number;
+  elapsed_ms: number;
+}
+
+/**
+ * 规划景点游览顺序（后端最近邻 + 2-opt / Or-opt），超出时间、门票或距离上限时舍弃部分景点
+ */
+export async function planRoute(options: RoutePlanOptions): Promise<RoutePlan | null> {
+  try {
+    const response = await fetch(`${API_BASE}/api/routes/plan`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({
+        scenic_ids: options.scenicIds,
+        username: options.username,
+        start: options.start,
+        return_to_start: options.returnToStart ?? false,
+        max_hours: options.maxHours,
+        max_budget: options.maxBudget,
+        max_distance_km: options.maxDistanceKm,
+        speed_kmh: options.speedKmh,
+        visit_minutes: options.visitMinutes,
+      }),
+    });
+    const result = await response.json();
+
+    if (result.success) {
+      return result.data;
+    }
+    console.error('规划路线失败:', result.error ?? result.detail);
+    return null;
+  } catch (error) {
+    console.error('规划路线失败:', error);
+    return null;
+  }
+}
+
 // ==================== 工具函数 ====================
 
 export function generateRouteId(): string {
@@ -344,16 +512,19 @@ export async function fetchElevationForPoints(points: RoutePoint[]): Promise<num
   const locations = points.map(p => ({ latitude: p.latitude, longitude: p.longitude }));
 
   try {
-    const response = await fetch('https://api.open-elevation.com/api/v1/lookup', {
+    // 后端用本地 DEM 插值，没有 DEM 覆盖的点返回 null，这些点使用估算值
+    const response = await fetch(`${API_BASE}/api/elevation`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify({ locations }),
     });
 
     if (response.ok) {
-      const data = await response.json();
-      if (data.results && Array.isArray(data.results)) {
-        return data.results.map((r: { elevation: number }) => Math.round(r.elevation));
+      const result = await response.json();
+      if (result.success && Array.isArray(result.data)) {
+        const estimates = estimateElevation(points);
+        return result.data.map((elevation: number | null, i: number) =>
+          elevation === null ? estimates[i] ?? 0 : Math.round(elevation));
       }
     }
     return estimateElevation(points);
@@ -363,6 +534,29 @@ export async function fetchElevationForPoints(points: RoutePoint[]): Promise<num
   }
 }
 
+export interface RouteProfile {
+  id: number;
+  name: string;
+  distance: number;
+  ascent: number | null;
+  descent: number | null;
+  min_elevation: number | null;
+  max_elevation: number | null;
+  profile: { distance: number[]; elevation: (number | null)[] };
+}
+
+export async function fetchRouteProfile(id: number, samples?: number): Promise<RouteProfile | null> {
+  try {
+    const query = samples ? `?samples=${samples}` : '';
+    const response = await fetch(`${API_BASE}/api/routes/${id}/profile${query}`);
+    const result = await response.json();
+    return result.success ? result.data : null;
+  } catch (error) {
+    console.error('Failed to fetch route profile:', error);
+    return null;
+  }
+}
+
 function estimateElevation(points: RoutePoint[]): number[] {
   return points.map(p => {
     const lat = p.latitude;
@@ -375,55 +569,47 @@ function estimateElevation(points: RoutePoint[]): number[] {
   });
 }
 
-// ==================== KML 导入导出 ====================
-
-export async function parseKMLFile(file: File): Promise<RoutePoint[]> {
-  return new Promise((resolve, reject) => {
-    const reader = new FileReader();
-    reader.onload = (e) => {
-      try {
-        const content = e.target?.result as string;
-        const parser = new DOMParser();
-        const xmlDoc = parser.parseFromString(content, 'text/xml');
-        const points: RoutePoint[] = [];
-        const coordinatesElements = xmlDoc.getElementsByTagName('coordinates');
-        
-        for (let i = 0; i < coordinatesElements.length; i++) {
-          const element = coordinatesElements[i];
-          if (element && element.textContent) {
-            const coordText = element.textContent.trim();
-            if (coordText) {
-              const coordPairs = coordText.split(/\s+/);
-              coordPairs.forEach((pair, idx) => {
-                const parts = pair.split(',');
-                if (parts.length >= 2) {
-                  const lon = Number(parts[0]);
-                  const lat = Number(parts[1]);
-                  if (!isNaN(lon) && !isNaN(lat)) {
-                    const point: RoutePoint = {
-                      longitude: lon,
-                      latitude: lat,
-                      name: `点位${idx + 1}`,
-                    };
-                    if (parts.length >= 3) {
-                      const alt = Number(parts[2]);
-                      if (!isNaN(alt)) point.elevation = alt;
-                    }
-                    points.push(point);
-                  }
-                }
-              });
-            }
-          }
-        }
-        resolve(points);
-      } catch (error) {
-        reject(new Error('KML文件解析失败'));
-      }
-    };
-    reader.onerror = () => reject(new Error('文件读取失败'));
-    reader.readAsText(file);
-  });
+// ==================== 路线文件导入 ====================
+
+export interface RouteImportResult {
+  count: number;
+  data: { id: number; name: string; points_count: number; distance: number }[];
+  skipped_tracks: number;   // 少于 2 个有效点而跳过的轨迹数
+  dropped_points: number;   // 去掉的无效、重复点数
+}
+
+/**
+ * 上传 KML / KMZ / GPX 文件，由后端流式解析并批量导入（每条轨迹一条路线）
+ * name 为没有名称的轨迹使用的默认名称
+ */
+export async function importRouteFile(
+  file: File,
+  username: string,
+  name?: string
+): Promise<RouteImportResult | null> {
+  const format = file.name.split('.').pop()?.toLowerCase();
+  if (!format || !['kml', 'kmz', 'gpx'].includes(format)) {
+    console.error('导入路线失败: 不支持的文件格式', file.name);
+    return null;
+  }
+  try {
+    const params = new URLSearchParams({ username, format });
+    if (name) params.append('name', name);
+    const response = await fetch(`${API_BASE}/api/routes/import?${params.toString()}`, {
+      method: 'POST',
+      body: file,
+    });
+    const result = await response.json();
+
+    if (result.success) {
+      return result;
+    }
+    console.error('导入路线失败:', result.error ?? result.detail);
+    return null;
+  } catch (error) {
+    console.error('导入路线失败:', error);
+    return null;
+  }
 }
 
 export function exportRouteToKML(route: ShuDaoRoute | CustomRoute): string {